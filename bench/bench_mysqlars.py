@@ -0,0 +1,311 @@
+#########################################################################################################################
+#
+# Benchmark de PyMySqlArs: traduccion dict-SQL, modos de ejecucion y memoria de la select.
+#
+#   python bench/bench_mysqlars.py                          - Solo con la conexion falsa
+#   python bench/bench_mysqlars.py --login login.yaml       - Ademas contra un MySQL/MariaDB local
+#   python bench/bench_mysqlars.py --salida resultados.json - Resultados en JSON para comparar ejecuciones
+#
+# Con --login se usa la tabla ars_bench, que se borra y se crea de nuevo antes de cada prueba de insert.
+#
+#########################################################################################################################
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pymysql # Conexion sql
+from pymysql.constants import FIELD_TYPE
+
+from mysqlars import PyMySqlArs, stats_cache_sentencias
+
+
+ANCHOS = (1, 8, 32) # Columnas de las sentencias a compilar
+
+
+class CursorFalso:
+
+    '''Cursor sin servidor: acepta cualquier sentencia y genera rows al vuelo para la select.'''
+
+
+    def __init__(self, conn, cursorclass=None):
+
+        self.conn = conn
+        self.dict = cursorclass in [pymysql.cursors.DictCursor, pymysql.cursors.SSDictCursor]
+        self.rowcount = 0
+        self.description = None
+        self.filas = iter(())
+
+
+    def execute(self, query, args=None):
+
+        if args is not None:
+            query % self.conn.escape_args(args) # Mismo coste de escape en cliente que pymysql
+
+        if query.startswith("SELECT @@max_allowed_packet"):
+            self.filas = iter([(self.conn.max_packet,)])
+        elif query.startswith("SELECT"):
+            self.description = [(f"c{i}", FIELD_TYPE.LONGLONG if i == 0 else FIELD_TYPE.VAR_STRING)
+                                 for i in range(self.conn.columnas)]
+            self.filas = (self.fila(i) for i in range(self.conn.rows_select))
+        else:
+            self.rowcount = 1
+
+        return self.rowcount
+
+
+    def fila(self, i):
+
+        fila = tuple([i] + [f"valor {i} {c}" for c in range(1, self.conn.columnas)])
+
+        if self.dict:
+            return dict(zip((d[0] for d in self.description), fila))
+
+        return fila
+
+
+    def fetchone(self):
+
+        return next(self.filas, None)
+
+
+    def fetchmany(self, size=1):
+
+        return [f for _, f in zip(range(size), self.filas)]
+
+
+    def fetchall(self):
+
+        return list(self.filas)
+
+
+    def close(self):
+
+        self.filas = iter(())
+
+
+class ConexionFalsa:
+
+    '''Conexion sin servidor para medir el coste en cliente de PyMySqlArs.'''
+
+
+    def __init__(self, rows_select=0, columnas=4, max_packet=4194304):
+
+        self.rows_select = rows_select
+        self.columnas = columnas
+        self.max_packet = max_packet
+        self.encoding = 'utf8'
+        self.server_status = 0
+
+
+    def cursor(self, cursorclass=None):
+
+        return CursorFalso(self, cursorclass)
+
+
+    def escape(self, obj):
+
+        return pymysql.converters.escape_item(obj, self.encoding)
+
+
+    def escape_args(self, args):
+
+        return tuple(self.escape(a) for a in args)
+
+
+    def commit(self):
+
+        pass
+
+
+    def rollback(self):
+
+        pass
+
+
+    def begin(self):
+
+        pass
+
+
+def dict_ancho(tipo, ancho, i=0):
+
+    '''Dict de entrada de PyMySqlArs con ancho columnas, asignadas en insert y update o leidas en select.
+    delete solo usa el id.'''
+
+    columnas = {f"c{c}": f"valor {i} {c}" for c in range(1, ancho)}
+
+    if tipo == "insert":
+        return {'#table': 'ars_bench', 'id': i, **columnas}
+    elif tipo == "update":
+        return {'#table': 'ars_bench', **columnas, '#where': {'id': ['=', i]}}
+    elif tipo == "delete":
+        return {'#table': 'ars_bench', '#where': {'id': ['=', i]}}
+    else:
+        return {'#table': 'ars_bench', '#column': ', '.join(['id'] + list(columnas)),
+                '#where': {'id': ['=', i]}, '#reading_type': 'one'}
+
+
+def cronometrar(funcion, minimo=0.5):
+
+    '''Repetimos la funcion hasta superar minimo segundos.
+    Salida: Ejecuciones por segundo. FLOAT'''
+
+    veces = 0
+    inicio = time.perf_counter()
+
+    while True:
+        funcion()
+        veces += 1
+        transcurrido = time.perf_counter() - inicio
+
+        if transcurrido >= minimo:
+            return veces / transcurrido
+
+
+def bench_compilacion(minimo):
+
+    '''Sentencias por segundo traducidas con conn=False, por tipo y ancho. delete y select compilan el mismo
+    #where por id con cualquier ancho (el #column de select solo se copia al SQL), se miden una vez.'''
+
+    ars = PyMySqlArs()
+    salida = []
+
+    for tipo in ["insert", "update", "delete", "select"]:
+        metodo = getattr(ars, tipo)
+
+        for ancho in (ANCHOS if tipo in ["insert", "update"] else [None]):
+            datos = dict_ancho(tipo, ancho or ANCHOS[0])
+            por_segundo = cronometrar(lambda: metodo(datos, conn=False), minimo)
+            salida.append({'bench': 'compilacion', 'kind': tipo, 'width': ancho, 'ops_s': por_segundo})
+
+    salida.append({'bench': 'compilacion', 'cache': stats_cache_sentencias()})
+
+    return salida
+
+
+def bench_escritura(conn, rows, nombre, preparar=None):
+
+    '''Rows por segundo de listas de insert/update/delete, dict a dict y en los modos batch.
+    preparar: Funcion(tipo, rows) que deja la tabla lista antes de cada modo. CALLABLE'''
+
+    ars = PyMySqlArs()
+    salida = []
+    modos = [("insert", {}), ("insert", {'batch': True}),
+             ("update", {}), ("update", {'batch': 'join'}),
+             ("delete", {}), ("delete", {'batch': True})]
+
+    for tipo, opciones in modos:
+        datos = [dict_ancho(tipo, 8, i) for i in range(rows)]
+
+        if preparar is not None:
+            preparar(tipo, rows)
+
+        inicio = time.perf_counter()
+        getattr(ars, tipo)(datos, conn=conn, **opciones)
+        transcurrido = time.perf_counter() - inicio
+
+        salida.append({'bench': 'escritura', 'target': nombre, 'kind': tipo, 'options': opciones,
+                       'rows': rows, 'rows_s': rows / transcurrido})
+
+    return salida
+
+
+def bench_memoria(conn, rows, nombre):
+
+    '''Pico de memoria de la select por #reading_type.'''
+
+    ars = PyMySqlArs()
+    salida = []
+    lecturas = [{'#reading_type': 'all'}, {'#reading_type': 'all', '#dict': ''},
+                {'#reading_type': rows // 10}, {'#reading_type': 'stream', '#chunk': 1000},
+                {'#reading_type': 'all', '#format': 'columnar'}]
+
+    for lectura in lecturas:
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        records = ars.select({'#table': 'ars_bench', **lectura}, conn=conn)
+
+        if lectura['#reading_type'] == 'stream':
+            leidas = sum(len(trozo) for trozo in records)
+        else:
+            leidas = len(records)
+
+        transcurrido = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del records
+
+        salida.append({'bench': 'memoria', 'target': nombre, 'reading': lectura, 'rows': leidas,
+                       'peak_bytes': pico, 'seconds': transcurrido})
+
+    return salida
+
+
+def preparar_tabla(conn, tabla):
+
+    '''Recreamos la tabla del benchmark y devolvemos la funcion que la prepara antes de cada prueba:
+    vacia antes de cada insert y con las rows sembradas de nuevo antes de cada delete, que la vacia.'''
+
+    columnas = ', '.join(f"c{c} VARCHAR(64)" for c in range(1, 8))
+
+    def preparar(tipo, rows):
+        cursor = conn.cursor()
+
+        if tipo in ["insert", "delete"]:
+            cursor.execute(f"DROP TABLE IF EXISTS {tabla}")
+            cursor.execute(f"CREATE TABLE {tabla} (id INT PRIMARY KEY, {columnas})")
+
+        conn.commit()
+        cursor.close()
+
+        if tipo == "delete":
+            PyMySqlArs().insert([dict_ancho("insert", 8, i) for i in range(rows)], conn=conn, batch=True)
+
+    return preparar
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark de PyMySqlArs")
+    parser.add_argument("--login", help="Login YAML/JSON de un MySQL/MariaDB local")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows de las pruebas de escritura")
+    parser.add_argument("--rows-select", type=int, default=200000, help="Rows de las pruebas de memoria")
+    parser.add_argument("--minimo", type=float, default=0.5, help="Segundos minimos por medicion")
+    parser.add_argument("--salida", help="Fichero JSON de resultados, por defecto stdout")
+    args = parser.parse_args()
+
+    resultados = bench_compilacion(args.minimo)
+    resultados += bench_escritura(ConexionFalsa(), args.rows, "falsa")
+    resultados += bench_memoria(ConexionFalsa(rows_select=args.rows_select, columnas=8), args.rows_select, "falsa")
+
+    if args.login:
+        ars = PyMySqlArs()
+        conn = ars.conexion(args.login)
+        resultados += bench_escritura(conn, args.rows, "mysql", preparar_tabla(conn, "ars_bench"))
+        ars.insert([dict_ancho("insert", 8, i) for i in range(args.rows_select)], conn=conn, batch=True)
+        resultados += bench_memoria(conn, args.rows_select, "mysql")
+        conn.close()
+
+    informe = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(),
+               'pymysql': pymysql.__version__,
+               'results': resultados}
+
+    texto = json.dumps(informe, indent=2, default=str)
+
+    if args.salida:
+        Path(args.salida).write_text(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -40,7 +40,7 @@ def leer_yaml(origen):
     
     try:
         with open(Path(origen)) as f:
-            salida = yaml.safe_load(f, Loader=yaml.FullLoader)
+            salida = yaml.safe_load(f)
             
     except (ValueError, AttributeError, TypeError, OSError):
         logger.exception('leer_yaml')
@@ -0,0 +1,245 @@
+#
+# Caches LRU acotadas y seguras entre hilos: sentencias compiladas y resultados de select
+#
+
+from collections import OrderedDict
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheLRU:
+
+    '''Cache LRU con numero maximo de entradas y contadores de aciertos, fallos y expulsiones.'''
+
+
+    def __init__(self, max_size=512):
+
+        self.max_size = max_size
+        self.datos = OrderedDict()
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+
+    def get(self, clave, defecto=None):
+
+        '''Recuperamos un valor y lo marcamos como usado recientemente.
+        clave: Clave de la entrada. HASHABLE
+        Salida: Valor guardado o defecto si no existe. OBJ'''
+
+        with self.lock:
+            try:
+                valor = self.datos[clave]
+
+            except KeyError:
+                self.fallos += 1
+                return defecto
+
+            self.datos.move_to_end(clave)
+            self.aciertos += 1
+
+            return valor
+
+
+    def set(self, clave, valor):
+
+        '''Guardamos un valor expulsando los menos usados si se supera max_size.
+        clave: Clave de la entrada. HASHABLE
+        valor: Valor a guardar. OBJ'''
+
+        with self.lock:
+            self.datos[clave] = valor
+            self.datos.move_to_end(clave)
+
+            while len(self.datos) > self.max_size:
+                self.datos.popitem(last=False)
+                self.expulsiones += 1
+
+
+    def limpiar(self):
+
+        '''Vaciamos la cache y sus contadores.'''
+
+        with self.lock:
+            self.datos.clear()
+            self.aciertos = 0
+            self.fallos = 0
+            self.expulsiones = 0
+
+
+    def stats(self):
+
+        '''Salida: Contadores de la cache. DICT'''
+
+        with self.lock:
+            return {'hits': self.aciertos,
+                    'misses': self.fallos,
+                    'evictions': self.expulsiones,
+                    'size': len(self.datos),
+                    'max_size': self.max_size}
+
+
+def copiar(valor):
+
+    '''Copia de un resultado de select: los dicts y listas se copian, las tuplas ya son inmutables.
+    valor: row o lista/tupla de rows. OBJ
+    Salida: Copia que se puede modificar sin alterar la guardada. OBJ'''
+
+    if type(valor) is dict:
+        return dict(valor)
+    elif type(valor) is list:
+        return [copiar(v) for v in valor]
+    elif type(valor) is tuple and valor and type(valor[0]) is dict:
+        return tuple(dict(v) for v in valor)
+
+    return valor
+
+
+class CacheResultados:
+
+    '''Cache de resultados de select acotada por memoria, con TTL por tabla e invalidacion por tabla.
+    Se puede compartir entre instancias de PyMySqlArs: PyMySqlArs(cache=CacheResultados(...))'''
+
+
+    def __init__(self, max_bytes=67108864, ttl=60, ttl_tablas=None):
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl # Segundos por defecto, 0 para no guardar
+        self.ttl_tablas = dict(ttl_tablas or {}) # tabla -> segundos
+        self.datos = OrderedDict() # clave -> (tablas, expira, peso, valor)
+        self.por_tabla = {} # tabla -> claves que la leen
+        self.generaciones = {} # tabla -> invalidaciones, descarta resultados leidos antes de una escritura
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidaciones = 0
+
+
+    def generacion(self, tablas):
+
+        '''Salida: Generacion actual de las tablas, se pasa a set al guardar el resultado. TUPLE'''
+
+        with self.lock:
+            return tuple(self.generaciones.get(t, 0) for t in tablas)
+
+
+    def get(self, clave, defecto=None):
+
+        '''Recuperamos una copia del resultado si no ha caducado.
+        clave: Clave de la select. HASHABLE
+        Salida: Copia del resultado o defecto si no existe o ha caducado. OBJ'''
+
+        with self.lock:
+            entrada = self.datos.get(clave)
+
+            if entrada is None or entrada[1] <= time.monotonic():
+                if entrada is not None:
+                    self.quitar(clave)
+
+                self.fallos += 1
+                return defecto
+
+            self.datos.move_to_end(clave)
+            self.aciertos += 1
+            valor = entrada[3]
+
+        return copiar(valor)
+
+
+    def set(self, clave, tablas, valor, peso, generacion=None):
+
+        '''Guardamos una copia del resultado expulsando los menos usados si se supera max_bytes.
+        clave: Clave de la select. HASHABLE
+        tablas: Tablas que lee la select. TUPLE
+        valor: Resultado de la select. OBJ
+        peso: Bytes estimados del resultado. INT
+        generacion: Generacion de las tablas antes de ejecutar la select. TUPLE'''
+
+        ttl = min((self.ttl_tablas.get(t, self.ttl) for t in tablas), default=self.ttl)
+
+        if ttl <= 0 or peso > self.max_bytes:
+            return
+
+        valor = copiar(valor)
+
+        with self.lock:
+            if generacion is not None and generacion != tuple(self.generaciones.get(t, 0) for t in tablas):
+                return # Una escritura invalido las tablas mientras se leia
+
+            if clave in self.datos:
+                self.quitar(clave)
+
+            self.datos[clave] = (tablas, time.monotonic() + ttl, peso, valor)
+            self.bytes += peso
+
+            for tabla in tablas:
+                self.por_tabla.setdefault(tabla, set()).add(clave)
+
+            while self.bytes > self.max_bytes:
+                self.quitar(next(iter(self.datos)))
+                self.expulsiones += 1
+
+
+    def quitar(self, clave):
+
+        '''Quitamos una entrada, con el lock ya tomado.'''
+
+        tablas, _, peso, _ = self.datos.pop(clave)
+        self.bytes -= peso
+
+        for tabla in tablas:
+            claves = self.por_tabla.get(tabla)
+
+            if claves is not None:
+                claves.discard(clave)
+
+                if not claves:
+                    del self.por_tabla[tabla]
+
+
+    def invalidar(self, tabla):
+
+        '''Quitamos los resultados de las selects que leen la tabla.
+        tabla: Nombre de la tabla escrita. STR'''
+
+        with self.lock:
+            self.generaciones[tabla] = self.generaciones.get(tabla, 0) + 1
+
+            for clave in list(self.por_tabla.get(tabla, ())):
+                self.quitar(clave)
+                self.invalidaciones += 1
+
+
+    def limpiar(self):
+
+        '''Vaciamos la cache y sus contadores.'''
+
+        with self.lock:
+            self.datos.clear()
+            self.por_tabla.clear()
+            self.bytes = 0
+            self.aciertos = 0
+            self.fallos = 0
+            self.expulsiones = 0
+            self.invalidaciones = 0
+
+
+    def stats(self):
+
+        '''Salida: Contadores de la cache. DICT'''
+
+        with self.lock:
+            return {'hits': self.aciertos,
+                    'misses': self.fallos,
+                    'evictions': self.expulsiones,
+                    'invalidations': self.invalidaciones,
+                    'size': len(self.datos),
+                    'bytes': self.bytes,
+                    'max_bytes': self.max_bytes}
@@ -0,0 +1,202 @@
+#
+# Resultado de select en columnas: una cabecera y un array tipado o lista por columna
+#
+
+from array import array
+import logging
+import math
+
+from pymysql.constants import FIELD_TYPE
+
+try:
+    import numpy # Opcional, solo para ResultadoColumnar.numpy
+except ImportError:
+    numpy = None
+
+
+logger = logging.getLogger(__name__)
+
+TIPOS_ARRAY = {FIELD_TYPE.TINY: 'q', FIELD_TYPE.SHORT: 'q', FIELD_TYPE.LONG: 'q', FIELD_TYPE.INT24: 'q',
+               FIELD_TYPE.LONGLONG: 'q', FIELD_TYPE.YEAR: 'q',
+               FIELD_TYPE.FLOAT: 'd', FIELD_TYPE.DOUBLE: 'd'} # Tipo MySQL -> typecode de array
+
+
+class ResultadoColumnar:
+
+    '''Rows de una select guardadas por columnas. Las numericas en array (8 bytes por valor), el resto en
+    listas. Una columna numerica con NULL o fuera de rango pasa a lista.
+    Acceso por row como una lista de rows: len(r), r[i], for fila in r; por columna: r.columna('id').'''
+
+
+    def __init__(self, description, format_dict=False):
+
+        self.columnas = [d[0] for d in description]
+        self.format_dict = format_dict # Las rows se ven como dicts en lugar de tuplas
+        self.datos = [array(TIPOS_ARRAY[d[1]]) if d[1] in TIPOS_ARRAY else [] for d in description]
+        self.filas = 0
+
+
+    def anadir(self, filas):
+
+        '''Anadimos un trozo de rows leidas del cursor.
+        filas: rows en tupla. LIST o TUPLE'''
+
+        if not filas:
+            return
+
+        for posicion, valores in enumerate(zip(*filas)):
+            datos = self.datos[posicion]
+
+            if type(datos) is array:
+                try:
+                    datos.extend(valores)
+
+                except (TypeError, OverflowError): # NULL o valor no representable, la columna pasa a lista
+                    del datos[self.filas:]
+                    datos = self.datos[posicion] = datos.tolist()
+                    datos.extend(valores)
+
+            else:
+                datos.extend(valores)
+
+        self.filas += len(filas)
+
+
+    def columna(self, nombre):
+
+        '''Salida: Valores de una columna. ARRAY o LIST'''
+
+        return self.datos[self.columnas.index(nombre)]
+
+
+    def numpy(self, nombre):
+
+        '''Columna como array de NumPy, sin copia para las columnas en array.
+        Salida: Valores de la columna. numpy.ndarray'''
+
+        if numpy is None:
+            raise ImportError("ResultadoColumnar.numpy: numpy no instalado")
+
+        datos = self.columna(nombre)
+
+        if type(datos) is array:
+            return numpy.frombuffer(datos, dtype='int64' if datos.typecode == 'q' else 'float64')
+
+        return numpy.array(datos, dtype=object)
+
+
+    def fila(self, i):
+
+        '''Salida: Row i en tupla, o dict con format_dict. TUPLE o DICT'''
+
+        fila = tuple(datos[i] for datos in self.datos)
+
+        if self.format_dict:
+            return dict(zip(self.columnas, fila))
+
+        return fila
+
+
+    def __len__(self):
+
+        return self.filas
+
+
+    def __getitem__(self, i):
+
+        if type(i) is slice:
+            return [self.fila(j) for j in range(*i.indices(self.filas))]
+
+        if i < 0:
+            i += self.filas
+
+        if not 0 <= i < self.filas:
+            raise IndexError("ResultadoColumnar: row fuera de rango")
+
+        return self.fila(i)
+
+
+    def __iter__(self):
+
+        for i in range(self.filas):
+            yield self.fila(i)
+
+
+    def __bool__(self):
+
+        return self.filas > 0
+
+
+    @property
+    def nbytes(self):
+
+        '''Bytes estimados de los datos: los de los arrays y 8 por referencia en las listas, mas
+        la longitud de textos y binarios. INT'''
+
+        total = 0
+
+        for datos in self.datos:
+            if type(datos) is array:
+                total += datos.itemsize * len(datos)
+            else:
+                total += sum(len(v) + 8 if type(v) in [str, bytes] else 8 for v in datos)
+
+        return total
+
+
+def literales(valores, escapar, nulos=None):
+
+    '''Literales SQL de una columna, en bloque con numpy para arrays numericos, booleanos y de fechas.
+    valores: Valores de la columna. LIST, TUPLE, array o numpy.ndarray (tambien numpy.ma con mascara)
+    escapar: Escape de un valor de la conexion, para textos y el resto de tipos. CALLABLE
+    nulos: True donde el valor es NULL, ademas de None, NaN y NaT. LIST[BOOL] o numpy.ndarray
+    Salida: Literal de cada valor. LIST[STR]'''
+
+    if numpy is not None:
+        if type(valores) is array:
+            valores = numpy.asarray(valores)
+
+        if isinstance(valores, numpy.ma.MaskedArray):
+            mascara = numpy.ma.getmaskarray(valores)
+            nulos = mascara if nulos is None else mascara | numpy.asarray(nulos, dtype=bool)
+            valores = valores.data
+
+        if isinstance(valores, numpy.ndarray):
+            textos, invalidos = None, None
+            tipo = valores.dtype.kind
+
+            if tipo == 'b':
+                textos = valores.astype('u1').astype(str)
+            elif tipo in 'iu':
+                textos = valores.astype(str)
+            elif tipo == 'f':
+                textos = valores.astype(str)
+                invalidos = ~numpy.isfinite(valores)
+            elif tipo == 'M':
+                if numpy.datetime_data(valores.dtype)[0] in ['ns', 'ps', 'fs', 'as']:
+                    valores = valores.astype('datetime64[us]') # MySQL admite hasta microsegundos
+                textos = numpy.char.add(numpy.char.add("'", numpy.datetime_as_string(valores)), "'")
+                invalidos = numpy.isnat(valores)
+
+            if textos is not None:
+                if invalidos is not None:
+                    nulos = invalidos if nulos is None else invalidos | numpy.asarray(nulos, dtype=bool)
+
+                if nulos is not None:
+                    textos = numpy.where(numpy.asarray(nulos, dtype=bool), 'NULL', textos)
+
+                return textos.tolist()
+
+            valores = valores.tolist() # Textos, objetos...
+
+    tipos = set(map(type, valores))
+
+    if tipos <= {int}:
+        textos = list(map(str, valores))
+    else: # NaN e inf no tienen literal SQL, NULL como en los arrays de numpy
+        textos = ['NULL' if isinstance(v, float) and not math.isfinite(v) else escapar(v) for v in valores]
+
+    if nulos is not None:
+        textos = ['NULL' if nulo else texto for texto, nulo in zip(textos, nulos)]
+
+    return textos
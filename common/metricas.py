@@ -0,0 +1,121 @@
+#
+# Metricas por sentencia: huella del SQL e histogramas de latencia
+#
+
+import threading
+import logging
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+LIMITES = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, float('inf')) # Segundos
+
+
+def huella(SQL):
+
+    '''Huella de una sentencia compilada, los valores van aparte (%s) por lo que identifica su forma.
+    SQL: Sentencia en formato SQL. STR
+    Salida: Huella en hexadecimal. STR'''
+
+    return format(zlib.crc32(SQL.encode('utf8', 'surrogateescape')), '08x')
+
+
+def bytes_registros(records):
+
+    '''Estimacion de los bytes recuperados: longitud de textos y binarios, 8 por cualquier otro valor.
+    records: Registros recuperados, una row o lista de rows en tupla o dict. LIST o TUPLE o DICT
+    Salida: Bytes estimados. INT'''
+
+    if not records:
+        return 0
+
+    if hasattr(records, 'nbytes'): # ResultadoColumnar
+        return records.nbytes
+
+    if type(records) is dict or type(records[0]) not in [tuple, list, dict]:
+        records = [records]
+
+    total = 0
+
+    for fila in records:
+        for v in (fila.values() if type(fila) is dict else fila):
+            total += len(v) if type(v) in [str, bytes, bytearray] else 8
+
+    return total
+
+
+class HistogramaLatencias:
+
+    '''Hook de PyMySqlArs con histogramas de latencia de servidor por huella de sentencia.
+    ars.registrar_hook(HistogramaLatencias())'''
+
+
+    def __init__(self, limites=LIMITES):
+
+        self.limites = limites
+        self.datos = {} # huella -> {'sql', 'count', 'sum', 'max', 'buckets'}
+        self.lock = threading.Lock()
+
+
+    def __call__(self, evento):
+
+        segundos = evento['server_time']
+        posicion = next(i for i, limite in enumerate(self.limites) if segundos <= limite)
+
+        with self.lock:
+            datos = self.datos.get(evento['fingerprint'])
+
+            if datos is None:
+                datos = {'sql': evento['sql'], 'kind': evento['kind'], 'count': 0, 'sum': 0.0,
+                         'max': 0.0, 'buckets': [0] * len(self.limites)}
+                self.datos[evento['fingerprint']] = datos
+
+            datos['count'] += 1
+            datos['sum'] += segundos
+            datos['max'] = max(datos['max'], segundos)
+            datos['buckets'][posicion] += 1
+
+
+    def percentil(self, buckets, total, p):
+
+        '''Limite superior del bucket que contiene el percentil p. FLOAT'''
+
+        acumulado = 0
+
+        for limite, cuenta in zip(self.limites, buckets):
+            acumulado += cuenta
+
+            if acumulado >= total * p:
+                return limite
+
+        return self.limites[-1]
+
+
+    def informe(self):
+
+        '''Salida: Por huella, sql, numero, media, maximo y percentiles 50/95/99 en segundos. DICT'''
+
+        with self.lock:
+            salida = {}
+
+            for clave, datos in self.datos.items():
+                salida[clave] = {'sql': datos['sql'],
+                                 'kind': datos['kind'],
+                                 'count': datos['count'],
+                                 'mean': datos['sum'] / datos['count'],
+                                 'max': datos['max'],
+                                 'p50': self.percentil(datos['buckets'], datos['count'], 0.50),
+                                 'p95': self.percentil(datos['buckets'], datos['count'], 0.95),
+                                 'p99': self.percentil(datos['buckets'], datos['count'], 0.99),
+                                 'buckets': dict(zip(self.limites, datos['buckets']))}
+
+            return salida
+
+
+    def limpiar(self):
+
+        '''Vaciamos los histogramas.'''
+
+        with self.lock:
+            self.datos.clear()
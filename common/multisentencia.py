@@ -0,0 +1,135 @@
+#
+# Multi-sentencia: varias sentencias separadas por ';' en un unico COM_QUERY (un viaje al servidor)
+#
+#   El servidor las ejecuta en orden y se detiene en la primera que falla; cada una devuelve su resultado,
+#   que pymysql lee con nextset(). La conexion necesita MULTI_STATEMENTS, se activa con COM_SET_OPTION
+#   solo durante el envio y se desactiva al terminar: la conexion vuelve al pool sin admitir sentencias
+#   encadenadas, que convertirian cualquier texto sin escapar (#table, #column, #where en SQL) en una
+#   inyeccion de sentencias para quien la use despues.
+#
+
+import logging
+import struct
+
+import pymysql
+from pymysql.constants import CLIENT, COMMAND
+
+
+logger = logging.getLogger(__name__)
+
+MULTI_ON = 0 # MYSQL_OPTION_MULTI_STATEMENTS_ON de COM_SET_OPTION
+MULTI_OFF = 1 # MYSQL_OPTION_MULTI_STATEMENTS_OFF
+
+
+def opcion(conn, valor):
+
+    '''Enviamos COM_SET_OPTION y leemos su respuesta, EOF o error si el servidor la rechaza.'''
+
+    conn._execute_command(COMMAND.COM_SET_OPTION, struct.pack('<H', valor))
+    conn._read_packet()
+
+
+def activar(conn):
+
+    '''Activamos MULTI_STATEMENTS en la conexion si no lo tiene desde el login.
+    conn: Conexion pymysql, otras conexiones (p.ej. falsas) se dejan como estan. OBJ
+    Salida: True si se ha activado y hay que desactivarlo con desactivar() al terminar. BOOL'''
+
+    if not isinstance(conn, pymysql.connections.Connection) or conn.client_flag & CLIENT.MULTI_STATEMENTS:
+        return False
+
+    opcion(conn, MULTI_ON)
+
+    return True
+
+
+def desactivar(conn):
+
+    '''Desactivamos MULTI_STATEMENTS tras el envio. Si no se puede la conexion se cierra, para que
+    no vuelva a usarse con las sentencias encadenadas activas.'''
+
+    try:
+        opcion(conn, MULTI_OFF)
+
+    except (pymysql.Error, OSError):
+        logger.exception('multisentencia: desactivar MULTI_STATEMENTS, se cierra la conexion')
+
+        try:
+            conn.close()
+        except (pymysql.Error, OSError):
+            pass
+
+
+def literal(conn, SQL, valores):
+
+    '''Sentencia con sus valores escapados por la conexion, como hace pymysql al ejecutarla.
+    SQL: Sentencia con %s. STR
+    valores: Valores a enlazar o None. LIST o NONE
+    Salida: Sentencia sin ';' final. STR'''
+
+    if valores:
+        SQL = SQL % tuple(conn.escape(v) for v in valores)
+
+    return SQL.rstrip().rstrip(';')
+
+
+def viajes(textos, limite):
+
+    '''Agrupamos las sentencias en textos multi-sentencia que no superen limite bytes.
+    textos: Sentencias ya con sus valores. LIST[STR]
+    limite: Bytes maximos de cada texto. INT
+    Salida: Generador de (posicion de la primera sentencia, [sentencias]). TUPLE'''
+
+    grupo = []
+    inicio = 0
+    tamano = 0
+
+    for posicion, texto in enumerate(textos):
+        tamano_texto = len(texto.encode('utf8', 'surrogateescape')) + 2 # ';\n'
+
+        if grupo and tamano + tamano_texto > limite:
+            yield inicio, grupo
+            grupo = []
+            inicio = posicion
+            tamano = 0
+
+        grupo.append(texto)
+        tamano += tamano_texto
+
+    if grupo:
+        yield inicio, grupo
+
+
+def ejecutar(conn, sentencias):
+
+    '''Enviamos las sentencias en un unico viaje y leemos el resultado de cada una.
+    conn: Conexion con MULTI_STATEMENTS. OBJ
+    sentencias: Sentencias ya con sus valores. LIST[STR]
+    Salida: (rows afectadas de las ejecutadas en orden, error de la siguiente o None). TUPLE'''
+
+    rows = []
+    c_multi = conn.cursor()
+
+    try:
+        c_multi.execute(';\n'.join(sentencias))
+        rows.append(c_multi.rowcount)
+
+        while len(rows) < len(sentencias) and c_multi.nextset():
+            rows.append(c_multi.rowcount)
+
+    except pymysql.err.InterfaceError:
+        raise
+
+    except pymysql.err.OperationalError as e:
+        if e.args and e.args[0] >= 2000: # Errores de cliente (conexion perdida...), no de la sentencia
+            raise
+
+        return rows, e
+
+    except pymysql.err.MySQLError as e:
+        return rows, e
+
+    finally:
+        c_multi.close()
+
+    return rows, None
@@ -0,0 +1,303 @@
+#
+# Perfilador de sentencias lentas: hook de metricas que captura las que superan un umbral y las explica
+# con EXPLAIN FORMAT=JSON en una conexion aparte, agrupadas por huella
+#
+
+from collections import Counter
+import concurrent.futures
+import contextlib
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import traceback
+
+import pymysql
+
+
+logger = logging.getLogger(__name__)
+
+TIPOS_EXPLAIN = ('SELECT', 'UPDATE', 'DELETE') # Sentencias que se explican, por su primera palabra
+MAX_ORIGENES = 5 # Lugares de llamada que se guardan por huella
+PAQUETE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROPIOS = (os.path.join(PAQUETE, 'common') + os.sep,) + tuple(
+    os.path.join(PAQUETE, f"{m}.py") for m in ['mysqlars', 'mysqlars_async', 'mysqlars_shards', 'mysqlars_export'])
+INTERMEDIOS = (os.path.dirname(os.path.abspath(concurrent.futures.__file__)) + os.sep, # Hilos de select en paralelo
+               os.path.abspath(threading.__file__),
+               os.path.abspath(contextlib.__file__)) # Bloques transaction()
+INSTALADOS = ('site-packages', 'dist-packages')
+
+
+def propio(ruta):
+
+    '''Salida: True si el fichero es de PyMySqlArs o de uno de los modulos de la libreria estandar por los
+    que pasa la llamada. El resto, tambien lo instalado en site-packages/dist-packages, es de quien llama. BOOL'''
+
+    ruta = os.path.abspath(ruta)
+
+    if ruta.startswith(PROPIOS):
+        return True
+
+    return ruta.startswith(INTERMEDIOS) and not any(p in INSTALADOS for p in ruta.split(os.sep))
+
+
+def origen_llamada():
+
+    '''Frame mas interno de la pila fuera de mysqlars, common y los modulos de hilos y contextos de la
+    libreria estandar: quien llamo a PyMySqlArs.
+    Salida: "fichero:linea en funcion". STR'''
+
+    for frame in reversed(traceback.extract_stack()):
+        if not propio(frame.filename):
+            return f"{frame.filename}:{frame.lineno} en {frame.name}"
+
+    return "desconocido"
+
+
+def explicable(explain):
+
+    '''Salida: True si el explain del evento es una select/update/delete completa que admite EXPLAIN. BOOL'''
+
+    if not explain or type(explain[0]) is not str:
+        return False
+
+    return explain[0].lstrip()[:6].upper() in TIPOS_EXPLAIN
+
+
+def avisos_plan(plan):
+
+    '''Recorremos el plan JSON (MySQL o MariaDB) buscando accesos completos, filesorts y tablas temporales.
+    plan: EXPLAIN FORMAT=JSON decodificado. DICT
+    Salida: Avisos del plan, p.ej. ['full_scan:clientes', 'filesort']. LIST[STR]'''
+
+    avisos = []
+
+    def recorrer(nodo):
+        if type(nodo) is dict:
+            tipo = nodo.get('access_type')
+
+            if tipo == "ALL":
+                avisos.append(f"full_scan:{nodo.get('table_name')}")
+            elif tipo == "index":
+                avisos.append(f"full_index_scan:{nodo.get('table_name')}")
+
+            if nodo.get('using_filesort') or 'filesort' in nodo:
+                avisos.append("filesort")
+
+            if nodo.get('using_temporary_table') or 'temporary_table' in nodo:
+                avisos.append("temporary_table")
+
+            for valor in nodo.values():
+                recorrer(valor)
+
+        elif type(nodo) is list:
+            for valor in nodo:
+                recorrer(valor)
+
+    recorrer(plan)
+
+    return list(dict.fromkeys(avisos))
+
+
+class PerfiladorLento:
+
+    '''Hook de PyMySqlArs con las sentencias que superan umbral segundos en servidor. Una muestra de las
+    select/update/delete se explica en segundo plano con su propia conexion, sobre la sentencia ejecutada
+    (evento['explain']); DDL, LOAD y multi-sentencia solo se miden.
+    ars.registrar_hook(PerfiladorLento(login, umbral=0.2)) o ars.perfilar(login, umbral=0.2)'''
+
+
+    def __init__(self, login, umbral=0.5, muestreo=1.0, max_explain=3, fichero=None):
+
+        self.login = login # Conexion de los EXPLAIN, DICT o STR/PATH de un fichero YAML o JSON
+        self.umbral = umbral
+        self.muestreo = muestreo # Fraccion de sentencias lentas que se explican
+        self.max_explain = max_explain # EXPLAIN por huella como maximo
+        self.fichero = fichero
+        self.datos = {} # huella -> datos agregados
+        self.lock = threading.Lock()
+        self.cola = queue.Queue(maxsize=100)
+        self.descartadas = 0 # EXPLAIN no encolados por cola llena
+        self.conn = None
+        self.hilo = None
+
+        if fichero is not None:
+            atexit.register(self.volcar)
+
+
+    def __call__(self, evento):
+
+        segundos = evento['server_time']
+
+        if segundos is None or segundos < self.umbral:
+            return
+
+        origen = origen_llamada()
+        explicar = False
+
+        with self.lock:
+            datos = self.datos.get(evento['fingerprint'])
+
+            if datos is None:
+                datos = {'sql': evento['sql'], 'kind': evento['kind'], 'table': evento['table'], 'count': 0,
+                         'sum': 0.0, 'max': 0.0, 'origins': Counter(), 'explains': 0, 'plan': None,
+                         'flags': [], 'error': None}
+                self.datos[evento['fingerprint']] = datos
+
+            datos['count'] += 1
+            datos['sum'] += segundos
+            datos['max'] = max(datos['max'], segundos)
+            datos['origins'][origen] += 1
+
+            if (explicable(evento.get('explain')) and datos['explains'] < self.max_explain
+                    and random.random() < self.muestreo):
+                datos['explains'] += 1
+                explicar = True
+
+        if explicar:
+            self.encolar(evento)
+
+
+    def encolar(self, evento):
+
+        '''Pasamos la sentencia al hilo de EXPLAIN, sin bloquear a quien la ejecuto.'''
+
+        if self.hilo is None:
+            with self.lock:
+                if self.hilo is None:
+                    self.hilo = threading.Thread(target=self.explicar, name="perfilador", daemon=True)
+                    self.hilo.start()
+
+        try:
+            self.cola.put_nowait((evento['fingerprint'], *evento['explain'])) # Sentencia ejecutada, no la huella
+
+        except queue.Full:
+            with self.lock:
+                self.descartadas += 1
+                self.datos[evento['fingerprint']]['explains'] -= 1
+
+
+    def explicar(self):
+
+        '''Hilo de EXPLAIN: toma las sentencias de la cola y guarda su plan y avisos. None en la cola lo para.'''
+
+        while True:
+            tarea = self.cola.get()
+
+            try:
+                if tarea is None:
+                    return
+
+                huella, SQL, valores = tarea
+                plan, error = None, None
+
+                try:
+                    plan = self.plan(SQL, valores)
+
+                except (pymysql.Error, OSError, ValueError, TypeError) as e:
+                    logger.warning('perfilador: EXPLAIN de %s: %s', huella, e)
+                    error = str(e)
+
+                with self.lock:
+                    datos = self.datos[huella]
+                    datos['error'] = error
+
+                    if plan is not None:
+                        datos['plan'] = plan
+                        datos['flags'] = avisos_plan(plan)
+
+            finally:
+                self.cola.task_done()
+
+
+    def plan(self, SQL, valores):
+
+        '''EXPLAIN FORMAT=JSON de la sentencia en la conexion del perfilador.
+        Salida: Plan decodificado. DICT'''
+
+        if self.conn is None:
+            from mysqlars import PyMySqlArs # Aqui para no importar mysqlars desde common al cargarlo
+
+            self.conn = PyMySqlArs().conexion(self.login)
+
+            if self.conn in [False, None]:
+                self.conn = None
+                raise ValueError("sin conexion para EXPLAIN")
+
+        try:
+            c_explain = self.conn.cursor()
+            c_explain.execute("EXPLAIN FORMAT=JSON " + SQL, valores or None)
+            fila = c_explain.fetchone()
+            c_explain.close()
+            self.conn.commit()
+
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError, OSError):
+            self.conn = None # Conexion caida, se abre otra en el siguiente EXPLAIN
+            raise
+
+        return json.loads(fila[0])
+
+
+    def esperar(self):
+
+        '''Esperamos a que se hayan hecho los EXPLAIN encolados.'''
+
+        self.cola.join()
+
+
+    def informe(self):
+
+        '''Salida: Por huella, sql, tipo, tabla, numero, media y maximo en segundos, lugares de llamada,
+        plan y avisos (full_scan, full_index_scan, filesort, temporary_table), de mas a menos tiempo total. DICT'''
+
+        with self.lock:
+            ordenadas = sorted(self.datos.items(), key=lambda d: d[1]['sum'], reverse=True)
+
+            return {clave: {'sql': datos['sql'],
+                            'kind': datos['kind'],
+                            'table': datos['table'],
+                            'count': datos['count'],
+                            'mean': datos['sum'] / datos['count'],
+                            'max': datos['max'],
+                            'origins': dict(datos['origins'].most_common(MAX_ORIGENES)),
+                            'flags': list(datos['flags']),
+                            'plan': datos['plan'],
+                            'error': datos['error']}
+                    for clave, datos in ordenadas}
+
+
+    def volcar(self, fichero=None):
+
+        '''Escribimos el informe en JSON.
+        fichero: Ruta del fichero, por defecto la del constructor. STR/PATH'''
+
+        fichero = fichero or self.fichero
+
+        with open(fichero, 'w', encoding='utf8') as f:
+            json.dump(self.informe(), f, indent=2, default=str)
+
+
+    def limpiar(self):
+
+        '''Vaciamos lo capturado.'''
+
+        with self.lock:
+            self.datos.clear()
+            self.descartadas = 0
+
+
+    def cerrar(self):
+
+        '''Paramos el hilo de EXPLAIN y cerramos su conexion.'''
+
+        if self.hilo is not None:
+            self.cola.put(None)
+            self.hilo.join()
+            self.hilo = None
+
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,249 @@
+#
+# Pool de conexiones sql compartido entre hilos, uno por configuracion de login
+#
+
+from collections import deque
+import threading
+import logging
+import time
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+
+logger = logging.getLogger(__name__)
+
+pools = {} # Pools abiertos por clave de login
+pools_lock = threading.Lock()
+
+
+def clave_login(data):
+
+    '''Clave del pool a partir de los datos de login.
+    data: Informacion del login. DICT
+    Salida: Clave hashable del login. TUPLE'''
+
+    return tuple(sorted((str(k), str(v)) for k, v in data.items()))
+
+
+def obtener_pool(data, conectar, min_size=1, max_size=10, idle_timeout=300, ping_idle=30):
+
+    '''Recuperamos el pool del login o lo creamos si no existe.
+    data: Informacion del login. DICT
+    conectar: Funcion que abre una conexion nueva a partir de data. CALLABLE
+    min_size/max_size: Conexiones minimas que se mantienen y maximas abiertas. INT
+    idle_timeout: Segundos libre tras los que se cierra una conexion por encima de min_size. INT
+    ping_idle: Segundos libre tras los que se hace ping antes de prestarla. INT
+    Salida: El pool del login. PoolConexiones'''
+
+    clave = clave_login(data)
+
+    with pools_lock: # Solo el registro, las conexiones se abren fuera para no bloquear los demas logins
+        pool = pools.get(clave)
+        nuevo = pool is None
+
+        if nuevo:
+            pool = PoolConexiones(lambda: conectar(data), min_size, max_size, idle_timeout, ping_idle, llenar=False)
+            pools[clave] = pool
+
+    if nuevo:
+        pool.llenar()
+
+    return pool
+
+
+def cerrar_pools():
+
+    '''Cerramos todas las conexiones de todos los pools abiertos.'''
+
+    with pools_lock:
+        for pool in pools.values():
+            pool.cerrar()
+
+        pools.clear()
+
+
+class PoolConexiones:
+
+    '''Pool de conexiones con prestamo y devolucion seguros entre hilos.'''
+
+
+    def __init__(self, conectar, min_size=1, max_size=10, idle_timeout=300, ping_idle=30, llenar=True):
+
+        self.conectar = conectar
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.idle_timeout = idle_timeout
+        self.ping_idle = ping_idle
+        self.libres = deque() # (conn, instante de devolucion)
+        self.total = 0 # Conexiones abiertas, libres y prestadas
+        self.cerrado = False
+        self.cond = threading.Condition()
+
+        if llenar:
+            self.llenar()
+
+
+    def llenar(self):
+
+        '''Abrimos conexiones hasta min_size, cada una en un hueco reservado con el lock del pool, por lo que
+        otros hilos ya pueden pedir prestado mientras tanto.'''
+
+        for _ in range(min(self.min_size, self.max_size)):
+            with self.cond:
+                if self.cerrado or self.total >= min(self.min_size, self.max_size):
+                    return
+
+                self.total += 1
+
+            conn = self.abrir()
+
+            if conn is not None:
+                with self.cond:
+                    self.libres.append((conn, time.monotonic()))
+                    self.cond.notify()
+
+
+    def abrir(self):
+
+        '''Abrimos una conexion nueva en un hueco ya reservado en el total.
+        Salida: Conexion o None si da error. OBJ o NONE'''
+
+        try:
+            conn = self.conectar()
+
+        except (pymysql.Error, OSError, KeyError, ValueError, TypeError):
+            logger.exception('pool: abrir conexion')
+            conn = None
+
+        if conn in [None, False]:
+            self.descartar(None)
+            conn = None
+
+        return conn
+
+
+    def descartar(self, conn):
+
+        '''Cerramos la conexion y liberamos su hueco en el pool.
+        conn: Conexion a descartar o None si no llego a abrirse. OBJ o NONE'''
+
+        if conn is not None:
+            try:
+                conn.close()
+            except (pymysql.Error, OSError):
+                pass
+
+        with self.cond:
+            self.total -= 1
+            self.cond.notify()
+
+
+    def prestar(self, espera=30):
+
+        '''Prestamos una conexion libre, abrimos una nueva si hay hueco o esperamos a una devolucion.
+        espera: Segundos maximos de espera, None sin limite. INT o NONE
+        Salida: Conexion prestada o None si se agota la espera. OBJ o NONE'''
+
+        limite = None if espera is None else time.monotonic() + espera
+        self.recoger()
+
+        while True:
+            with self.cond:
+                while not self.libres and self.total >= self.max_size:
+                    restante = None if limite is None else limite - time.monotonic()
+
+                    if restante is not None and restante <= 0:
+                        logger.error('pool: espera agotada sin conexiones libres')
+                        return None
+
+                    self.cond.wait(restante)
+
+                if self.libres:
+                    conn, devuelta = self.libres.pop() # LIFO, la mas reciente sigue caliente
+                    nueva = False
+                else:
+                    self.total += 1 # Reservamos el hueco antes de soltar el lock
+                    nueva = True
+
+            if nueva:
+                return self.abrir()
+
+            libre = time.monotonic() - devuelta
+
+            if libre > self.idle_timeout and self.total > self.min_size:
+                self.descartar(conn)
+            elif libre > self.ping_idle and not self.sana(conn):
+                self.descartar(conn)
+            else:
+                return conn
+
+
+    def sana(self, conn):
+
+        '''Ping a una conexion que ha estado libre mas de ping_idle.
+        Salida: True si responde. BOOL'''
+
+        try:
+            conn.ping(reconnect=False)
+
+        except (pymysql.Error, OSError):
+            logger.warning('pool: conexion caida, se descarta')
+            return False
+
+        return True
+
+
+    def devolver(self, conn):
+
+        '''Devolvemos una conexion prestada, deshaciendo la transaccion que haya quedado abierta.
+        conn: Conexion prestada por este pool. OBJ'''
+
+        if self.cerrado or not getattr(conn, 'open', True): # Cerrada por quien la uso, no se reutiliza
+            self.descartar(conn)
+            return
+
+        try:
+            if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                conn.rollback()
+
+        except (pymysql.Error, OSError, AttributeError):
+            logger.exception('pool: devolver conexion')
+            self.descartar(conn)
+            return
+
+        with self.cond:
+            self.libres.append((conn, time.monotonic()))
+            self.cond.notify()
+
+        self.recoger()
+
+
+    def recoger(self):
+
+        '''Cerramos las libres que superan idle_timeout por encima de min_size. prestar() toma la mas
+        reciente por la derecha, las mas antiguas quedan a la izquierda y se recogen por ese lado.'''
+
+        caducadas = []
+        ahora = time.monotonic()
+
+        with self.cond:
+            while (self.libres and ahora - self.libres[0][1] > self.idle_timeout
+                   and self.total - len(caducadas) > self.min_size):
+                caducadas.append(self.libres.popleft()[0])
+
+        for conn in caducadas:
+            self.descartar(conn)
+
+
+    def cerrar(self):
+
+        '''Cerramos las conexiones libres, las prestadas se cierran al devolverse.'''
+
+        with self.cond:
+            libres = list(self.libres)
+            self.libres.clear()
+            self.cerrado = True
+
+        for conn, _ in libres:
+            self.descartar(conn)
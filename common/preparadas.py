@@ -0,0 +1,525 @@
+#
+# Sentencias preparadas en servidor (COM_STMT_PREPARE/EXECUTE, protocolo binario) sobre conexiones pymysql
+#
+#   Cada conexion guarda sus sentencias preparadas por texto en una LRU de max_size entradas; la que sale
+#   se cierra en servidor (COM_STMT_CLOSE). Al reconectar la conexion (socket nuevo) se olvidan, el
+#   servidor ya las ha descartado con la sesion anterior, y se preparan de nuevo al usarse.
+#   Las sentencias sin valores a enlazar, las que el servidor no admite preparar y las que superan
+#   max_prepared_stmt_count se ejecutan con el protocolo de texto de pymysql. Tambien las que tienen un ?
+#   fuera de los literales entre comillas (el servidor lo tomaria por parametro) o un %s dentro de ellos,
+#   y las que enlazan listas, tuplas, sets o dicts (p.ej. 'in'): pymysql los expande a (v1,v2,...) en el
+#   texto y en binario serian un unico texto.
+#
+
+from collections import OrderedDict
+import datetime
+import decimal
+import logging
+import re
+import struct
+import weakref
+
+import pymysql
+from pymysql import converters
+from pymysql.constants import COMMAND, ER, FIELD_TYPE, FLAG
+from pymysql.connections import TEXT_TYPES, OKPacketWrapper, EOFPacketWrapper, FieldDescriptorPacket
+
+
+logger = logging.getLogger(__name__)
+
+MAX_PREPARADAS = 64 # Sentencias preparadas por conexion
+# Textos entre comillas simples o dobles e identificadores entre `, con sus escapes
+LITERALES = re.compile(r"""('(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`)""", re.S)
+
+ENTEROS = {FIELD_TYPE.TINY: ('<b', 1), FIELD_TYPE.SHORT: ('<h', 2), FIELD_TYPE.YEAR: ('<h', 2),
+           FIELD_TYPE.LONG: ('<i', 4), FIELD_TYPE.INT24: ('<i', 4), FIELD_TYPE.LONGLONG: ('<q', 8)}
+FECHAS = (FIELD_TYPE.DATE, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP)
+COMPUESTOS = (list, tuple, set, frozenset, dict) # Valores que pymysql expande en el texto de la sentencia
+
+registros = weakref.WeakKeyDictionary() # Conexion -> SentenciasPreparadas
+
+
+def cursor_preparado(conn, format_dict=False, max_size=MAX_PREPARADAS):
+
+    '''Cursor con sentencias preparadas sobre la conexion, con su cache de sentencias.
+    conn: Conexion pymysql. OBJ
+    format_dict: Rows en dict como DictCursor. BOOL
+    max_size: Sentencias preparadas que se mantienen en la conexion. INT
+    Salida: Cursor compatible con el uso de Cursor/DictCursor en PyMySqlArs. CursorPreparado'''
+
+    sentencias = registros.get(conn)
+
+    if sentencias is None:
+        sentencias = registros[conn] = SentenciasPreparadas(conn, max_size)
+
+    return CursorPreparado(conn, sentencias, format_dict)
+
+
+def texto_preparado(query):
+
+    '''Sentencia con %s de pymysql a sentencia con ? para preparar, sin tocar los literales entre comillas:
+    un ? dentro de ellos es texto, p.ej. LIKE '%%?%%'.
+    Salida: Sentencia con ? o None si no se puede preparar igual que la ejecutaria pymysql. STR o NONE'''
+
+    partes = []
+
+    for i, parte in enumerate(LITERALES.split(query)):
+        if i % 2: # Literal entre comillas o identificador
+            if '%s' in re.findall(r"%[s%]", parte):
+                return None
+
+            partes.append(parte.replace('%%', '%'))
+        elif '?' in parte:
+            return None
+        else:
+            partes.append(re.sub(r"%(s|%)", lambda m: "?" if m.group(1) == "s" else "%", parte))
+
+    return ''.join(partes).rstrip().rstrip(';')
+
+
+def lenenc(numero):
+
+    '''Entero con longitud codificada del protocolo MySQL. BYTES'''
+
+    if numero < 251:
+        return bytes((numero,))
+    elif numero < 65536:
+        return b'\xfc' + struct.pack('<H', numero)
+    elif numero < 16777216:
+        return b'\xfd' + struct.pack('<I', numero)[:3]
+
+    return b'\xfe' + struct.pack('<Q', numero)
+
+
+def codificar(valor, encoding):
+
+    '''Valor de un parametro en protocolo binario, escalar (los COMPUESTOS van por el protocolo de texto).
+    Salida: (tipo MySQL, sin signo, bytes del valor). TUPLE'''
+
+    if isinstance(valor, COMPUESTOS):
+        raise pymysql.err.ProgrammingError(f"preparadas: valor compuesto {type(valor).__name__} sin tipo binario")
+
+    if type(valor) is bool:
+        valor = int(valor)
+
+    if isinstance(valor, int):
+        if -2**63 <= valor < 2**63:
+            return FIELD_TYPE.LONGLONG, False, struct.pack('<q', valor)
+        elif 0 <= valor < 2**64:
+            return FIELD_TYPE.LONGLONG, True, struct.pack('<Q', valor)
+
+        dato = str(valor).encode('ascii')
+        return FIELD_TYPE.NEWDECIMAL, False, lenenc(len(dato)) + dato
+
+    elif isinstance(valor, float):
+        return FIELD_TYPE.DOUBLE, False, struct.pack('<d', valor)
+
+    elif isinstance(valor, (bytes, bytearray, memoryview)):
+        dato = bytes(valor)
+        return FIELD_TYPE.BLOB, False, lenenc(len(dato)) + dato
+
+    elif isinstance(valor, datetime.datetime):
+        return FIELD_TYPE.DATETIME, False, struct.pack('<BHBBBBBI', 11, valor.year, valor.month, valor.day,
+                                                       valor.hour, valor.minute, valor.second, valor.microsecond)
+
+    elif isinstance(valor, datetime.date):
+        return FIELD_TYPE.DATE, False, struct.pack('<BHBB', 4, valor.year, valor.month, valor.day)
+
+    elif isinstance(valor, datetime.timedelta):
+        negativo = valor < datetime.timedelta(0)
+        valor = -valor if negativo else valor
+        horas, resto = divmod(valor.seconds, 3600)
+        minutos, segundos = divmod(resto, 60)
+        return FIELD_TYPE.TIME, False, struct.pack('<BBIBBBI', 12, negativo, valor.days, horas, minutos,
+                                                   segundos, valor.microseconds)
+
+    elif isinstance(valor, datetime.time):
+        return FIELD_TYPE.TIME, False, struct.pack('<BBIBBBI', 12, 0, 0, valor.hour, valor.minute,
+                                                   valor.second, valor.microsecond)
+
+    elif isinstance(valor, decimal.Decimal):
+        dato = str(valor).encode('ascii')
+        return FIELD_TYPE.NEWDECIMAL, False, lenenc(len(dato)) + dato
+
+    dato = str(valor).encode(encoding)
+    return FIELD_TYPE.VAR_STRING, False, lenenc(len(dato)) + dato
+
+
+def leer_float(paquete):
+
+    '''FLOAT de 4 bytes con el menor numero de digitos que lo representa, como el texto del servidor.'''
+
+    valor = struct.unpack('<f', paquete.read(4))[0]
+
+    for digitos in range(6, 10):
+        corto = float(f"{valor:.{digitos}g}")
+
+        if struct.unpack('<f', struct.pack('<f', corto))[0] == valor:
+            return corto
+
+    return valor
+
+
+def leer_fecha(paquete, tipo):
+
+    '''DATE/DATETIME/TIMESTAMP binario. Las fechas cero o invalidas se devuelven en texto como pymysql.'''
+
+    largo = paquete.read_uint8()
+    anyo = mes = dia = hora = minuto = segundo = micro = 0
+
+    if largo >= 4:
+        anyo, mes, dia = struct.unpack('<HBB', paquete.read(4))
+
+    if largo >= 7:
+        hora, minuto, segundo = struct.unpack('<BBB', paquete.read(3))
+
+    if largo >= 11:
+        micro = paquete.read_uint32()
+
+    try:
+        if tipo == FIELD_TYPE.DATE:
+            return datetime.date(anyo, mes, dia)
+
+        return datetime.datetime(anyo, mes, dia, hora, minuto, segundo, micro)
+
+    except ValueError:
+        if tipo == FIELD_TYPE.DATE:
+            return f"{anyo:04d}-{mes:02d}-{dia:02d}"
+
+        return f"{anyo:04d}-{mes:02d}-{dia:02d} {hora:02d}:{minuto:02d}:{segundo:02d}"
+
+
+def leer_hora(paquete):
+
+    '''TIME binario. datetime.timedelta'''
+
+    largo = paquete.read_uint8()
+
+    if largo == 0:
+        return datetime.timedelta(0)
+
+    negativo, dias, hora, minuto, segundo = struct.unpack('<BIBBB', paquete.read(8))
+    micro = paquete.read_uint32() if largo >= 12 else 0
+    valor = datetime.timedelta(days=dias, hours=hora, minutes=minuto, seconds=segundo, microseconds=micro)
+
+    return -valor if negativo else valor
+
+
+def decodificador(campo, conn):
+
+    '''Funcion que lee el valor de la columna de una row binaria, con las mismas conversiones que pymysql.
+    campo: Descripcion de la columna. FieldDescriptorPacket
+    Salida: Funcion paquete -> valor. CALLABLE'''
+
+    tipo = campo.type_code
+
+    if tipo in ENTEROS:
+        formato, largo = ENTEROS[tipo]
+        formato = formato.upper() if campo.flags & FLAG.UNSIGNED else formato
+        return lambda paquete: struct.unpack(formato, paquete.read(largo))[0]
+    elif tipo == FIELD_TYPE.FLOAT:
+        return leer_float
+    elif tipo == FIELD_TYPE.DOUBLE:
+        return lambda paquete: struct.unpack('<d', paquete.read(8))[0]
+    elif tipo in FECHAS:
+        return lambda paquete: leer_fecha(paquete, tipo)
+    elif tipo == FIELD_TYPE.TIME:
+        return leer_hora
+
+    if not conn.use_unicode:
+        encoding = None
+    elif tipo == FIELD_TYPE.JSON:
+        encoding = conn.encoding
+    elif tipo in TEXT_TYPES:
+        encoding = None if campo.charsetnr == 63 else conn.encoding
+    else:
+        encoding = 'ascii'
+
+    conversor = conn.decoders.get(tipo)
+
+    if conversor is converters.through:
+        conversor = None
+
+    def leer(paquete):
+        dato = paquete.read_length_coded_string()
+
+        if encoding is not None:
+            dato = dato.decode(encoding)
+
+        return dato if conversor is None else conversor(dato)
+
+    return leer
+
+
+class SentenciasPreparadas:
+
+    '''Sentencias preparadas de una conexion, LRU por texto de la sentencia.'''
+
+
+    def __init__(self, conn, max_size=MAX_PREPARADAS):
+
+        self.conn = conn
+        self.max_size = max(max_size, 1)
+        self.sock = conn._sock # Identifica la sesion, cambia al reconectar
+        self.datos = OrderedDict() # query pymysql -> (stmt_id, parametros) o None si no se puede preparar
+
+
+    def obtener(self, query):
+
+        '''Sentencia preparada de la query, preparandola si no esta en la cache.
+        query: Sentencia con %s de pymysql. STR
+        Salida: (stmt_id, parametros) o None para ejecutarla con el protocolo de texto. TUPLE o NONE'''
+
+        if self.conn._sock is not self.sock: # Reconexion, las sentencias eran de la sesion anterior
+            self.datos.clear()
+            self.sock = self.conn._sock
+
+        if query in self.datos:
+            self.datos.move_to_end(query)
+            return self.datos[query]
+
+        texto = texto_preparado(query)
+
+        try:
+            preparada = None if texto is None else self.preparar(texto)
+
+        except pymysql.err.MySQLError as e:
+            if e.args[0] == ER.MAX_PREPARED_STMT_COUNT_REACHED:
+                logger.warning('preparadas: max_prepared_stmt_count alcanzado, protocolo de texto')
+                return None
+            elif e.args[0] == ER.UNSUPPORTED_PS:
+                preparada = None
+            else:
+                raise
+
+        self.datos[query] = preparada
+
+        while len(self.datos) > self.max_size:
+            _, expulsada = self.datos.popitem(last=False)
+
+            if expulsada is not None:
+                self.cerrar(expulsada[0])
+
+        return preparada
+
+
+    def olvidar(self, query):
+
+        '''Quitamos una sentencia que el servidor ya no reconoce.'''
+
+        self.datos.pop(query, None)
+
+
+    def preparar(self, SQL):
+
+        '''COM_STMT_PREPARE.
+        SQL: Sentencia con ?. STR
+        Salida: (stmt_id, parametros). TUPLE'''
+
+        self.conn._execute_command(COMMAND.COM_STMT_PREPARE, SQL)
+        paquete = self.conn._read_packet()
+        paquete.read(1) # Estado OK
+        stmt_id = paquete.read_uint32()
+        columnas = paquete.read_uint16()
+        parametros = paquete.read_uint16()
+
+        for bloque in [parametros, columnas]: # Definiciones de parametros y columnas, cada bloque con su EOF
+            if bloque:
+                for _ in range(bloque + 1):
+                    self.conn._read_packet()
+
+        return (stmt_id, parametros)
+
+
+    def cerrar(self, stmt_id):
+
+        '''COM_STMT_CLOSE, el servidor no responde.'''
+
+        try:
+            self.conn._execute_command(COMMAND.COM_STMT_CLOSE, struct.pack('<I', stmt_id))
+        except (pymysql.Error, OSError):
+            logger.warning('preparadas: no se pudo cerrar la sentencia %s', stmt_id)
+
+
+    def ejecutar(self, preparada, args):
+
+        '''COM_STMT_EXECUTE con los valores en protocolo binario.
+        preparada: (stmt_id, parametros). TUPLE
+        args: Valores a enlazar. LIST o TUPLE
+        Salida: (rowcount, lastrowid, description, rows, nombres de columna para dicts). TUPLE'''
+
+        stmt_id, parametros = preparada
+
+        if len(args) != parametros:
+            raise pymysql.err.ProgrammingError(f"preparadas: {parametros} parametros y {len(args)} valores")
+
+        paquete = struct.pack('<IBI', stmt_id, 0, 1) # Sin cursor en servidor, una iteracion
+
+        if parametros:
+            nulos = bytearray((parametros + 7) // 8)
+            tipos = bytearray()
+            valores = bytearray()
+
+            for posicion, valor in enumerate(args):
+                if valor is None:
+                    nulos[posicion // 8] |= 1 << (posicion % 8)
+                    tipos += bytes((FIELD_TYPE.NULL, 0))
+                else:
+                    tipo, sin_signo, dato = codificar(valor, self.conn.encoding)
+                    tipos += bytes((tipo, 0x80 if sin_signo else 0))
+                    valores += dato
+
+            paquete += bytes(nulos) + b'\x01' + bytes(tipos) + bytes(valores)
+
+        self.conn._execute_command(COMMAND.COM_STMT_EXECUTE, paquete)
+
+        return self.leer_resultado()
+
+
+    def leer_resultado(self):
+
+        '''Leemos el OK o el resultado con rows binarias. Salida como ejecutar. TUPLE'''
+
+        conn = self.conn
+        paquete = conn._read_packet()
+
+        if paquete.is_ok_packet():
+            ok = OKPacketWrapper(paquete)
+            conn.server_status = ok.server_status
+            return (ok.affected_rows, ok.insert_id, None, (), None)
+
+        campos = [conn._read_packet(FieldDescriptorPacket) for _ in range(paquete.read_length_encoded_integer())]
+        conn._read_packet() # EOF de las columnas
+        decodificadores = [decodificador(campo, conn) for campo in campos]
+        nulos = (len(campos) + 9) // 8
+        filas = []
+
+        while True:
+            paquete = conn._read_packet()
+
+            if paquete.is_eof_packet():
+                conn.server_status = EOFPacketWrapper(paquete).server_status
+                break
+
+            paquete.read(1) # Cabecera de la row
+            mapa = paquete.read(nulos)
+            fila = []
+
+            for posicion, leer in enumerate(decodificadores):
+                bit = posicion + 2 # Los dos primeros bits del mapa de nulos estan reservados
+
+                if mapa[bit // 8] & (1 << (bit % 8)):
+                    fila.append(None)
+                else:
+                    fila.append(leer(paquete))
+
+            filas.append(tuple(fila))
+
+        nombres = []
+
+        for campo in campos: # Como DictCursor, las columnas repetidas con el nombre de su tabla
+            nombres.append(campo.name if campo.name not in nombres else f"{campo.table_name}.{campo.name}")
+
+        return (len(filas), 0, tuple(campo.description() for campo in campos), tuple(filas), nombres)
+
+
+class CursorPreparado:
+
+    '''Cursor con la interfaz de Cursor/DictCursor que usa PyMySqlArs, ejecuta con sentencias preparadas.'''
+
+
+    def __init__(self, conn, sentencias, format_dict=False):
+
+        self.connection = conn
+        self.sentencias = sentencias
+        self.format_dict = format_dict
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+        self.filas = ()
+        self.posicion = 0
+
+
+    def execute(self, query, args=None):
+
+        '''Ejecutamos la query, preparada si tiene valores a enlazar y todos son escalares.
+        Salida: rows afectadas o recuperadas. INT'''
+
+        if not args or isinstance(args, dict) or any(isinstance(valor, COMPUESTOS) for valor in args):
+            preparada = None
+        else:
+            preparada = self.sentencias.obtener(query)
+
+        if preparada is None:
+            return self.texto(query, args)
+
+        try:
+            resultado = self.sentencias.ejecutar(preparada, args)
+
+        except pymysql.err.MySQLError as e:
+            if e.args[0] != ER.UNKNOWN_STMT_HANDLER:
+                raise
+
+            self.sentencias.olvidar(query) # Descartada en servidor, se prepara de nuevo
+            resultado = self.sentencias.ejecutar(self.sentencias.obtener(query), args)
+
+        self.rowcount, self.lastrowid, self.description, filas, nombres = resultado
+
+        if self.format_dict and self.description:
+            filas = [dict(zip(nombres, fila)) for fila in filas]
+
+        self.filas = filas
+        self.posicion = 0
+
+        return self.rowcount
+
+
+    def texto(self, query, args):
+
+        '''Ejecucion con el protocolo de texto de pymysql. INT'''
+
+        cursor = self.connection.cursor(pymysql.cursors.DictCursor if self.format_dict else pymysql.cursors.Cursor)
+
+        try:
+            cursor.execute(query, args)
+            self.rowcount = cursor.rowcount
+            self.lastrowid = cursor.lastrowid
+            self.description = cursor.description
+            self.filas = cursor.fetchall() if cursor.description else ()
+            self.posicion = 0
+
+        finally:
+            cursor.close()
+
+        return self.rowcount
+
+
+    def fetchone(self):
+
+        if self.posicion >= len(self.filas):
+            return None
+
+        self.posicion += 1
+
+        return self.filas[self.posicion - 1]
+
+
+    def fetchmany(self, size=1):
+
+        filas = self.filas[self.posicion:self.posicion + size]
+        self.posicion += len(filas)
+
+        return filas
+
+
+    def fetchall(self):
+
+        filas = self.filas[self.posicion:]
+        self.posicion = len(self.filas)
+
+        return filas
+
+
+    def close(self):
+
+        self.filas = ()
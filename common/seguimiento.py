@@ -0,0 +1,75 @@
+#
+# Filas seguidas (#track): dicts de una select que recuerdan sus valores leidos para actualizar solo lo cambiado
+#
+
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class FilaSeguida(dict):
+
+    '''Row en dict de una select con #track. Guarda la tabla, las columnas clave y los valores originales;
+    update() con ella solo envia las columnas cambiadas en el SET y nada si no ha cambiado.
+    Tras un update correcto los valores actuales pasan a ser los originales.'''
+
+
+    def __init__(self, fila, tabla, claves):
+
+        super().__init__(fila)
+        self.tabla = tabla
+        self.claves = claves # Columnas del #where del update
+        self.original = dict(fila)
+
+
+    def cambios(self):
+
+        '''Salida: Columnas nuevas o con un valor distinto del leido. DICT'''
+
+        return {k: v for k, v in self.items() if k not in self.original or self.original[k] != v}
+
+
+    def dict_update(self):
+
+        '''Dict de update con las columnas cambiadas y la clave original en el #where.
+        Salida: Dict para PyMySqlArs.update o None si no hay cambios. DICT o NONE'''
+
+        cambios = self.cambios()
+
+        if not cambios:
+            return None
+
+        where = {k: ['=', self.original[k], 'and'] for k in self.claves}
+        where[self.claves[-1]] = where[self.claves[-1]][:2]
+
+        return {'#table': self.tabla, **cambios, '#where': where}
+
+
+    def confirmar(self):
+
+        '''Los valores actuales pasan a ser los originales, p.ej. tras escribirlos.'''
+
+        self.original = dict(self)
+
+
+def seguir(records, tabla, claves):
+
+    '''Convertimos las rows en dict de una select en filas seguidas.
+    records: Resultado de la select, dict (one) o lista de dicts. DICT o LIST[DICT]
+    tabla: #table de la select. STR
+    claves: Columnas clave, deben estar en las rows. LIST[STR]
+    Salida: FilaSeguida o lista de ellas; sin cambios si no hay rows o falta alguna clave. DICT o LIST'''
+
+    filas = [records] if type(records) is dict else records
+
+    if not filas or type(filas) not in [list, tuple]:
+        return records
+
+    if any(k not in filas[0] for k in claves):
+        logger.error("seguir: #track %s no esta en las columnas de la select", claves)
+        return records
+
+    seguidas = [FilaSeguida(fila, tabla, claves) for fila in filas]
+
+    return seguidas[0] if type(records) is dict else seguidas
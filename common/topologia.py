@@ -0,0 +1,133 @@
+#
+# Topologia primaria + replicas: eleccion de replica por latencia (EWMA) y replicas caidas apartadas un tiempo
+#
+
+import threading
+import logging
+import random
+import time
+
+import pymysql
+from pymysql.constants import ER
+
+from common.pool import clave_login
+
+
+logger = logging.getLogger(__name__)
+
+ALFA = 0.2 # Peso de la ultima medida en la media movil exponencial de latencia
+PENALIZACION = 30 # Segundos que se aparta una replica tras un error
+
+ERRORES_CONEXION = {ER.CON_COUNT_ERROR, ER.SERVER_SHUTDOWN, ER.ABORTING_CONNECTION, ER.NEW_ABORTING_CONNECTION,
+                    ER.HOST_IS_BLOCKED, ER.TOO_MANY_USER_CONNECTIONS, 1927} # 1927: ER_CONNECTION_KILLED
+
+topologias = {} # Topologias por clave del login de topologia
+topologias_lock = threading.Lock()
+
+
+def es_topologia(data):
+
+    '''Salida: True si el login describe una topologia {'primary': login, 'replicas': [logins]}. BOOL'''
+
+    return type(data) is dict and 'primary' in data
+
+
+def error_conexion(error):
+
+    '''Salida: True si el error es de la conexion con el servidor (caida, cerrada, servidor parado o sin
+    huecos) y no de la sentencia (SQL mal formado, columna desconocida, bloqueo...). BOOL'''
+
+    if isinstance(error, (pymysql.err.InterfaceError, OSError)):
+        return True
+
+    if isinstance(error, pymysql.err.OperationalError) and error.args and type(error.args[0]) is int:
+        return error.args[0] >= 2000 or error.args[0] in ERRORES_CONEXION # CR_* de cliente desde 2000
+
+    return False
+
+
+def obtener_topologia(data, leer):
+
+    '''Recuperamos la topologia del login o la creamos si no existe.
+    data: {'primary': login, 'replicas': [logins]}, cada login en DICT o STR/PATH de un fichero. DICT
+    leer: Funcion que lee un login en STR/PATH, rec_data. CALLABLE
+    Salida: La topologia del login. Topologia'''
+
+    clave = clave_login(data)
+
+    with topologias_lock:
+        topologia = topologias.get(clave)
+
+        if topologia is None:
+            resolver = lambda login: login if type(login) is dict else leer(login)
+            replicas = [resolver(login) for login in data.get('replicas', [])]
+            topologia = Topologia(resolver(data['primary']), [r for r in replicas if type(r) is dict])
+            topologias[clave] = topologia
+
+    return topologia
+
+
+class Topologia:
+
+    '''Login de la primaria y de las replicas, con la latencia de lectura de cada replica.'''
+
+
+    def __init__(self, primaria, replicas, alfa=ALFA, penalizacion=PENALIZACION):
+
+        self.primaria = primaria
+        self.replicas = replicas
+        self.alfa = alfa
+        self.penalizacion = penalizacion
+        self.latencias = [None] * len(replicas) # EWMA en segundos, None sin medir
+        self.apartadas = [0.0] * len(replicas) # Instante hasta el que no se usa cada replica
+        self.lock = threading.Lock()
+
+
+    def orden(self):
+
+        '''Replicas disponibles por preferencia: de dos al azar la de menor latencia (las sin medir primero),
+        despues el resto por latencia como alternativa si no conectan.
+        Salida: Indices de las replicas. LIST[INT]'''
+
+        ahora = time.monotonic()
+
+        with self.lock:
+            disponibles = [i for i, hasta in enumerate(self.apartadas) if hasta <= ahora]
+            latencia = lambda i: self.latencias[i] or 0.0
+            pareja = sorted(random.sample(disponibles, min(2, len(disponibles))), key=latencia)
+
+            return pareja + sorted((i for i in disponibles if i not in pareja), key=latencia)
+
+
+    def registrar(self, indice, segundos, ok=True):
+
+        '''Anadimos la latencia de una lectura a la media de la replica, o la apartamos si ha fallado.'''
+
+        if not ok:
+            self.fallo(indice)
+            return
+
+        with self.lock:
+            previa = self.latencias[indice]
+            self.latencias[indice] = segundos if previa is None else previa + self.alfa * (segundos - previa)
+
+
+    def fallo(self, indice):
+
+        '''Apartamos la replica penalizacion segundos.'''
+
+        logger.warning('topologia: replica %s apartada %s segundos', indice, self.penalizacion)
+
+        with self.lock:
+            self.apartadas[indice] = time.monotonic() + self.penalizacion
+
+
+    def stats(self):
+
+        '''Salida: Latencia media y si esta apartada cada replica. LIST[DICT]'''
+
+        ahora = time.monotonic()
+
+        with self.lock:
+            return [{'host': r.get('host'), 'latency': l, 'down': hasta > ahora}
+                    for r, l, hasta in zip(self.replicas, self.latencias, self.apartadas)]
@@ -31,16 +31,599 @@
 #   #order_by: Orden de los registros recuperados.
 #       ej: {'#order_by': 'column1, column2, etc...'}
 #           {'#order_by': 'ASC' o 'DESC'}
+#   #format: {'#format': 'columnar'} - Devuelve un ResultadoColumnar (common/columnar.py): cabecera y un array
+#       por columna numerica (lista en el resto), con acceso por row (len, r[i], for) en tupla o dict con #dict
+#       y por columna (r.columna('id'), r.numpy('id')). Para one, all o int; no usa la cache de resultados.
+#   {'#reading_type': 'stream'} - Lectura sin buffer (SSCursor), devuelve un LecturaStream que itera las rows
+#       sin cargarlas todas en memoria. La conexion queda ocupada hasta agotarlo o cerrarlo.
+#   #chunk: con 'stream', numero de rows por trozo; el iterador devuelve listas de rows.
+#       ej: {'#reading_type': 'stream', '#chunk': 1000}
+#   #track: Con #dict, filas seguidas (common/seguimiento.py): cada row es una FilaSeguida, un dict que recuerda
+#       los valores leidos. update(fila o lista) envia solo las columnas cambiadas (#where por la clave
+#       original) y nada para las filas sin cambios; con batch='join' las filas con las mismas columnas
+#       cambiadas van juntas por conjuntos, y en un pipeline() en un unico viaje. Tras escribirlas, en el
+#       commit dentro de transaction(), los valores actuales pasan a ser los originales. insert y delete las
+#       rechazan sin escribir nada (error en el log, salida None): se escriben con update.
+#       {'#track': 'id'} o {'#track': 'id, linea'} - Columnas clave, deben estar en #column.
+#   #paginate: Paginacion por clave (keyset), WHERE clave > ultimo ORDER BY clave LIMIT size por pagina.
+#       {'#paginate': {'key': 'id', 'size': 1000}} - Devuelve un Paginador, iterador perezoso de paginas.
+#       {'#paginate': {'key': 'id', 'size': 1000, 'token': 1234}} - Reanuda tras el token guardado de
+#       un Paginador anterior (Paginador.token). Se ignoran #order_by y #reading_type. La clave debe estar en
+#       #column (si no es '*'). Un error en una pagina corta la iteracion con Paginador.error = True.
+#       La clave debe ser unica (p.ej. la clave primaria): cada pagina sigue tras el ultimo valor leido, por
+#       lo que con valores repetidos se saltan las rows que comparten el valor del corte entre dos paginas.
+#
+# Modo batch de insert:
+#   insert(datos, conn, batch=True): agrupa los dicts por (#table, columnas) y los envia en INSERT IGNORE
+#       multi-row troceados para no superar el max_allowed_packet del servidor.
+#   commit_batch: 'chunk' un commit por trozo, 'call' un unico commit al final de la llamada.
+#   salida: lista con las rows afectadas por cada trozo o [SQL, valores] por trozo con conn=False.
+#   insert_columnas({'#table': tabla, 'col': secuencia o array de numpy, ...}, conn): el mismo INSERT IGNORE
+#       multi-row troceado pero a partir de columnas, sin un dict por row. Los arrays numericos, booleanos
+#       y de fechas de numpy se convierten a literales en bloque; None, NaN, NaT, numpy.ma enmascarados y
+#       '#null': {'col': mascara} se insertan como NULL.
+#
+# Update por conjuntos:
+#   update(lista, conn, batch='upsert' o 'join'): para listas homogeneas (misma #table, mismas columnas SET y
+#       #where de igualdades unidas por 'and' sobre las mismas columnas). 'upsert' usa INSERT ... ON DUPLICATE
+#       KEY UPDATE (las filas inexistentes se insertan): las columnas del #where deben ser exactamente la clave
+#       primaria o una UNIQUE, se comprueba con SHOW KEYS y si no se rechaza con False. 'join' carga los
+#       cambios en una tabla temporal, aplica UPDATE ... JOIN y la elimina al terminar aunque falle.
+#       Troceado, devuelve rows afectadas por trozo. En 'upsert' son las que cuenta MySQL para ON DUPLICATE KEY
+#       UPDATE: 1 por fila insertada, 2 por fila actualizada y 0 (1 con CLIENT.FOUND_ROWS) por fila sin cambios.
+#
+# Sentencias preparadas:
+#   PyMySqlArs(preparadas=True o n): update, insert, delete y las selects one/all/int con valores se ejecutan
+#       como sentencias preparadas en servidor (protocolo binario, common/preparadas.py) en lugar de
+#       interpolar los valores en el SQL. Cada conexion mantiene sus n (64 con True) ultimas sentencias
+#       por texto, cerrando en servidor la menos usada. Al reconectar se preparan de nuevo; las sentencias
+#       sin valores (insert batch, valores ya escapados), las no admitidas por el servidor y las que superan
+#       max_prepared_stmt_count usan el protocolo de texto.
+#
+# Escritura desde generadores:
+#   insert/update/delete(iterable, conn, chunk=n): un generador u otro iterable que no sea lista o tupla se
+#       procesa por trozos de chunk dicts (tratar, compilar, ejecutar y un commit por trozo en un bloque
+#       transaction()), la memoria queda acotada al trozo. salida: lista con la salida de cada trozo, False
+#       en el trozo que falla (se deshace y se detiene; los anteriores quedan confirmados).
+#   Con conn=False devuelve un generador de las sentencias [SQL, valores], trozo a trozo.
+#
+# Pipeline de escrituras:
+#   with ars.pipeline(conn) as pipe: pipe.insert(...), pipe.update(...), pipe.delete(...) compilan y encolan
+#       las sentencias (mismos datos y batch que insert/update/delete) y al salir del with, o con
+#       pipe.enviar(), se envian unidas por ';' en un unico COM_QUERY por trozo de max_allowed_packet
+#       (common/multisentencia.py, activa MULTI_STATEMENTS solo durante el envio y lo desactiva antes de
+#       devolver la conexion). salida: rows afectadas por sentencia, False en la que falla y None en las
+#       no ejecutadas; pipe.errores [(posicion, error)].
+#   Dentro de transaction() el envio es parte de la transaccion y un fallo la deshace al salir del bloque;
+#   fuera, un fallo hace rollback de todo el envio.
+#   pipe.update(..., batch='upsert') devuelve False sin encolar: la comprobacion de clave unica del upsert
+#   necesita la conexion y en el pipeline se compila sin ella.
+#
+# Delete por lotes:
+#   delete(lista, conn, batch=True): los dicts con un #where de una unica igualdad sobre la misma #table y
+#       columna se agrupan en DELETE ... WHERE columna IN (...) troceados; el resto se borra dict a dict.
+#       salida: una entrada por trozo IN (rows borradas) y una por dict no agrupado, en el orden de la
+#       lista: cada trozo en la posicion de su primer dict. Con conn=False, [SQL, valores] en ese orden.
+#   borrar_por_lotes(dict, conn, limite): DELETE ... LIMIT limite repetido, con un commit por lote,
+#       hasta borrar todas las rows del #where.
+#
+# Metricas:
+#   ars.registrar_hook(callback): el callback recibe un dict por sentencia ejecutada con kind, table,
+#       fingerprint (huella del SQL compilado), sql, values, compile_time, server_time, rows, bytes y explain
+#       ([sentencia completa, valores] tal como se ejecuto, None si no admite EXPLAIN: DDL, LOAD, multi-sentencia).
+#       En los modos batch sql es la parte comun sin la lista de valores, explain lleva la sentencia entera.
+#   common.metricas.HistogramaLatencias es un hook con histogramas de latencia por huella.
+#   Sin hooks registrados no se mide nada.
+#   ars.perfilar(login, umbral, muestreo, max_explain, fichero): hook que captura las select/update/delete con
+#       mas de umbral segundos en servidor, con el lugar de llamada, y explica una muestra (EXPLAIN FORMAT=JSON)
+#       en un hilo con su propia conexion. informe() agrupa por huella y marca full_scan, full_index_scan,
+#       filesort y temporary_table; volcar(fichero) lo escribe en JSON, tambien al salir si se indica fichero.
+#
+# Carga masiva:
+#   carga_masiva(datos, conn, tabla, columnas, modo): vuelca un iterable de dicts (o de rows con la lista de
+#       columnas) de una unica tabla a un fichero temporal CSV escrito row a row y lo carga con
+#       LOAD DATA LOCAL INFILE. modo 'IGNORE' (como el INSERT IGNORE de insert) o 'REPLACE'. None, NaN e
+#       infinito se cargan como NULL.
+#   La conexion necesita local_infile, con login en DICT o fichero anadir 'local_infile: true'.
+#
+# Transacciones:
+#   with ars.transaction(conn): las sentencias del bloque comparten transaccion con un unico commit al salir.
+#   Un error en el bloque hace rollback y lanza TransaccionError. Los bloques anidados usan SAVEPOINT,
+#   por lo que un fallo solo deshace el bloque anidado y este puede reintentarse.
+#
+# Pool de conexiones:
+#   PyMySqlArs(pool=True): con conn en DICT o STR/PATH cada llamada toma prestada una conexion del pool
+#       del login (common/pool.py) y la devuelve al terminar, en lugar de abrir una nueva.
+#   pool_min, pool_max, pool_idle, pool_ping: tamano minimo/maximo, segundos libre para cerrar
+#       conexiones sobrantes y segundos libre tras los que se hace ping antes de prestarla.
+#   select(lista, conn, workers=n): ejecuta la lista de selects en paralelo con hasta n conexiones del
+#       pool, manteniendo el orden de entrada; una select con error devuelve False en su posicion.
+#
+# Replicas de lectura:
+#   conn con una topologia {'primary': login, 'replicas': [login, ...]} (DICT o fichero YAML/JSON, cada login
+#       en DICT o ruta a su fichero): select lee de una replica elegida por latencia (de dos al azar la de
+#       menor media movil); insert/update/delete, carga_masiva y transaction() van a la primaria. Las
+#       conexiones salen siempre de los pools de cada login. Una replica que falla al conectar o con un error
+#       de conexion (no los de la sentencia: SQL mal formado, columna desconocida...) se aparta 30 segundos y
+#       sin replicas disponibles se lee de la primaria.
+#   PyMySqlArs(leer_primaria=True): todas las lecturas a la primaria; leer_primaria=n: las lecturas de los
+#       n segundos siguientes a un commit de la instancia, para leer lo recien escrito.
+#
+# Cache de login:
+#   rec_data guarda los ficheros de login ya leidos por ruta resuelta y solo los vuelve a leer si
+#   cambia su mtime o tamano. limpiar_cache_login() vacia la cache.
+#
+# Cache de sentencias:
+#   El texto SQL generado a partir de los dicts se guarda en una cache LRU (common/cache.py) por tipo de
+#   sentencia, tabla, columnas, forma del #where y opciones de la select; un acierto solo enlaza valores.
+#   stats_cache_sentencias() devuelve aciertos, fallos y expulsiones para dimensionarla.
+#
+# Cache de resultados:
+#   PyMySqlArs(cache=CacheResultados(max_bytes, ttl, ttl_tablas)): las selects one/all/int se guardan por
+#       servidor, base de datos y usuario de la conexion, SQL, valores del #where, #dict y #reading_type,
+#       con TTL por tabla (ttl_tablas={'tabla': segundos}) y expulsion LRU al superar max_bytes.
+#       Se devuelven copias, modificarlas no altera la cache.
+#   insert/update/delete/carga_masiva de una #table invalidan las selects que la leen en las instancias que
+#       comparten la cache, de cualquier conexion (p.ej. la misma tabla en todos los shards); las escrituras
+#       de otros clientes solo se ven al caducar el TTL.
+#   Dentro de transaction() y con 'stream' o '#paginate' no se usa la cache.
 #
 #########################################################################################################################
 
 import logging # Log
+import math
+import os
+import re
+import tempfile
+import threading
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from contextlib import contextmanager
 from pathlib import WindowsPath # Path
 
 import pymysql # Conexion sql
 
 from common.archivos import tipo_fichero, leer_yaml, leer_json
+from common.pool import obtener_pool
+from common.topologia import es_topologia, obtener_topologia, error_conexion
+from common.cache import CacheLRU
+from common.metricas import huella, bytes_registros
+from common.perfilador import PerfiladorLento
+from common.columnar import ResultadoColumnar, literales
+from common.preparadas import cursor_preparado, MAX_PREPARADAS
+from common.multisentencia import activar, desactivar, literal, viajes, ejecutar
+from common.seguimiento import FilaSeguida, seguir
+
+
+MAX_PACKET_DEFECTO = 4194304 # max_allowed_packet por defecto de MySQL, se usa si no se puede consultar
+MARGEN_PACKET = 1024 # Bytes reservados para la cabecera del paquete
+BLOQUE_COLUMNAR = 10000 # Rows leidas por trozo al formar un ResultadoColumnar
+CHUNK_STREAM = 1000 # Dicts por trozo al escribir desde un generador
+MAX_SENTENCIAS = 512 # Sentencias compiladas que se mantienen en cache
+BYTES_ROW = 64 # Sobrecoste estimado por row guardada en la cache de resultados
+SIN_CACHE = object() # Marca de fallo en la cache de resultados, None es un resultado valido
+
+
+cache_sentencias = CacheLRU(MAX_SENTENCIAS) # Texto SQL compilado por forma de la sentencia
+
+
+def stats_cache_sentencias():
+    '''Contadores de la cache de sentencias compiladas.
+    salida: hits, misses, evictions, size y max_size. DICT'''
+    
+    return cache_sentencias.stats()
+    
+    
+cache_login = {} # Logins leidos: ruta resuelta -> ((mtime, size), datos)
+cache_login_lock = threading.Lock()
+
+
+def limpiar_cache_login():
+    '''Vaciamos la cache de ficheros de login leidos por rec_data.'''
+    
+    with cache_login_lock:
+        cache_login.clear()
+        
+        
+def es_stream(datos):
+    '''Datos de escritura en un iterable que no es dict, lista ni tupla, p.ej. un generador.
+    salida: True si se deben procesar por trozos. BOOL'''
+    
+    return not isinstance(datos, (dict, list, tuple, str, bytes)) and hasattr(datos, '__iter__')
+    
+    
+def trozos(datos, chunk):
+    '''Generador de listas de hasta chunk elementos de un iterable.'''
+    
+    iterador = iter(datos)
+    
+    while True:
+        trozo = list(islice(iterador, chunk))
+        
+        if not trozo:
+            return
+            
+        yield trozo
+        
+        
+def tablas_sql(table):
+    '''Nombres que aparecen en un #table, con joins o esquema cada uno por separado.
+    table: Valor de #table. STR
+    salida: Nombres para la invalidacion de la cache de resultados. TUPLE'''
+    
+    return tuple(sorted(set(re.findall(r"[\w$]+", table))))
+    
+    
+def identidad_conn(conn):
+    '''Servidor, puerto, base de datos y usuario de una conexion, para que la cache de resultados no mezcle
+    selects iguales de logins o shards distintos que la comparten.
+    salida: Identidad hashable de la conexion. TUPLE'''
+    
+    if isinstance(conn, pymysql.connections.Connection):
+        return (conn.host, conn.port, conn.db, conn.user)
+        
+    return (type(conn).__name__, id(conn)) # Otras conexiones (p.ej. falsas), la propia conexion
+    
+    
+        
+class TransaccionError(pymysql.Error):
+    '''Alguna sentencia de un bloque transaction() ha fallado y el bloque se ha deshecho.'''
+
+
+class LecturaStream:
+
+    '''Iterador sobre un cursor sin buffer, de rows o de trozos de rows de tamano fijo.
+    Al agotarse, cerrarse con close() o salir del with se cierra el cursor y se libera la conexion.'''
+
+
+    def __init__(self, cursor, chunk=None, al_cerrar=None):
+        
+        self.logger = logging.getLogger(__name__)
+        self.cursor = cursor
+        self.chunk = chunk
+        self.al_cerrar = al_cerrar # Funcion a llamar al cerrar, p.ej. devolver la conexion al pool
+        self.error = False # True si la lectura se ha cortado por un error
+        
+        
+    def __iter__(self):
+        
+        return self
+        
+        
+    def __next__(self):
+        
+        if self.cursor is None:
+            raise StopIteration
+            
+        try:
+            if self.chunk:
+                salida = self.cursor.fetchmany(self.chunk)
+            else:
+                salida = self.cursor.fetchone()
+                
+        except pymysql.Error:
+            self.logger.exception("LecturaStream")
+            self.error = True
+            salida = None
+            
+        if not salida:
+            self.close()
+            raise StopIteration
+            
+        return salida
+        
+        
+    def close(self):
+        '''Cerramos el cursor, descartando las rows pendientes para dejar la conexion utilizable.'''
+        
+        cursor, self.cursor = self.cursor, None
+        
+        if cursor is not None:
+            try:
+                cursor.close()
+            except pymysql.Error:
+                self.logger.exception("LecturaStream: close")
+                
+            if self.al_cerrar is not None:
+                self.al_cerrar()
+                
+                
+    def __enter__(self):
+        
+        return self
+        
+        
+    def __exit__(self, *args):
+        
+        self.close()
+        
+        
+    def __del__(self):
+        
+        self.close()
+        
+        
+class Paginador:
+
+    '''Iterador perezoso de paginas de una select por clave (keyset), una consulta corta por pagina.
+    token: ultimo valor de la clave leido, para reanudar la paginacion en otra select.
+    error: True si la paginacion se ha cortado por un error (sentencia, conexion o clave sin valor) y no
+    por agotar las rows; token queda en la ultima pagina leida para reanudar.'''
+
+
+    def __init__(self, ars, conn, pool, select, where_values, format_dict, clave, size, token=None):
+        
+        self.ars = ars
+        self.conn = conn # Conexion fija o None si se toma prestada del pool en cada pagina
+        self.pool = pool
+        self.select = select # (column, table, where_keys o None)
+        self.where_values = where_values
+        self.format_dict = format_dict
+        self.clave = clave
+        self.size = int(size)
+        self.token = token
+        self.fin = False
+        self.error = False
+        
+        
+    def __iter__(self):
+        
+        return self
+        
+        
+    def sentencia(self):
+        '''salida: [SELECT de la siguiente pagina, valores]. LIST'''
+        
+        column, table, where_keys = self.select
+        SELECT = self.ars.mold_pagina(column, table, where_keys, self.clave, self.size, self.token is not None)
+        
+        if self.token is None:
+            return [SELECT, self.where_values]
+        else:
+            return [SELECT, self.where_values + [self.token]]
+            
+            
+    def __next__(self):
+        
+        if self.fin:
+            raise StopIteration
+            
+        SELECT, valores = self.sentencia()
+        conn = self.conn if self.pool is None else self.pool.prestar()
+        
+        if conn is None:
+            self.ars.logger.error("Paginador: sin conexion para la pagina tras %s", self.token)
+            self.cortar()
+            
+        try:
+            filas, ultimo = self.ars.ejecutar_pagina(conn, SELECT, valores, self.format_dict, self.clave)
+        finally:
+            if self.pool is not None:
+                self.pool.devolver(conn)
+                
+        if filas is None or (filas and ultimo is None):
+            self.ars.logger.error("Paginador: pagina tras %s con error", self.token)
+            self.cortar()
+            
+        if not filas:
+            self.fin = True
+            raise StopIteration
+            
+        if len(filas) < self.size:
+            self.fin = True
+            
+        self.token = ultimo
+        
+        return filas
+        
+        
+    def cortar(self):
+        '''Terminamos la paginacion por un error, distinguible del final de las rows por error.'''
+        
+        self.error = True
+        self.fin = True
+        
+        raise StopIteration
+        
+        
+def columnas_select(column):
+    '''Nombres con los que aparecen en las rows las columnas de un #column: el alias o la columna sin tabla.
+    salida: Nombres o None con '*'. SET o NONE'''
+    
+    if column.strip() == "*":
+        return None
+        
+    return {parte.split()[-1].split('.')[-1].strip('`') for parte in column.split(',') if parte.strip()}
+    
+    
+class Pipeline:
+
+    '''Cola de insert/update/delete compilados que se envian en multi-sentencia, en el menor numero de
+    viajes al servidor. Dentro de un bloque transaction() el envio forma parte de la transaccion; fuera
+    de el es atomico por si mismo: commit si todas las sentencias van bien y rollback si alguna falla.
+    errores: [(posicion, error)] de la sentencia que fallo en el ultimo envio.'''
+
 
+    def __init__(self, ars, conn=None):
+        
+        self.ars = ars
+        self.conn = conn # Conexion del envio, None para la de ars (p.ej. la del bloque transaction())
+        self.compilador = PyMySqlArs() # Compila con conn=False sin tocar el estado de ars
+        self.sentencias = [] # [SQL, valores] encolados
+        self.tablas = set() # #table encoladas, se invalidan en la cache de resultados al enviar
+        self.seguidas = [] # FilaSeguida encoladas, se confirman si el envio va bien
+        self.errores = []
+        
+        
+    def __len__(self):
+        
+        return len(self.sentencias)
+        
+        
+    def __enter__(self):
+        
+        return self
+        
+        
+    def __exit__(self, tipo, *args):
+        
+        if tipo is None:
+            self.enviar()
+        else:
+            self.limpiar()
+            
+            
+    def insert(self, datos, batch=False):
+        '''Encolamos el insert de un dict, lista o iterable de ellos. batch: INSERT multi-row. BOOL
+        salida: Sentencias encoladas o False si no se pueden compilar. INT o FALSE'''
+        
+        return self.encolar('insert', datos, batch=batch)
+        
+        
+    def update(self, datos, batch=None):
+        '''Encolamos el update de un dict, lista o iterable de ellos. batch: 'join'. STR
+        El upsert no se admite: compilado con conn=False no comprueba la clave unica de las columnas de #where.
+        salida: Sentencias encoladas o False si no se pueden compilar. INT o FALSE'''
+        
+        if batch == 'upsert':
+            self.ars.logger.error("Pipeline: batch='upsert' no admitido, usar update(..., batch='upsert') con conexion")
+            return False
+            
+        return self.encolar('update', datos, batch=batch)
+        
+        
+    def delete(self, datos, batch=False):
+        '''Encolamos el delete de un dict, lista o iterable de ellos. batch: DELETE ... IN (...). BOOL
+        salida: Sentencias encoladas o False si no se pueden compilar. INT o FALSE'''
+        
+        return self.encolar('delete', datos, batch=batch)
+        
+        
+    def encolar(self, tipo, datos, **opciones):
+        '''Compilamos los datos con conn=False y anadimos sus sentencias a la cola, todas o ninguna.'''
+        
+        tablas = set()
+        
+        if es_stream(datos):
+            datos = self.con_tablas(datos, tablas)
+        else:
+            tablas = self.ars.tablas_datos(datos)
+            
+        sentencias = getattr(self.compilador, tipo)(datos, conn=False, **opciones)
+        
+        if es_stream(sentencias):
+            sentencias = list(sentencias)
+        elif sentencias and type(sentencias[0]) is str:
+            sentencias = [sentencias] # Un unico dict
+            
+        if sentencias in [False, None] or None in sentencias or False in sentencias:
+            self.ars.logger.error('Pipeline: %s con error, no se encola', tipo)
+            return False
+            
+        self.sentencias.extend(sentencias)
+        self.tablas |= tablas
+        
+        if type(datos) is FilaSeguida:
+            self.seguidas.append(datos)
+        elif type(datos) in [list, tuple]:
+            self.seguidas.extend(d for d in datos if type(d) is FilaSeguida)
+        
+        return len(sentencias)
+        
+        
+    def con_tablas(self, datos, tablas):
+        '''Generador de los dicts de un iterable que anota su #table en tablas.'''
+        
+        for d in datos:
+            if type(d) is dict and d.get('#table'):
+                tablas.add(d['#table'])
+                
+            yield d
+            
+            
+    def enviar(self):
+        '''Enviamos las sentencias encoladas troceadas por max_allowed_packet, un viaje por trozo.
+        El servidor se detiene en la primera que falla y no se envian los trozos siguientes.
+        salida: rows afectadas por sentencia en orden de la cola, False en la que falla y None en las
+        no ejecutadas; False si falla la conexion. LIST o FALSE'''
+        
+        ars = self.ars
+        sentencias, self.sentencias = self.sentencias, []
+        tablas, self.tablas = self.tablas, set()
+        seguidas, self.seguidas = self.seguidas, []
+        salida = [None] * len(sentencias)
+        self.errores = []
+        
+        if not sentencias:
+            return salida
+            
+        ars.no_conn = False
+        activado = False
+        
+        try:
+            if self.conn is not None:
+                ars.check_conn(self.conn)
+                
+            activado = activar(ars.conn)
+            textos = [literal(ars.conn, SQL, valores) for SQL, valores in sentencias]
+            
+            for inicio, grupo in viajes(textos, ars.max_packet() - MARGEN_PACKET):
+                t_viaje = time.perf_counter() if ars.hooks else None
+                rows, error = ejecutar(ars.conn, grupo)
+                salida[inicio:inicio + len(rows)] = rows
+                
+                if ars.hooks:
+                    ars.table, ars.t_compilacion = None, 0.0
+                    plantillas = '; '.join(s[0] for s in sentencias[inicio:inicio + len(grupo)])
+                    ars.emitir('pipeline', plantillas, None, time.perf_counter() - t_viaje, sum(rows),
+                               explain=False)
+                    
+                if error is not None:
+                    posicion = inicio + len(rows)
+                    salida[posicion] = False
+                    self.errores.append((posicion, error))
+                    ars.logger.error("Pipeline: sentencia %s (%s): %s", posicion, sentencias[posicion][0], error)
+                    break
+                    
+            if not self.errores:
+                ars.commit()
+                ars.confirmar_seguidas(seguidas)
+            elif ars.nivel_transaccion:
+                ars.marcar_fallo()
+            else:
+                ars.deshacer(0, None)
+                
+        except (pymysql.Error, AttributeError):
+            ars.logger.exception("Pipeline: enviar")
+            
+            if ars.nivel_transaccion:
+                ars.marcar_fallo()
+            elif ars.conn is not None:
+                ars.deshacer(0, None)
+                
+            salida = False
+        else:
+            ars.logger.info("Pipeline ok: %s sentencias", len(sentencias))
+        finally:
+            if activado:
+                desactivar(ars.conn) # Antes de devolverla al pool
+                
+            ars.invalidar(tablas)
+            ars.devolver_conn()
+            
+        return salida
+        
+        
+    def limpiar(self):
+        '''Descartamos las sentencias encoladas sin enviarlas.'''
+        
+        self.sentencias = []
+        self.tablas = set()
+        self.seguidas = []
+        
+        
 
 # Gestion de conexion con sql a traves de dict para su conversion a SQL
 class PyMySqlArs:
@@ -48,10 +631,30 @@ class PyMySqlArs:
     '''Management of connection with sql through dict for its conversion to SQL.'''
 
  
-    def __init__(self):
+    def __init__(self, pool=False, pool_min=1, pool_max=10, pool_idle=300, pool_ping=30, cache=None, preparadas=False,
+                 leer_primaria=False):
         
         self.logger = logging.getLogger(__name__)
         self.conn = None
+        self.pool = pool
+        self.preparadas = MAX_PREPARADAS if preparadas is True else preparadas # Sentencias preparadas por conexion
+        self.cache = cache # CacheResultados de las selects, None sin cache
+        self.tablas_transaccion = set() # Tablas escritas en el bloque transaction() en curso
+        self.seguidas_transaccion = [] # (nivel, FilaSeguida) escritas en el bloque, se confirman en el commit
+        self.leer_primaria = leer_primaria # Con topologia: True o segundos tras el ultimo commit leyendo de la primaria
+        self.ultimo_commit = None # Instante del ultimo commit de esta instancia
+        self.replica = None # (topologia, indice) de la replica de la select en curso
+        self.fallo_conexion = False # La select en curso ha fallado por la conexion, no por la sentencia
+        self.pool_config = {'min_size': pool_min, 'max_size': pool_max,
+                            'idle_timeout': pool_idle, 'ping_idle': pool_ping}
+        self.prestamo = None # (pool, conexion anterior) de la conexion prestada en curso
+        self.lectura = [False, "one", "1", None] # [format_dict, read, many, chunk] de la ultima select
+        self.hooks = [] # Callbacks de metricas por sentencia
+        self.table = None
+        self.t_compilacion = 0.0 # Segundos de la ultima traduccion dict-SQL, solo con hooks
+        self.max_packet_conn = (None, None) # (conn, max_allowed_packet) consultado
+        self.nivel_transaccion = 0 # Bloques transaction() abiertos
+        self.fallo_transaccion = False # Alguna sentencia del bloque actual ha fallado
         
         
     def conexion(self, login="sql/login/login_sql.yaml"):
@@ -67,11 +670,7 @@ class PyMySqlArs:
                 data = self.rec_data(login)
             
             if data != False:
-                self.conn = pymysql.connect(user = data['user'],
-                                    password = data['password'],
-                                    db = data['db'],
-                                    host = data['host'],
-                                    charset = data['charset'])
+                self.conn = self.nueva_conexion(data)
             else:
                 self.logger.error('conexion: Error in login_sql')
                                     
@@ -84,38 +683,116 @@ class PyMySqlArs:
             return salida
             
             
+    def nueva_conexion(self, data):
+        '''Abrimos una conexion con sql a partir de los datos de login.
+        data: Informacion necesaria para el login. DICT
+        salida: Conexion abierta. OBJ'''
+        
+        return pymysql.connect(user = data['user'],
+                               password = data['password'],
+                               db = data['db'],
+                               host = data['host'],
+                               charset = data['charset'],
+                               local_infile = data.get('local_infile', False))
+                               
+                               
+    def prestar_conn(self, login):
+        '''Tomamos prestada una conexion del pool del login, que se devuelve al terminar la llamada.
+        login: Informacion necesaria para el login. DICT o STR/PATH de un fichero YAML o JSON'''
+        
+        self.devolver_conn()
+        
+        if type(login) is dict:
+            data = login
+        else:
+            data = self.rec_data(login)
+            
+        if data in [False, None]:
+            self.logger.error('prestar_conn: Error in login_sql')
+        else:
+            pool = obtener_pool(data, self.nueva_conexion, **self.pool_config)
+            conn = pool.prestar()
+            
+            if conn is None:
+                self.logger.error('prestar_conn: pool sin conexion disponible')
+            else:
+                self.prestamo = (pool, self.conn)
+                self.conn = conn
+                
+                
+    def devolver_conn(self):
+        '''Devolvemos al pool la conexion prestada, salvo con un bloque transaction() abierto.'''
+        
+        if self.prestamo is not None and self.nivel_transaccion == 0:
+            pool, anterior = self.prestamo
+            self.prestamo = None
+            pool.devolver(self.conn)
+            self.conn = anterior
+            
+            
+    def ceder_conn(self):
+        '''Cedemos la conexion prestada a quien la siga usando tras la llamada, p.ej. un LecturaStream.
+        salida: Funcion que la devuelve al pool o None si no hay prestamo que ceder. CALLABLE o NONE'''
+        
+        if self.prestamo is None or self.nivel_transaccion:
+            return None
+            
+        pool, anterior = self.prestamo
+        conn = self.conn
+        self.prestamo = None
+        self.conn = anterior
+        
+        return lambda: pool.devolver(conn)
+        
+        
     def rec_data(self, login):
         '''Discriminamos si el login nos viene en un dict directamente o en fichero.
         Login: Informacion para el login. STR o PATH de un fichero YAML o JSON
         salida: informacion en formato Dict o False en caso de error. DICT o FALSE/NONE'''
         
         salida = None
+        data = None
         
         try:
             if type(login) is WindowsPath or type(login) is str:
-                tipo = tipo_fichero(login)
+                ruta = os.path.realpath(login)
+                estado = os.stat(ruta)
+                firma = (estado.st_mtime_ns, estado.st_size)
                 
-                if tipo == False:
-                    self.logger.info(f'rec_data: tipo_fichero reporta un error, {tipo}')
-                elif tipo == None:
-                    self.logger.warning(f'rec_data: tipo_fichero reporta un error desconocido, {tipo}')
+                with cache_login_lock:
+                    firma_cache, data_cache = cache_login.get(ruta, (None, None))
+                    
+                if firma_cache == firma:
+                    data = dict(data_cache) # Copia, el llamante puede modificarla
                 else:
-                    if tipo.upper() == '.YAML':
-                        data = leer_yaml(login) # Recuperamos los datos de conexion del fichero de login
-                    elif tipo.upper() == '.JSON':
-                        data = leer_json(login)
+                    tipo = tipo_fichero(login)
+                
+                    if tipo == False:
+                        self.logger.info('rec_data: tipo_fichero reporta un error, %s', tipo)
+                    elif tipo == None:
+                        self.logger.warning('rec_data: tipo_fichero reporta un error desconocido, %s', tipo)
                     else:
-                        self.logger.error('rec_data: Extesion no soportada')
+                        if tipo.upper() == '.YAML':
+                            data = leer_yaml(login) # Recuperamos los datos de conexion del fichero de login
+                        elif tipo.upper() == '.JSON':
+                            data = leer_json(login)
+                        else:
+                            self.logger.error('rec_data: Extesion no soportada')
                           
             else:
                 self.logger.error('rec_data: Tipo de fichero no reconocido')
                 
-        except (ValueError, AttributeError, TypeError):
+        except (ValueError, AttributeError, TypeError, OSError):
             self.logger.exception("rec_data")
             salida = False
         else:
             if type(data) is dict:
                 self.logger.info('rec_data: Recuperados datos login sql')
+                
+                if firma_cache != firma:
+                    with cache_login_lock:
+                        cache_login[ruta] = (firma, dict(data))
+                        
                 salida = data
             else:
                 self.logger.error('rec_data: Datos recuperados no en formato Dict')
@@ -132,6 +809,10 @@ class PyMySqlArs:
         salida = None
         
         try:
+            if type(datos) is FilaSeguida or (type(datos) in [list, tuple] and
+                                               any(type(d) is FilaSeguida for d in datos)):
+                raise ValueError("tratar_datos: las filas de #track solo se pueden escribir con update")
+                
             if type(datos) is list or type(datos) is tuple:
                 datos_temp = []
                 for d in datos:
@@ -142,7 +823,7 @@ class PyMySqlArs:
                         else:
                             self.logger.warning('tratar_datos: tratar_dict reporta error')
                     else:
-                        self.logger.warning(f'tratar_datos: Informacion no en formato dict {d}')
+                        self.logger.warning('tratar_datos: Informacion no en formato dict %s', d)
                         
                 salida = datos_temp
                     
@@ -171,8 +852,6 @@ class PyMySqlArs:
         dict_salida = {}
         cabecera_temp = []
         values_temp = []
-        where_value = []
-        where = ''
         
         try:
             for key, value in datos_dict.items():
@@ -181,16 +860,7 @@ class PyMySqlArs:
                     table_exists = True
                     
                 elif key == "#where" and value != "":
-                    for k,v in value.items():
-                        if len(v) == 3:
-                            where += f"{k} {v[0]} %s {v[2]} "
-                        elif len(v) == 1:
-                            where += f"{k} {v[0]}"
-                        else:
-                            where += f"{k} {v[0]} %s"
-                            
-                        where_value.append(v[1])
-                        
+                    where, where_value = self.compilar_where(value)
                     dict_salida.update({key: [where, where_value]})
                 else:
                     cabecera_temp.append(key)
@@ -206,15 +876,117 @@ class PyMySqlArs:
             elif table_exists and cabecera_temp == [] and values_temp == []:
                 salida = dict_salida # El delete no necesita column
             else:
-                self.logger.error(f"tratar_dict: no table;{datos_dict}")
+                self.logger.error("tratar_dict: no table;%s", datos_dict)
         finally:
             return salida
 
 
-    def check_conn(self, conn):
-        '''conn: False para solo recibir el update listo para ejecucion.'''
+    def compilar_where(self, where_dict, tipo="dict"):
+        '''Texto SQL del #where a partir de su forma (columnas, comparadores y relaciones), cacheado.
+        where_dict: Condiciones en formato {'column': ['comparador', 'valor', 'relacion']}. DICT
+        tipo: 'dict' para update/delete o 'select' para la select. STR
+        salida: [texto del where, valores a enlazar]. LIST'''
+        
+        forma = tuple((k, len(v), v[0], v[2] if len(v) == 3 else None) for k, v in where_dict.items())
+        clave = ('where', tipo, forma)
+        where = cache_sentencias.get(clave)
+        
+        if where is None:
+            partes = []
+            
+            for k, largo, comparador, relacion in forma:
+                if largo == 3:
+                    partes.append(f"{k} {comparador} %s {relacion}")
+                elif largo == 1:
+                    partes.append(f"{k} {comparador}")
+                else:
+                    partes.append(f"{k} {comparador} %s")
+                    
+            if tipo == "select":
+                where = ' '.join(partes)
+            else:
+                where = ''.join(p + ' ' if f[1] == 3 else p for p, f in zip(partes, forma))
+                
+            cache_sentencias.set(clave, where)
+            
+        return [where, [v[1] for v in where_dict.values() if len(v) > 1]]
+        
+        
+    def topologia(self, conn):
+        '''Salida: Topologia del login si conn describe primaria y replicas, si no None. Topologia o NONE'''
+        
+        if type(conn) is dict:
+            data = conn
+        elif type(conn) is WindowsPath or type(conn) is str:
+            data = self.rec_data(conn)
+        else:
+            return None
+            
+        return obtener_topologia(data, self.rec_data) if es_topologia(data) else None
+        
+        
+    def conectar_topologia(self, topologia, lectura):
+        '''Tomamos prestada una conexion de la replica elegida por latencia o de la primaria.
+        Las escrituras, las transacciones y las lecturas con leer_primaria van a la primaria;
+        si ninguna replica conecta se lee tambien de la primaria.'''
+        
+        if self.leer_primaria is True:
+            fijada = True
+        elif self.leer_primaria and self.ultimo_commit is not None:
+            fijada = time.monotonic() - self.ultimo_commit < self.leer_primaria
+        else:
+            fijada = False
+            
+        if lectura and not fijada:
+            for indice in topologia.orden():
+                self.prestar_conn(topologia.replicas[indice])
+                
+                if self.prestamo is not None:
+                    self.replica = (topologia, indice)
+                    return
+                    
+                topologia.fallo(indice)
+                
+            if topologia.replicas:
+                self.logger.warning('conectar_topologia: sin replicas disponibles, se lee de la primaria')
+                
+        self.prestar_conn(topologia.primaria)
+        
+        
+    def usa_pool(self, conn):
+        '''Salida: True si las llamadas con este conn toman prestada su conexion de un pool. BOOL'''
+        
+        return (type(conn) in [dict, WindowsPath, str]) and bool(self.pool or self.topologia(conn) is not None)
+        
+        
+    def cursor(self, clase=pymysql.cursors.Cursor, conn=None):
+        '''Cursor para ejecutar una sentencia, con sentencias preparadas en servidor si estan activas.
+        clase: Cursor o DictCursor de pymysql. CLASS
+        conn: Conexion del cursor, por defecto la de la instancia. OBJ'''
+        
+        conn = self.conn if conn is None else conn
+        
+        if self.preparadas and isinstance(conn, pymysql.connections.Connection):
+            return cursor_preparado(conn, clase is pymysql.cursors.DictCursor, self.preparadas)
+            
+        return conn.cursor(clase)
+        
+        
+    def check_conn(self, conn, lectura=False):
+        '''conn: False para solo recibir el update listo para ejecucion.
+        Dentro de un bloque transaction() se mantiene la conexion de la transaccion.
+        lectura: True desde select, con una topologia se lee de una replica. BOOL'''
+
+        topologia = None if self.nivel_transaccion else self.topologia(conn)
 
-        if type(conn) is dict or type(conn) is WindowsPath or type(conn) is str:
+        if conn is not False and self.nivel_transaccion:
+            if not type(conn) in [dict, WindowsPath, str] and conn is not self.conn:
+                self.logger.warning('check_conn: transaccion en curso, se mantiene su conexion')
+        elif topologia is not None:
+            self.conectar_topologia(topologia, lectura)
+        elif (type(conn) is dict or type(conn) is WindowsPath or type(conn) is str) and self.pool:
+            self.prestar_conn(conn)
+        elif type(conn) is dict or type(conn) is WindowsPath or type(conn) is str:
             self.conexion(conn)
         elif conn == False:
             self.no_conn = True
@@ -222,38 +994,258 @@ class PyMySqlArs:
             self.conn = conn
 
             
-    def update(self, datos, conn=None):
-        '''Recivimos los datos a updatear, los tratamos y ejecutamos el cursor.
-        datos: un dict o una lista de ellos con la informacion a tratar. DICT o LIST/TUPLA de DICT
+    @contextmanager
+    def transaction(self, conn=None):
+        '''Bloque transaccional, las sentencias comparten transaccion y se hace un unico commit al salir.
+        Los bloques anidados crean un SAVEPOINT y un fallo solo deshace el bloque anidado.
         conn: Conexion previamente establecida o datos para establecer una nueva.
-        conn: False para solo recibir el update listo para ejecucion.
-        OBJ, DICT o STR/PATH de un fichero YAML o JSON. FALSE.'''
+        OBJ, DICT o STR/PATH de un fichero YAML o JSON
+        Lanza TransaccionError si alguna sentencia del bloque falla, tras deshacer el bloque.'''
         
-        salida = None
-        self.no_conn = False
+        if conn != None:
+            self.check_conn(conn)
+            
+        nivel = self.nivel_transaccion
+        fallo_previo = self.fallo_transaccion
+        savepoint = f"ars_sp_{nivel}"
         
-        data = self.tratar_datos(datos)
+        if nivel == 0:
+            self.conn.begin()
+        else:
+            self.ejecutar_control(f"SAVEPOINT {savepoint}")
+            
+        self.nivel_transaccion = nivel + 1
+        self.fallo_transaccion = False
         
         try:
-            if conn != None:
-                self.check_conn(conn)
-                    
-            if not data in [False, None]:
-                if type(data) is list:
-                    salida_update = []
-                    for i in data:
-                        if self.no_conn:
-                            s_update = self.tratar_update(i)
-                            salida_update.append(s_update)
-                        else:
-                            self.tratar_update(i)
-                    
-                elif type(data) is dict:
-                    if self.no_conn:
-                        salida_update = self.tratar_update(data)
-                    else:
-                        self.tratar_update(data)
-                        
+            yield self
+            
+            if self.fallo_transaccion:
+                raise TransaccionError(f"transaction: sentencias con error en el nivel {nivel}")
+            
+            if nivel == 0:
+                self.conn.commit()
+                self.ultimo_commit = time.monotonic()
+                self.invalidar(self.tablas_transaccion) # Por las selects de otros hilos durante el bloque
+                
+                for _, fila in self.seguidas_transaccion:
+                    fila.confirmar()
+            else:
+                self.ejecutar_control(f"RELEASE SAVEPOINT {savepoint}")
+                
+        except BaseException:
+            self.logger.warning("transaction: rollback del nivel %s", nivel)
+            self.deshacer(nivel, savepoint)
+            self.seguidas_transaccion = [(n, f) for n, f in self.seguidas_transaccion if n <= nivel]
+            raise
+        else:
+            self.logger.info("transaction ok: nivel %s", nivel)
+        finally:
+            self.nivel_transaccion = nivel
+            self.fallo_transaccion = fallo_previo
+            
+            if nivel == 0:
+                self.tablas_transaccion = set()
+                self.seguidas_transaccion = []
+                
+            self.devolver_conn()
+            
+            
+    def deshacer(self, nivel, savepoint):
+        '''Rollback de la transaccion completa o hasta el savepoint del bloque anidado.
+        nivel: Nivel del bloque transaction() a deshacer. INT
+        savepoint: Nombre del savepoint del bloque. STR'''
+        
+        try:
+            if nivel == 0:
+                self.conn.rollback()
+            else:
+                self.ejecutar_control(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                
+        except pymysql.Error:
+            self.logger.exception(f"deshacer: nivel {nivel}")
+            
+            
+    def ejecutar_control(self, SQL):
+        '''Ejecutamos una sentencia de control de transaccion, los errores se propagan.
+        SQL: Sentencia sin valores (SAVEPOINT, RELEASE, ROLLBACK TO). STR'''
+        
+        c_control = self.conn.cursor()
+        
+        try:
+            c_control.execute(SQL)
+        finally:
+            c_control.close()
+            
+            
+    def commit(self):
+        '''Commit de la sentencia salvo dentro de un bloque transaction(), que hace uno unico al salir.'''
+        
+        if self.nivel_transaccion == 0:
+            self.conn.commit()
+            self.ultimo_commit = time.monotonic()
+            
+            
+    def marcar_fallo(self):
+        '''Marcamos el bloque transaction() en curso como fallido para deshacerlo al salir.'''
+        
+        if self.nivel_transaccion:
+            self.fallo_transaccion = True
+            
+            
+    def invalidar(self, tablas):
+        '''Invalidamos en la cache de resultados las selects de las tablas escritas.
+        tablas: Valores de #table escritos. ITERABLE[STR]'''
+        
+        if self.cache is None or not tablas or self.no_conn:
+            return
+            
+        for tabla in set(tablas):
+            for nombre in tablas_sql(tabla):
+                self.cache.invalidar(nombre)
+                
+            if self.nivel_transaccion:
+                self.tablas_transaccion.add(tabla)
+                
+                
+    def tablas_datos(self, datos):
+        '''Salida: Valores de #table de un dict o lista de dicts de entrada, y la tabla de las FilaSeguida. SET'''
+        
+        if isinstance(datos, dict):
+            datos = [datos]
+        elif type(datos) not in [list, tuple]:
+            return set()
+            
+        tablas = {d['#table'] for d in datos if type(d) is dict and d.get('#table')}
+        
+        return tablas | {d.tabla for d in datos if type(d) is FilaSeguida}
+        
+        
+    def registrar_hook(self, callback):
+        '''Registramos un callback de metricas, recibe un dict por sentencia ejecutada.
+        callback: Funcion que recibe el evento. CALLABLE'''
+        
+        self.hooks.append(callback)
+        
+        
+    def perfilar(self, login, umbral=0.5, muestreo=1.0, max_explain=3, fichero=None):
+        '''Activamos el perfilador de sentencias lentas (common/perfilador.py) como hook de metricas.
+        login: Conexion aparte para los EXPLAIN. DICT o STR/PATH de un fichero YAML o JSON
+        umbral: Segundos en servidor a partir de los que se captura una sentencia. FLOAT
+        muestreo: Fraccion de las sentencias lentas que se explican. FLOAT
+        max_explain: EXPLAIN por huella como maximo. INT
+        fichero: Ruta donde se vuelca el informe al salir, opcional. STR/PATH
+        salida: El perfilador, con informe() y volcar(). PerfiladorLento'''
+        
+        perfilador = PerfiladorLento(login, umbral, muestreo, max_explain, fichero)
+        self.registrar_hook(perfilador)
+        
+        return perfilador
+        
+        
+    def quitar_hook(self, callback):
+        '''Quitamos un callback de metricas registrado.'''
+        
+        if callback in self.hooks:
+            self.hooks.remove(callback)
+            
+            
+    def pipeline(self, conn=None):
+        '''Pipeline de escrituras: insert/update/delete encolados y enviados en multi-sentencia.
+        conn: Conexion previamente establecida o datos para establecer una nueva, None para la de la
+        instancia o la del bloque transaction() en curso. OBJ, DICT o STR/PATH de un fichero YAML o JSON
+        salida: Pipeline, con enviar() o como with que envia al salir. Pipeline'''
+        
+        return Pipeline(self, conn)
+        
+        
+    def compilado(self, inicio, tabla):
+        '''Guardamos el tiempo de traduccion dict-SQL y la tabla de la sentencia, solo con hooks.'''
+        
+        self.t_compilacion = time.perf_counter() - inicio
+        self.table = tabla
+        
+        
+    def emitir(self, tipo, SQL, valores, duracion, rows, records=None, explain=None):
+        '''Enviamos el evento de una sentencia ejecutada a los hooks registrados.
+        tipo: select, update, insert, delete... STR
+        SQL: Sentencia compilada, recortada en los batch para agrupar por huella. STR
+        duracion: Segundos de ejecucion en servidor. FLOAT
+        rows: rows afectadas o recuperadas. INT
+        records: Registros recuperados para estimar los bytes. LIST o NONE
+        explain: [sentencia ejecutada, valores] si SQL esta recortada, False si no admite EXPLAIN;
+        por defecto [SQL, valores]. LIST o FALSE'''
+        
+        evento = {'kind': tipo,
+                  'table': self.table,
+                  'fingerprint': huella(SQL),
+                  'sql': SQL,
+                  'values': valores,
+                  'compile_time': self.t_compilacion,
+                  'server_time': duracion,
+                  'rows': rows,
+                  'bytes': bytes_registros(records),
+                  'explain': [SQL, valores] if explain is None else (explain or None)}
+                  
+        for hook in list(self.hooks):
+            try:
+                hook(evento)
+            except Exception:
+                self.logger.exception("emitir: hook %s", hook)
+                
+                
+    def update(self, datos, conn=None, batch=None, chunk=CHUNK_STREAM):
+        '''Recivimos los datos a updatear, los tratamos y ejecutamos el cursor.
+        datos: un dict o una lista de ellos con la informacion a tratar. DICT o LIST/TUPLA de DICT
+        datos: o un generador/iterable de dicts, que se procesa por trozos de chunk. ITERABLE
+        conn: Conexion previamente establecida o datos para establecer una nueva.
+        conn: False para solo recibir el update listo para ejecucion.
+        OBJ, DICT o STR/PATH de un fichero YAML o JSON. FALSE.
+        batch: Con una lista homogenea, 'upsert' (#where sobre clave unica) o 'join' para aplicarla
+        por conjuntos en trozos. salida: rows afectadas por trozo. STR'''
+        
+        if es_stream(datos):
+            return self.escribir_stream(self.update, datos, conn, chunk, batch=batch)
+            
+        if type(datos) is FilaSeguida or (type(datos) in [list, tuple] and
+                                           any(type(d) is FilaSeguida for d in datos)):
+            return self.update_seguidas(datos, conn, batch)
+            
+        salida = None
+        self.no_conn = False
+        forma = None
+        
+        if batch and type(datos) in [list, tuple]:
+            forma = self.forma_bulk(datos)
+            
+            if forma is None:
+                self.logger.warning('update: lista no homogenea para batch, se ejecuta dict a dict')
+                
+        data = self.tratar_datos(datos) if forma is None else None
+        
+        try:
+            if conn != None:
+                self.check_conn(conn)
+                    
+            if forma is not None:
+                salida_update = self.tratar_update_bulk(datos, forma, batch)
+                
+            elif not data in [False, None]:
+                if type(data) is list:
+                    salida_update = []
+                    for i in data:
+                        if self.no_conn:
+                            s_update = self.tratar_update(i)
+                            salida_update.append(s_update)
+                        else:
+                            self.tratar_update(i)
+                    
+                elif type(data) is dict:
+                    if self.no_conn:
+                        salida_update = self.tratar_update(data)
+                    else:
+                        self.tratar_update(data)
+                        
             else:
                 self.logger.warning('update: tratar_datos reporta error')
                     
@@ -261,177 +1253,893 @@ class PyMySqlArs:
             self.logger.exception("update")
             salida = False
         else:
-            if self.no_conn:
+            if self.no_conn or forma is not None:
                 salida = salida_update
             else:
                 salida = True
         finally:
+            self.invalidar(self.tablas_datos(datos))
+            self.devolver_conn()
             return salida
 
 
+    def update_seguidas(self, datos, conn=None, batch=None):
+        '''Update de filas seguidas (#track): solo las columnas cambiadas y solo las filas con cambios.
+        Con batch las filas se agrupan por tabla y columnas cambiadas y cada grupo va por conjuntos.
+        datos: FilaSeguida o lista con ellas, los dicts normales de la lista se actualizan como en update.
+        salida: True si todo va bien, tambien sin cambios que enviar; con conn=False las sentencias como
+        update, [] sin cambios. BOOL o LIST'''
+        
+        unica = type(datos) is FilaSeguida
+        pares = [(f, f.dict_update()) if type(f) is FilaSeguida else (None, f) for f in ([datos] if unica else datos)]
+        pares = [(f, d) for f, d in pares if d is not None]
+        
+        grupos = {}
+        
+        for f, d in pares:
+            grupos.setdefault(self.forma_bulk([d]) if batch else None, []).append((f, d))
+            
+        if conn is False:
+            if unica and pares:
+                return self.update(pares[0][1], conn=False)
+                
+            sentencias = []
+            
+            for forma, grupo in grupos.items():
+                s_grupo = self.update([d for _, d in grupo], conn=False,
+                                      batch=batch if forma and len(grupo) > 1 else None)
+                sentencias.extend(s_grupo or [])
+                
+            return sentencias
+            
+        if not pares:
+            self.logger.info('update_seguidas: sin cambios, no se envia nada')
+            return True
+            
+        salida = True
+        confirmadas = []
+        self.no_conn = False
+        
+        try:
+            if conn != None:
+                self.check_conn(conn)
+                
+            for forma, grupo in grupos.items():
+                if forma is not None and len(grupo) > 1:
+                    s_bulk = self.tratar_update_bulk([d for _, d in grupo], forma, batch)
+                    correctas = [bool(s_bulk) and False not in s_bulk] * len(grupo)
+                else:
+                    correctas = [self.tratar_update(self.tratar_dict(d)) for _, d in grupo]
+                    
+                for (f, _), correcta in zip(grupo, correctas):
+                    if not correcta:
+                        salida = False
+                    elif f is not None:
+                        confirmadas.append(f)
+                        
+        except (ValueError, AttributeError, TypeError):
+            self.logger.exception("update_seguidas")
+            salida = False
+        finally:
+            self.confirmar_seguidas(confirmadas)
+            self.invalidar({d['#table'] for _, d in pares})
+            self.devolver_conn()
+            return salida
+            
+            
+    def confirmar_seguidas(self, filas):
+        '''Las filas seguidas escritas toman sus valores actuales como originales; dentro de un bloque
+        transaction() al hacer el commit y solo si no se deshace el bloque en el que se escribieron.'''
+        
+        for fila in filas:
+            if self.nivel_transaccion:
+                self.seguidas_transaccion.append((self.nivel_transaccion, fila))
+            else:
+                fila.confirmar()
+                
+                
+    def escribir_stream(self, metodo, datos, conn, chunk, **opciones):
+        '''Escritura de un iterable por trozos de chunk dicts, cada trozo en su bloque transaction().
+        metodo: update, insert o delete. CALLABLE
+        opciones: batch y commit_batch del metodo. DICT
+        salida: Salida de cada trozo, False en el que falla. LIST; con conn=False generador de [SQL, valores]
+        False si no hay conexion para el primer trozo. FALSE'''
+        
+        if conn is False:
+            return self.sentencias_stream(metodo, datos, chunk, opciones)
+            
+        salida = []
+        dentro = self.nivel_transaccion > 0
+        
+        if conn != None and not self.usa_pool(conn):
+            self.check_conn(conn) # Una unica conexion para todos los trozos
+            conn = None
+            
+        for numero, trozo in enumerate(trozos(datos, chunk)):
+            if conn != None:
+                self.check_conn(conn) # Con pool, cada trozo toma prestada su conexion
+                
+            if self.conn is None: # Sin conexion no se abre la transaccion, begin() fallaria sobre None
+                self.logger.error("escribir_stream: sin conexion para el trozo %s", numero)
+                
+                if not salida:
+                    return False
+                    
+                salida.append(False)
+                break
+                
+            try:
+                with self.transaction():
+                    resultado = metodo(trozo, **opciones)
+                    
+                salida.append(resultado) # Tras el commit, un trozo deshecho solo deja su False
+                
+            except (TransaccionError, pymysql.Error):
+                self.logger.exception("escribir_stream: trozo %s deshecho, se detiene", numero)
+                salida.append(False)
+                
+                if dentro:
+                    self.marcar_fallo()
+                    
+                break
+                
+        return salida
+        
+        
+    def sentencias_stream(self, metodo, datos, chunk, opciones):
+        '''Generador de las sentencias [SQL, valores] de un iterable, compiladas trozo a trozo.'''
+        
+        for trozo in trozos(datos, chunk):
+            sentencias = metodo(trozo, conn=False, **opciones)
+            
+            if sentencias in [False, None]:
+                self.logger.warning('sentencias_stream: trozo con error')
+                continue
+                
+            yield from sentencias
+            
+            
+    def forma_bulk(self, datos):
+        '''Comprobamos que la lista es homogenea: misma #table, mismas columnas SET y un #where
+        de igualdades unidas por 'and' sobre las mismas columnas clave.
+        salida: (tabla, columnas SET, columnas clave) o None si no es homogenea. TUPLE o NONE'''
+        
+        forma = None
+        
+        for d in datos:
+            where = d.get('#where') if type(d) is dict else None
+            
+            if not where or '#table' not in d:
+                return None
+                
+            claves = tuple(where.keys())
+            columnas = tuple(k for k in d if k not in ['#table', '#where'])
+            
+            if not columnas:
+                return None
+                
+            for posicion, v in enumerate(where.values()):
+                ultima = posicion == len(claves) - 1
+                
+                if v[0] != '=' or len(v) not in [2, 3] or (len(v) == 3 and (ultima or v[2].lower() != 'and')):
+                    return None
+                    
+            if forma is None:
+                forma = (d['#table'], columnas, claves)
+            elif forma != (d['#table'], columnas, claves):
+                return None
+                
+        return forma
+        
+        
+    def tratar_update_bulk(self, datos, forma, batch):
+        '''Aplicamos una lista homogenea de updates por conjuntos y en trozos.
+        upsert: INSERT ... ON DUPLICATE KEY UPDATE, las columnas del #where deben ser una clave unica.
+        join: tabla temporal con los cambios y UPDATE ... JOIN sobre las columnas del #where, la temporal
+        se elimina al terminar aunque falle alguna sentencia.
+        salida: rows afectadas por trozo, en upsert como las cuenta MySQL (2 por fila actualizada), o
+        [SQL, valores] por sentencia con conn=False. LIST o FALSE'''
+        
+        tabla, columnas, claves = forma
+        filas = [[d['#where'][k][1] for k in claves] + [d[c] for c in columnas] for d in datos]
+        todas = ', '.join(claves + columnas)
+        salida = []
+        temporal = None
+        
+        if batch == "upsert":
+            cabecera = f"INSERT INTO {tabla}({todas}) VALUES "
+            cola = " ON DUPLICATE KEY UPDATE " + ', '.join(f"{c} = VALUES({c})" for c in columnas)
+            sentencias = [[s] for s in self.multifila(cabecera, filas, cola)]
+            
+        elif batch == "join":
+            temporal = 'ars_bulk_' + ''.join(c if c.isalnum() else '_' for c in tabla)
+            on = ' AND '.join(f"t.{k} = s.{k}" for k in claves)
+            update_set = ', '.join(f"t.{c} = s.{c}" for c in columnas)
+            cabecera = f"INSERT INTO {temporal}({todas}) VALUES "
+            sentencias = [[s, [f"UPDATE {tabla} t JOIN {temporal} s ON {on} SET {update_set}", None],
+                           [f"DELETE FROM {temporal}", None]] for s in self.multifila(cabecera, filas)]
+            previas = [[f"DROP TEMPORARY TABLE IF EXISTS {temporal}", None],
+                       [f"CREATE TEMPORARY TABLE {temporal} AS SELECT {todas} FROM {tabla} LIMIT 0", None]]
+            sentencias = [previas] + sentencias
+            
+        else:
+            self.logger.error("tratar_update_bulk: batch no soportado %s", batch)
+            return False
+            
+        if self.no_conn:
+            final = [[f"DROP TEMPORARY TABLE IF EXISTS {temporal}", None]] if temporal else []
+            return [s for grupo in sentencias for s in grupo] + final
+            
+        if batch == "upsert":
+            try:
+                unica = self.clave_unica(tabla, claves)
+                
+            except pymysql.Error:
+                self.logger.exception(f"tratar_update_bulk: claves de {tabla}")
+                self.marcar_fallo()
+                return False
+                
+            if not unica:
+                self.logger.error("tratar_update_bulk: upsert con #where %s que no es una clave unica de %s",
+                                  claves, tabla)
+                return False
+                
+        try:
+            c_update = self.cursor() # Declarramos cursor
+            
+            for grupo in sentencias:
+                afectadas = 0
+                
+                for SQL, valores in grupo:
+                    inicio = time.perf_counter() if self.hooks else None
+                    c_update.execute(SQL, valores)
+                    
+                    if SQL.startswith("INSERT") or SQL.startswith("UPDATE"):
+                        afectadas = c_update.rowcount # En join cuenta el UPDATE, el INSERT es a la temporal
+                        
+                    if self.hooks:
+                        self.table = tabla
+                        self.emitir('update', SQL.split(' VALUES ')[0], None, time.perf_counter() - inicio,
+                                    c_update.rowcount, explain=False) # Tabla temporal de la sesion o DDL
+                        
+                if grupo[0][0].startswith("INSERT"):
+                    self.commit()
+                    salida.append(afectadas)
+                    
+        except pymysql.Error:
+            self.logger.exception(f"tratar_update_bulk: {tabla}")
+            self.marcar_fallo()
+            salida = False
+        else:
+            c_update.close()
+            self.logger.info("tratar_update_bulk ok: %s %s", tabla, salida)
+        finally:
+            if temporal:
+                self.eliminar_temporal(temporal)
+                
+            return salida
+            
+            
+    def clave_unica(self, tabla, claves):
+        '''Comprobamos con SHOW KEYS que las columnas son exactamente la clave primaria o una clave UNIQUE.
+        tabla: Tabla del update. STR
+        claves: Columnas del #where. LIST[STR]
+        salida: True si ON DUPLICATE KEY UPDATE las identifica como el #where. BOOL'''
+        
+        c_claves = self.conn.cursor()
+        c_claves.execute(f"SHOW KEYS FROM {tabla} WHERE Non_unique = 0")
+        indices = {}
+        
+        for fila in c_claves.fetchall():
+            indices.setdefault(fila[2], set()).add(fila[4]) # Key_name, Column_name
+            
+        c_claves.close()
+        
+        return set(claves) in indices.values()
+        
+        
+    def eliminar_temporal(self, temporal):
+        '''Eliminamos la tabla temporal de un update join, para que no quede en la conexion del pool.'''
+        
+        try:
+            c_temporal = self.conn.cursor()
+            c_temporal.execute(f"DROP TEMPORARY TABLE IF EXISTS {temporal}")
+            c_temporal.close()
+            
+        except (pymysql.Error, AttributeError, OSError):
+            self.logger.exception(f"eliminar_temporal: {temporal}")
+            
+            
     def tratar_update(self, data):
         '''Preparamos el UPDATE con los datos del dict entrante.
-        data: Dict tratado y pre-procesado para crear el update. DICT'''
+        data: Dict tratado y pre-procesado para crear el update. DICT
+        salida: [UPDATE, valores] con conn=False o el resultado de ejecutar_update. LIST o BOOL o NONE'''
         
         datos_update = []
         salida = None
+        inicio = time.perf_counter() if self.hooks else None
         
         try:
-            if len(data['#column'][0]) == 1:
-                cabecera = f"{data['#column'][0][0]} = %s"
-            else:
-                cabecera = ' = %s, '.join(data['#column'][0])
-                cabecera += ' = %s'
+            clave = ('update', data['#table'], tuple(data['#column'][0]), data['#where'][0])
+            UPDATE = cache_sentencias.get(clave)
+            
+            if UPDATE is None:
+                if len(data['#column'][0]) == 1:
+                    cabecera = f"{data['#column'][0][0]} = %s"
+                else:
+                    cabecera = ' = %s, '.join(data['#column'][0])
+                    cabecera += ' = %s'
                     
+                UPDATE = f"UPDATE {data['#table']} SET {cabecera} WHERE {data['#where'][0]}"
+                cache_sentencias.set(clave, UPDATE)
+                
             datos_update.extend(data['#column'][1]) # Valores
             datos_update.extend(data['#where'][1])
             
-            UPDATE = f"UPDATE {data['#table']} SET {cabecera} WHERE {data['#where'][0]}"
-            
+            if self.hooks:
+                self.compilado(inicio, data['#table'])
+                
         except (ValueError, AttributeError, TypeError):
             self.logger.exception("tratar_update")
         else:
             if self.no_conn:
                 salida = [UPDATE, datos_update]
             else:
-                self.ejecutar_update(UPDATE, datos_update)
+                salida = self.ejecutar_update(UPDATE, datos_update)
         finally:
-            if self.no_conn:
-                return salida
+            return salida
             
 
     def ejecutar_update(self, UPDATE, datos_update):
         '''UPDATE: Un str con el update en formato sql. STR
-        datos_update: Valores de los campos del update. LIST'''
+        datos_update: Valores de los campos del update. LIST
+        salida: True si se ha ejecutado o None si da error. BOOL o NONE'''
+
+        salida = None
+        
+        try:
+            c_update = self.cursor() # Declarramos cursor
 
+            inicio = time.perf_counter() if self.hooks else None
+            c_update.execute(UPDATE,(datos_update))
+            duracion = time.perf_counter() - inicio if self.hooks else None
+            
+            self.commit()
+            
+        except pymysql.Error:
+            self.logger.exception(f"ejecutar_update: ({UPDATE},({datos_update}))")
+            self.marcar_fallo()
+        else:
+            c_update.close()
+            self.logger.info("ejecutar_update ok: %s", UPDATE)
+            
+            if self.hooks:
+                self.emitir('update', UPDATE, datos_update, duracion, c_update.rowcount)
+            salida = True
+        finally:
+            return salida
+            
+        
+    def insert(self, datos, conn=None, batch=False, commit_batch="chunk", chunk=CHUNK_STREAM):
+        '''Recivimos los datos a insertar, los tratamos y ejecutamos el cursor.
+        datos: un dict o una lista de ellos con la informacion a tratar. DICT o LIST/TUPLA de DICT
+        datos: o un generador/iterable de dicts, que se procesa por trozos de chunk. ITERABLE
+        conn: Conexion previamente establecida o datos para establecer una nueva.
+        conn: False para solo recibir el insert listo para ejecucion.
+        OBJ, DICT o STR/PATH de un fichero YAML o JSON
+        batch: True para agrupar la lista en INSERT multi-row troceados. BOOL
+        commit_batch: 'chunk' un commit por trozo o 'call' uno por llamada. STR'''
+        
+        if es_stream(datos):
+            return self.escribir_stream(self.insert, datos, conn, chunk, batch=batch, commit_batch=commit_batch)
+            
+        salida = None
+        self.no_conn = False
+        
+        data = self.tratar_datos(datos)
+        
+        try:
+            if conn != None:
+                self.check_conn(conn)
+                    
+            if not data in [False, None]:
+                if type(data) is list and batch:
+                    salida_insert = self.tratar_insert_batch(data, commit_batch)
+                    
+                elif type(data) is list:
+                    salida_insert = []
+                    
+                    for i in data:
+                        if self.no_conn:
+                            s_insert = self.tratar_insert(i)
+                            salida_insert.append(s_insert)
+                        else:
+                            self.tratar_insert(i)
+                    
+                elif type(data) is dict: 
+                    if self.no_conn:
+                        salida_insert = self.tratar_insert(data)
+                    else:
+                        self.tratar_insert(data)
+                    
+            else:
+                self.logger.warning('insert: tratar_datos reporta error')
+                    
+        except (ValueError, AttributeError, TypeError):
+            self.logger.exception("insert")
+            salida = False
+        else:
+            if self.no_conn or (batch and type(data) is list):
+                salida = salida_insert
+            else:
+                salida = True
+        finally:
+            self.invalidar(self.tablas_datos(datos))
+            self.devolver_conn()
+            return salida
+            
+            
+    def tratar_insert(self, data):
+        '''Preparamos el INSERT con los datos del dict entrante.
+        data: Dict tratado y pre-procesado para crear el insert. DICT'''
+        
+        datos_insert = []
+        salida = None
+        inicio = time.perf_counter() if self.hooks else None
+        
+        try:
+            clave = ('insert', data['#table'], tuple(data['#column'][0]))
+            INSERT = cache_sentencias.get(clave)
+            
+            if INSERT is None:
+                if len(data['#column'][0]) == 1:
+                    cabecera = data['#column'][0][0]
+                else:
+                    cabecera = ', '.join(data['#column'][0])
+                    
+                var_string = str('%s, ' * len(data['#column'][1]))[:-2]
+                INSERT = f"INSERT IGNORE INTO {data['#table']}({cabecera}) VALUES (%s);" % var_string
+                cache_sentencias.set(clave, INSERT)
+            
+            datos_insert = data['#column'][1][:]
+            
+            if self.hooks:
+                self.compilado(inicio, data['#table'])
+            
+        except (ValueError, AttributeError, TypeError):
+            self.logger.exception("tratar_insert")
+        else:
+            if self.no_conn:
+                salida = [INSERT, datos_insert]
+            else:
+                self.ejecutar_insert(INSERT, datos_insert)
+        finally:
+            if self.no_conn:
+                return salida
+            
+            
+    def ejecutar_insert(self, INSERT, datos_insert):
+        '''INSERT: Un str con el insert en formato sql. STR
+        datos_insert: Valores de los campos del insert. LIST'''
+
+        try:
+            c_insert = self.cursor() # Declarramos cursor 
+
+            inicio = time.perf_counter() if self.hooks else None
+            c_insert.execute(INSERT,(datos_insert))
+            duracion = time.perf_counter() - inicio if self.hooks else None
+            
+            self.commit()
+            
+        except pymysql.Error:
+            self.logger.exception(f"ejecutar_insert: ({INSERT},({datos_insert}))")
+            self.marcar_fallo()
+        else:
+            c_insert.close()
+            self.logger.info("ejecutar_insert ok: %s", INSERT)
+            
+            if self.hooks:
+                self.emitir('insert', INSERT, datos_insert, duracion, c_insert.rowcount)
+            
+            
+    def tratar_insert_batch(self, data, commit_batch="chunk"):
+        '''Agrupamos los dicts pre-procesados por (#table, columnas) y preparamos INSERT multi-row.
+        data: Lista de dicts tratados y pre-procesados. LIST[DICT]
+        commit_batch: 'chunk' un commit por trozo o 'call' uno por llamada. STR
+        salida: rows afectadas por trozo o [SQL, valores] por trozo con conn=False. LIST'''
+        
+        grupos = {}
+        salida = []
+        
+        try:
+            for d in data:
+                clave = (d['#table'], tuple(d['#column'][0]))
+                grupos.setdefault(clave, []).append(d['#column'][1])
+                
+            for (tabla, columnas), filas in grupos.items():
+                INSERT = f"INSERT IGNORE INTO {tabla}({', '.join(columnas)}) VALUES "
+                
+                if self.hooks:
+                    self.table, self.t_compilacion = tabla, 0.0
+                    
+                for sentencia in self.multifila(INSERT, filas):
+                    if self.no_conn:
+                        salida.append(sentencia)
+                    else:
+                        salida.append(self.ejecutar_insert_batch(sentencia[0], commit_batch == "chunk"))
+                        
+            if not self.no_conn and commit_batch == "call":
+                self.commit()
+                
+        except (ValueError, AttributeError, TypeError, KeyError):
+            self.logger.exception("tratar_insert_batch")
+            salida = False
+        except pymysql.Error:
+            self.logger.exception("tratar_insert_batch: commit")
+            self.marcar_fallo()
+            salida = False
+        finally:
+            return salida
+            
+            
+    def insert_columnas(self, datos, conn=None, commit_batch="chunk"):
+        '''Insert multi-row a partir de columnas, sin pasar por un dict por row.
+        datos: {'#table': tabla, 'columna': secuencia o array de numpy, ..., '#null': {'columna': mascara}}. DICT
+        Los literales de las columnas numericas, booleanas y de fechas en numpy se forman en bloque
+        (common/columnar.py); None, NaN, NaT, los valores enmascarados de numpy.ma y #null son NULL.
+        conn: Conexion previamente establecida o datos para establecer una nueva.
+        conn: False para solo recibir los INSERT listos para ejecucion, con los valores ya escapados.
+        OBJ, DICT o STR/PATH de un fichero YAML o JSON
+        commit_batch: 'chunk' un commit por trozo o 'call' uno por llamada. STR
+        salida: rows afectadas por trozo o [SQL, None] por trozo con conn=False, False si da error. LIST o FALSE'''
+        
+        salida = []
+        self.no_conn = False
+        tabla = datos.get('#table') if type(datos) is dict else None
+        inicio = time.perf_counter()
+        
+        try:
+            if conn != None:
+                self.check_conn(conn)
+                
+            columnas = [k for k in datos if not k.startswith('#')]
+            nulos = datos.get('#null') or {}
+            
+            if not tabla or not columnas:
+                raise ValueError("insert_columnas: sin #table o columnas")
+                
+            if len({len(datos[c]) for c in columnas}) != 1:
+                raise ValueError(f"insert_columnas: columnas de distinta longitud en {tabla}")
+                
+            if self.no_conn or self.conn is None:
+                escapar = lambda v: pymysql.converters.escape_item(v, 'utf8')
+            else:
+                escapar = self.conn.escape
+                
+            try:
+                valores = [literales(datos[c], escapar, nulos.get(c)) for c in columnas]
+            except pymysql.err.ProgrammingError as e: # Valor sin literal SQL, error de los datos y no del servidor
+                raise ValueError(f"insert_columnas: valor no admitido en {tabla}: {e}") from e
+                
+            filas = ['(' + ', '.join(fila) + ')' for fila in zip(*valores)]
+            del valores
+            
+            INSERT = f"INSERT IGNORE INTO {tabla}({', '.join(columnas)}) VALUES "
+            
+            if self.hooks:
+                self.table, self.t_compilacion = tabla, time.perf_counter() - inicio
+                
+            for _, trozo in viajes(filas, self.max_packet() - MARGEN_PACKET - len(INSERT.encode())):
+                if self.no_conn:
+                    salida.append([INSERT + ', '.join(trozo), None])
+                else:
+                    salida.append(self.ejecutar_insert_batch(INSERT + ', '.join(trozo), commit_batch == "chunk"))
+                    
+            if not self.no_conn and commit_batch == "call":
+                self.commit()
+                
+        except (ValueError, AttributeError, TypeError, KeyError):
+            self.logger.exception("insert_columnas")
+            salida = False
+        except pymysql.Error:
+            self.logger.exception("insert_columnas: commit")
+            self.marcar_fallo()
+            salida = False
+        finally:
+            self.invalidar([tabla] if tabla else [])
+            self.devolver_conn()
+            return salida
+            
+            
+    def multifila(self, cabecera, filas, cola=""):
+        '''Sentencias multi-row troceadas para no superar el max_allowed_packet.
+        cabecera: Parte de la sentencia hasta VALUES incluido. STR
+        filas: Valores de cada fila. LIST[LIST]
+        cola: Parte de la sentencia tras los VALUES, p.ej. ON DUPLICATE KEY UPDATE. STR
+        salida: Generador de [SQL con %s, valores] con conn=False o [SQL con los valores escapados, None]. LIST'''
+        
+        for trozo, literales in self.trocear_filas(cabecera + cola, filas):
+            if self.no_conn:
+                marcas = '(' + ', '.join(['%s'] * len(trozo[0])) + ')'
+                valores = [v for fila in trozo for v in fila]
+                yield [cabecera + ', '.join([marcas] * len(trozo)) + cola, valores]
+            else:
+                yield [cabecera + ', '.join(literales) + cola, None]
+                
+                
+    def trocear_filas(self, cabecera, filas, escapar=None):
+        '''Repartimos las filas en trozos cuyo SQL no supere el max_allowed_packet. Cada fila se escapa una
+        sola vez: su literal da el tamano y se devuelve para formar la sentencia sin escaparla de nuevo.
+        cabecera: Parte fija de la sentencia que precede a los VALUES. STR
+        filas: Valores de cada fila. LIST[LIST]
+        escapar: Literal SQL de una fila, por defecto escapar_fila. CALLABLE
+        salida: Generador de (trozo de filas, literal de cada una). TUPLE'''
+        
+        escapar = escapar or self.escapar_fila
+        limite = self.max_packet() - MARGEN_PACKET - len(cabecera.encode())
+        trozo = []
+        literales = []
+        tamano = 0
+        
+        for fila in filas:
+            literal_fila = escapar(fila)
+            tamano_fila = len(literal_fila.encode('utf8', 'surrogateescape')) + 2 # ', '
+            
+            if trozo and tamano + tamano_fila > limite:
+                yield trozo, literales
+                trozo = []
+                literales = []
+                tamano = 0
+                
+            trozo.append(fila)
+            literales.append(literal_fila)
+            tamano += tamano_fila
+            
+        if trozo:
+            yield trozo, literales
+            
+            
+    def escapar_fila(self, fila):
+        '''Literal SQL de una fila, con la conexion si existe para respetar su modo de escape.
+        fila: Valores de la fila. LIST
+        salida: Literal de la fila en formato (v1,v2,...). STR'''
+        
+        return self.escapar_valor(tuple(fila))
+        
+        
+    def escapar_valor(self, valor):
+        '''Literal SQL de un valor (una tupla da (v1,v2,...)), con la conexion si existe. STR'''
+        
+        if self.no_conn or self.conn is None:
+            return pymysql.converters.escape_item(valor, 'utf8')
+        else:
+            return self.conn.escape(valor)
+            
+            
+    def max_packet(self):
+        '''Recuperamos el max_allowed_packet del servidor, una sola vez por conexion.
+        salida: Tamano maximo de paquete en bytes. INT'''
+        
+        conn, valor = self.max_packet_conn
+        
+        if self.no_conn or self.conn is None:
+            return MAX_PACKET_DEFECTO
+        elif conn is self.conn:
+            return valor
+        
+        try:
+            c_packet = self.conn.cursor()
+            c_packet.execute("SELECT @@max_allowed_packet")
+            valor = int(c_packet.fetchone()[0])
+            c_packet.close()
+            
+        except (pymysql.Error, ValueError, TypeError):
+            self.logger.exception("max_packet")
+            valor = MAX_PACKET_DEFECTO
+            
+        self.max_packet_conn = (self.conn, valor)
+        
+        return valor
+        
+        
+    def ejecutar_insert_batch(self, INSERT, commit=True):
+        '''INSERT: Un str con el insert multi-row con los valores ya escapados. STR
+        commit: True para hacer commit tras el trozo. BOOL
+        salida: rows afectadas por el trozo o False si da error. INT o FALSE'''
+        
+        salida = None
+        
         try:
-            c_update = self.conn.cursor() # Declarramos cursor
-
-            c_update.execute(UPDATE,(datos_update))
+            c_insert = self.conn.cursor() # Declarramos cursor 
             
-            self.conn.commit()
+            inicio = time.perf_counter() if self.hooks else None
+            c_insert.execute(INSERT)
+            duracion = time.perf_counter() - inicio if self.hooks else None
+            salida = c_insert.rowcount
             
+            if commit:
+                self.commit()
+                
         except pymysql.Error:
-            self.logger.exception(f"ejecutar_update: ({UPDATE},({datos_update}))")   
+            self.logger.exception(f"ejecutar_insert_batch: {INSERT[:200]}")
+            self.marcar_fallo()
+            salida = False
         else:
-            c_update.close()
-            self.logger.info(f"ejecutar_update ok: {UPDATE}")
+            c_insert.close()
+            self.logger.info("ejecutar_insert_batch ok: %s rows", salida)
             
-        
-    def insert(self, datos, conn=None):
-        '''Recivimos los datos a insertar, los tratamos y ejecutamos el cursor.
-        datos: un dict o una lista de ellos con la informacion a tratar. DICT o LIST/TUPLA de DICT
+            if self.hooks:
+                self.emitir('insert', INSERT[:INSERT.index(' VALUES ')], None, duracion, salida,
+                            explain=[INSERT, None])
+        finally:
+            return salida
+            
+            
+    def carga_masiva(self, datos, conn=None, tabla=None, columnas=None, modo="IGNORE"):
+        '''Cargamos un iterable de rows de una tabla con LOAD DATA LOCAL INFILE.
+        datos: Iterable de dicts con #table o de rows (LIST/TUPLA) con columnas. ITERABLE
         conn: Conexion previamente establecida o datos para establecer una nueva.
-        conn: False para solo recibir el insert listo para ejecucion.
-        OBJ, DICT o STR/PATH de un fichero YAML o JSON'''
+        conn: False para solo recibir el LOAD DATA listo para ejecucion, sin generar el fichero.
+        OBJ, DICT o STR/PATH de un fichero YAML o JSON. FALSE.
+        tabla: Tabla destino, por defecto el #table del primer dict. STR
+        columnas: Columnas de las rows, por defecto las claves del primer dict. LIST
+        modo: 'IGNORE' o 'REPLACE' para las claves duplicadas. STR
+        salida: rows cargadas o False si da error, [SQL, [fichero]] con conn=False. INT o FALSE o LIST'''
         
         salida = None
         self.no_conn = False
-        
-        data = self.tratar_datos(datos)
+        fichero = None
+        filas = iter(datos)
         
         try:
             if conn != None:
                 self.check_conn(conn)
+                
+            if modo.upper() not in ["IGNORE", "REPLACE"]:
+                raise ValueError(f"modo no soportado {modo}")
+                
+            primera = next(filas, None)
+            
+            if type(primera) is dict:
+                tabla = tabla or primera['#table']
+                columnas = columnas or [k for k in primera if not k.startswith('#')]
+                
+            if primera is None or not tabla or not columnas:
+                raise ValueError("carga_masiva: sin datos, tabla o columnas")
+                
+            LOAD = (f"LOAD DATA LOCAL INFILE %s {modo.upper()} INTO TABLE {tabla} CHARACTER SET utf8mb4 "
+                    "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+                    f"LINES TERMINATED BY '\\n' ({', '.join(columnas)})")
                     
-            if not data in [False, None]:
-                if type(data) is list:
-                    salida_insert = []
-                    
-                    for i in data:
-                        if self.no_conn:
-                            s_insert = self.tratar_insert(i)
-                            salida_insert.append(s_insert)
-                        else:
-                            self.tratar_insert(i)
-                    
-                elif type(data) is dict: 
-                    if self.no_conn:
-                        salida_insert = self.tratar_insert(data)
-                    else:
-                        self.tratar_insert(data)
-                    
+            if self.no_conn:
+                salida = [LOAD, ['fichero']]
             else:
-                self.logger.warning('insert: tratar_datos reporta error')
+                with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+                    fichero = f.name
                     
-        except (ValueError, AttributeError, TypeError):
-            self.logger.exception("insert")
+                    f.write(self.linea_csv(primera, columnas))
+                    
+                    for fila in filas:
+                        f.write(self.linea_csv(fila, columnas))
+                        
+                salida = self.ejecutar_carga(LOAD, fichero)
+                
+        except (ValueError, AttributeError, TypeError, KeyError, OSError):
+            self.logger.exception("carga_masiva")
             salida = False
-        else:
-            if self.no_conn:
-                salida = salida_insert
-            else:
-                salida = True
         finally:
+            if fichero is not None:
+                try:
+                    os.remove(fichero)
+                except OSError: # El fichero temporal no debe cambiar la salida de la carga
+                    self.logger.exception(f"carga_masiva: no se pudo borrar {fichero}")
+                    
+            self.invalidar([tabla] if tabla else [])
+            self.devolver_conn()
             return salida
             
             
-    def tratar_insert(self, data):
-        '''Preparamos el INSERT con los datos del dict entrante.
-        data: Dict tratado y pre-procesado para crear el insert. DICT'''
+    def linea_csv(self, fila, columnas):
+        '''Linea CSV escapada para LOAD DATA de una row.
+        fila: Row en DICT o LIST/TUPLA en el orden de columnas. DICT o LIST
+        salida: Linea terminada en salto de linea. BYTES'''
         
-        datos_insert = []
-        salida = None
-        
-        try:
-            if len(data['#column'][0]) == 1:
-                cabecera = data['#column'][0][0]
-            else:
-                cabecera = ', '.join(data['#column'][0])
-                
-            var_string = str('%s, ' * len(data['#column'][1]))[:-2]
-            INSERT = f"INSERT IGNORE INTO {data['#table']}({cabecera}) VALUES (%s);" % var_string
-            
-            datos_insert = data['#column'][1][:]
+        if type(fila) is dict:
+            fila = [fila[c] for c in columnas]
             
-        except (ValueError, AttributeError, TypeError):
-            self.logger.exception("tratar_insert")
+        return b','.join([self.campo_csv(v) for v in fila]) + b'\n'
+        
+        
+    def campo_csv(self, valor):
+        '''Campo CSV escapado para LOAD DATA: NULL como \\N, textos entre comillas con \\ como escape.
+        NaN e infinito, que MySQL no admite, tambien como \\N.
+        salida: Campo codificado en utf8. BYTES'''
+        
+        if valor is None or (type(valor) is float and not math.isfinite(valor)):
+            return b'\\N'
+        elif valor is True or valor is False:
+            return b'1' if valor else b'0'
+        elif type(valor) is int or type(valor) is float:
+            return repr(valor).encode()
+        elif type(valor) is bytes or type(valor) is bytearray:
+            texto = bytes(valor)
+        elif isinstance(valor, datetime.datetime):
+            texto = valor.isoformat(sep=' ').encode()
         else:
-            if self.no_conn:
-                salida = [INSERT, datos_insert]
-            else:
-                self.ejecutar_insert(INSERT, datos_insert)
-        finally:
-            if self.no_conn:
-                return salida
+            texto = str(valor).encode('utf8')
             
-            
-    def ejecutar_insert(self, INSERT, datos_insert):
-        '''INSERT: Un str con el insert en formato sql. STR
-        datos_insert: Valores de los campos del insert. LIST'''
-
+        texto = (texto.replace(b'\\', b'\\\\').replace(b'"', b'\\"')
+                 .replace(b'\n', b'\\n').replace(b'\r', b'\\r').replace(b'\x00', b'\\0'))
+                 
+        return b'"' + texto + b'"'
+        
+        
+    def ejecutar_carga(self, LOAD, fichero):
+        '''LOAD: Un str con el LOAD DATA LOCAL INFILE. STR
+        fichero: Ruta del fichero CSV a cargar. STR
+        salida: rows cargadas o False si da error. INT o FALSE'''
+        
+        salida = None
+        
         try:
-            c_insert = self.conn.cursor() # Declarramos cursor 
-
-            c_insert.execute(INSERT,(datos_insert))
+            c_carga = self.conn.cursor() # Declarramos cursor
             
-            self.conn.commit()
+            inicio = time.perf_counter() if self.hooks else None
+            c_carga.execute(LOAD, (fichero,))
+            duracion = time.perf_counter() - inicio if self.hooks else None
+            salida = c_carga.rowcount
             
-        except pymysql.Error:
-            self.logger.exception(f"ejecutar_insert: ({INSERT},({datos_insert}))")   
+            self.commit()
+            
+        except (pymysql.Error, RuntimeError):
+            self.logger.exception(f"ejecutar_carga: {LOAD}")
+            self.marcar_fallo()
+            salida = False
         else:
-            c_insert.close()
-            self.logger.info(f"ejecutar_insert ok: {INSERT}")
+            c_carga.close()
+            self.logger.info("ejecutar_carga ok: %s rows", salida)
+            
+            if self.hooks:
+                self.emitir('load', LOAD, None, duracion, salida, explain=False)
+        finally:
+            return salida
             
             
-    def delete(self, datos, conn=None):
+    def delete(self, datos, conn=None, batch=False, chunk=CHUNK_STREAM):
         '''Recivimos los datos a delete, los tratamos y ejecutamos el cursor.
         datos: un dict o una lista de ellos con la informacion a tratar. DICT o LIST/TUPLA de DICT
+        datos: o un generador/iterable de dicts, que se procesa por trozos de chunk. ITERABLE
         conn: Conexion previamente establecida o datos para establecer una nueva. 
         conn: False para solo recibir el update listo para ejecucion. 
-        OBJ, DICT o STR/PATH de un fichero YAML o JSON. FALSE.'''
+        OBJ, DICT o STR/PATH de un fichero YAML o JSON. FALSE.
+        batch: True para agrupar los dicts con #where de una unica igualdad sobre la misma
+        #table y columna en DELETE ... IN (...) troceados. BOOL'''
         
+        if es_stream(datos):
+            return self.escribir_stream(self.delete, datos, conn, chunk, batch=batch)
+            
         salida = None
         self.no_conn = False
+        grupos = {}
+        posiciones = None
         
-        data = self.tratar_datos(datos)
+        if batch and type(datos) in [list, tuple]:
+            grupos, datos, posiciones = self.agrupar_delete(datos)
+            data = self.tratar_posiciones(datos, posiciones)
+        else:
+            data = self.tratar_datos(datos)
         
         try:
             if conn != None:
                 self.check_conn(conn)
                     
             if not data in [False, None]:
-                if type(data) is list:
+                if type(data) is list and posiciones is not None:
+                    salida_delete = self.tratar_delete_batch(grupos)
+                    salida_delete.extend((posicion, self.tratar_delete(i)) for posicion, i in data)
+                    salida_delete = [s for _, s in sorted(salida_delete, key=lambda s: s[0])] # Orden de la lista
+                    
+                elif type(data) is list:
                     salida_delete = []
                     for i in data:
                         if self.no_conn:
@@ -456,6 +2164,158 @@ class PyMySqlArs:
             #if self.no_conn:
             salida = salida_delete
         finally:
+            self.invalidar(self.tablas_datos(datos) | {tabla for tabla, _ in grupos})
+            self.devolver_conn()
+            return salida
+            
+            
+    def agrupar_delete(self, datos):
+        '''Separamos los deletes de una unica igualdad en el #where, agrupados por #table y columna.
+        datos: Lista de dicts de delete. LIST/TUPLA de DICT
+        salida: [{(tabla, columna): [(posicion, valor)]}, [dicts restantes], [posicion de cada uno]]. LIST'''
+        
+        grupos = {}
+        resto = []
+        posiciones = []
+        
+        for posicion, d in enumerate(datos):
+            where = d.get('#where') if type(d) is dict else None
+            
+            if (type(d) is dict and len(d) == 2 and '#table' in d and type(where) is dict and len(where) == 1
+                    and all(type(v) in [list, tuple] and len(v) == 2 and v[0] == '=' for v in where.values())):
+                columna, v = next(iter(where.items()))
+                grupos.setdefault((d['#table'], columna), []).append((posicion, v[1]))
+            else:
+                resto.append(d)
+                posiciones.append(posicion)
+                
+        return [grupos, resto, posiciones]
+        
+        
+    def tratar_posiciones(self, datos, posiciones):
+        '''tratar_datos de los dicts no agrupados de un delete batch, uno a uno para conservar su posicion.
+        datos: Dicts restantes de agrupar_delete. LIST
+        posiciones: Posicion de cada uno en la lista original. LIST[INT]
+        salida: [(posicion, dict pre-procesado)] sin los que tratar_datos descarta, o False/None si reporta
+        error. LIST o FALSE/NONE'''
+        
+        salida = []
+        
+        for posicion, d in zip(posiciones, datos):
+            data = self.tratar_datos([d])
+            
+            if data in [False, None]:
+                return data
+                
+            salida.extend((posicion, i) for i in data)
+            
+        return salida
+        
+        
+    def tratar_delete_batch(self, grupos):
+        '''Preparamos DELETE ... WHERE columna IN (...) troceados por max_allowed_packet.
+        grupos: {(tabla, columna): [(posicion, valor)]}. DICT
+        salida: (posicion en la lista del primer dict del trozo, rows borradas o [SQL, valores] con conn=False)
+        por trozo. LIST[TUPLE]'''
+        
+        salida = []
+        
+        for (tabla, columna), valores in grupos.items():
+            cabecera = f"DELETE FROM {tabla} WHERE {columna} IN ("
+            hecho = 0
+            
+            if self.hooks:
+                self.table, self.t_compilacion = tabla, 0.0
+                
+            for trozo, literales in self.trocear_filas(cabecera, [v for _, v in valores], self.escapar_valor):
+                posicion = valores[hecho][0]
+                hecho += len(trozo)
+                
+                if self.no_conn:
+                    sentencia = [cabecera + ', '.join(['%s'] * len(trozo)) + ')', trozo]
+                    salida.append((posicion, sentencia))
+                else:
+                    DELETE = cabecera + ', '.join(literales) + ')'
+                    salida.append((posicion, self.ejecutar_delete_batch(DELETE)))
+                    
+        return salida
+        
+        
+    def ejecutar_delete_batch(self, DELETE, datos_delete=None):
+        '''DELETE: Un str con el delete en formato sql, con los valores ya escapados o con %s. STR
+        datos_delete: Valores de los campos del delete o None. LIST
+        salida: rows borradas o False si da error. INT o FALSE'''
+        
+        salida = None
+        
+        try:
+            c_delete = self.cursor() # Declarramos cursor 
+            
+            inicio = time.perf_counter() if self.hooks else None
+            c_delete.execute(DELETE, datos_delete)
+            duracion = time.perf_counter() - inicio if self.hooks else None
+            salida = c_delete.rowcount
+            
+            self.commit()
+            
+        except pymysql.Error:
+            self.logger.exception(f"ejecutar_delete_batch: {DELETE[:200]}")
+            self.marcar_fallo()
+            salida = False
+        else:
+            c_delete.close()
+            self.logger.info("ejecutar_delete_batch ok: %s rows", salida)
+            
+            if self.hooks:
+                self.emitir('delete', DELETE.split(' IN (')[0], datos_delete, duracion, salida,
+                            explain=[DELETE, datos_delete])
+        finally:
+            return salida
+            
+            
+    def borrar_por_lotes(self, datos, conn=None, limite=10000):
+        '''Borrado de un #where de muchas rows en lotes DELETE ... LIMIT con un commit por lote,
+        para no mantener bloqueos durante todo el borrado.
+        datos: Dict del delete con #table y #where. DICT
+        conn: Conexion previamente establecida o datos para establecer una nueva. 
+        conn: False para solo recibir el delete de un lote listo para ejecucion. 
+        limite: rows por lote. INT
+        salida: Total de rows borradas o False si da error. INT o FALSE o LIST'''
+        
+        salida = None
+        self.no_conn = False
+        
+        data = self.tratar_datos(datos)
+        
+        try:
+            limite = int(limite)
+            
+            if conn != None:
+                self.check_conn(conn)
+                
+            DELETE = f"DELETE FROM {data['#table']} WHERE {data['#where'][0]} LIMIT {limite}"
+            
+            if self.no_conn:
+                salida = [DELETE, data['#where'][1]]
+            else:
+                salida = 0
+                borradas = limite
+                
+                while borradas == limite:
+                    borradas = self.ejecutar_delete_batch(DELETE, data['#where'][1])
+                    
+                    if borradas is False:
+                        salida = False
+                        break
+                        
+                    salida += borradas
+                    
+        except (ValueError, AttributeError, TypeError, KeyError):
+            self.logger.exception("borrar_por_lotes")
+            salida = False
+        finally:
+            self.invalidar(self.tablas_datos(datos))
+            self.devolver_conn()
             return salida
             
             
@@ -465,11 +2325,20 @@ class PyMySqlArs:
         
         datos_delete = []
         salida = None
+        inicio = time.perf_counter() if self.hooks else None
         
         try:
             datos_delete.extend(data['#where'][1])
             
-            DELETE = f"DELETE FROM {data['#table']} WHERE {data['#where'][0]}" 
+            clave = ('delete', data['#table'], data['#where'][0])
+            DELETE = cache_sentencias.get(clave)
+            
+            if DELETE is None:
+                DELETE = f"DELETE FROM {data['#table']} WHERE {data['#where'][0]}" 
+                cache_sentencias.set(clave, DELETE)
+                
+            if self.hooks:
+                self.compilado(inicio, data['#table'])
             
         except (ValueError, AttributeError, TypeError):
             self.logger.exception("tratar_delete")
@@ -491,38 +2360,55 @@ class PyMySqlArs:
         salida = None
         
         try:
-            c_delete = self.conn.cursor() # Declarramos cursor 
+            c_delete = self.cursor() # Declarramos cursor 
 
+            inicio = time.perf_counter() if self.hooks else None
             c_delete.execute(DELETE,(datos_delete))
+            duracion = time.perf_counter() - inicio if self.hooks else None
             
-            self.conn.commit()
+            self.commit()
             
         except pymysql.Error:
             self.logger.exception(f"ejecutar_delete: ({DELETE},({datos_delete}))")
+            self.marcar_fallo()
         else:
             c_delete.close()
-            self.logger.info(f"ejecutar_delete ok: {DELETE}")
+            self.logger.info("ejecutar_delete ok: %s", DELETE)
+            
+            if self.hooks:
+                self.emitir('delete', DELETE, datos_delete, duracion, c_delete.rowcount)
             salida = True
         finally:
             return salida
                
             
-    def select(self, data, conn=None):
+    def select(self, data, conn=None, workers=None):
         '''Funcion para la creacion de una select SQL a partir de un dict.
         data: Informacion requerida para formar la select. DICT o LIST[DICT]
         conn: Conexion previamente establecida o datos para establecer una nueva.
         conn: False para solo recibir el select listo para ejecucion. 
         OBJ, DICT o STR/PATH de un fichero YAML o JSON
+        workers: Con una lista, numero maximo de selects en paralelo con conexiones del pool. INT
         salida: Datos recuperados con la select o False si da error. DICT o LIST[DICT/LIST] o FALSE/NONE'''
         
         salida = None
         self.no_conn = False
+        self.fallo_conexion = False
+        inicio = time.perf_counter()
         
         try:
-            if conn != None:
-                self.check_conn(conn)
+            paralelo = type(data) is list and workers and self.nivel_transaccion == 0 and self.usa_pool(conn)
+                        
+            if workers and type(data) is list and not paralelo:
+                self.logger.warning('select: workers requiere pool=True y conn en DICT o STR/PATH, se ejecuta en serie')
+                
+            if conn != None and not paralelo:
+                self.check_conn(conn, lectura=True)
                     
-            if type(data) is list:
+            if paralelo:
+                salida = self.select_paralelo(data, conn, workers)
+                
+            elif type(data) is list:
                 salida_select = []
                 
                 for i in data:
@@ -541,23 +2427,57 @@ class PyMySqlArs:
             self.logger.exception("select")
             salida = False
         finally:
+            if self.replica is not None:
+                topologia, indice = self.replica
+                topologia.registrar(indice, time.perf_counter() - inicio, not self.fallo_conexion) # Solo por la conexion
+                self.replica = None
+                
+            self.devolver_conn()
             return salida
             
             
+    def select_paralelo(self, data, conn, workers):
+        '''Ejecutamos una lista de selects en paralelo, cada una con su conexion prestada del pool.
+        data: Lista de selects. LIST[DICT]
+        conn: Datos del login del pool. DICT o STR/PATH de un fichero YAML o JSON
+        workers: Numero maximo de selects en paralelo. INT
+        salida: Resultados en el orden de entrada, False en las selects con error. LIST'''
+        
+        def consulta(posicion_dict):
+            posicion, d = posicion_dict
+            ars = PyMySqlArs(pool=True, cache=self.cache, preparadas=self.preparadas, leer_primaria=self.leer_primaria)
+            ars.pool_config = self.pool_config
+            ars.ultimo_commit = self.ultimo_commit
+            ars.hooks = self.hooks
+            
+            try:
+                return ars.select(d, conn)
+            except Exception:
+                self.logger.exception(f"select_paralelo: select {posicion}")
+                return False
+                
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(consulta, enumerate(data)))
+            
+            
     def tratar_select(self, data):
         '''Preparamos los datos para la creacion de la select.
         data: Datos a tratar para la creacion de la select. DICT
         salida: Datos recuperados de la ejecucion de la select. DICT o LIST'''
         
         read = "one"
+        chunk = None
+        paginate = None
+        inicio = time.perf_counter() if self.hooks else None
         self.column = "*"
         where_switch = False
         order_by_switch = False
         format_dict = False
+        formato = None
+        track = None
         table_switch = False
         records = None
         many = "1"
-        where = []
         where_values = []
 
         try:
@@ -574,96 +2494,309 @@ class PyMySqlArs:
                        read = "all"
                     elif value.upper() == "ONE":
                        read = "one"
+                    elif value.upper() == "STREAM":
+                       read = "stream"
+                       
+                elif key == "#chunk" and value != "":
+                    chunk = int(value)
                        
                 elif key == "#dict":
                     format_dict = True
+                    
+                elif key == "#format" and value != "":
+                    if value.upper() == "COLUMNAR":
+                        formato = "columnar"
+                    else:
+                        self.logger.warning("tratar_select: #format no soportado %s", value)
                         
                 elif key == "#column" and value != "":
                     self.column = value
                     
                 elif key == "#where" and value != "":
-                    for k,v in value.items():
-                        if len(v) == 3:
-                            where.append(f"{k} {v[0]} %s {v[2]}")
-                            where_values.append(v[1])
-                        elif len(v) == 1:
-                            where.append(f"{k} {v[0]}")
-                        else:
-                            where.append(f"{k} {v[0]} %s")
-                            where_values.append(v[1])
-                        
-                    self.where_keys = ' '.join(where)
+                    self.where_keys, where_values = self.compilar_where(value, "select")
                     where_switch = True
                     
                 elif key == "#order_by" and value != "":
                     self.order_by_value = value
                     order_by_switch = True
                     
+                elif key == "#paginate" and value != "":
+                    paginate = value
+                    
+                elif key == "#track" and value != "":
+                    claves = value.split(',') if type(value) is str else list(value)
+                    track = [c.strip() for c in claves]
+                    
                 else:
-                    self.logger.warning(f"tratar_select: clave desconocida {key}:{value}")
+                    self.logger.warning("tratar_select: clave desconocida %s:%s", key, value)
                     
         except (ValueError, AttributeError, TypeError):
             self.logger.exception("tratar_select")
             records = False
         else:
+            self.lectura = [format_dict, read, many, chunk] # Opciones de lectura de la ultima select tratada
 
-            if table_switch:
+            if table_switch and paginate is not None:
+                records = self.paginar(paginate, where_switch, where_values, format_dict)
+                
+            elif table_switch:
                 SELECT = self.mold_select(where_switch, order_by_switch)
+                
+                if self.hooks:
+                    self.compilado(inicio, self.table)
 
                 if self.no_conn:
                     records = [SELECT, where_values]
+                elif formato is not None and read != "stream":
+                    records = self.ejecutar_select(SELECT, where_values, format_dict, where_switch, read, many,
+                                                   formato=formato)
+                elif self.cache is not None and read != "stream" and self.nivel_transaccion == 0:
+                    records = self.leer_cache(SELECT, where_values, format_dict, where_switch, read, many)
                 else:    
-                    records = self.ejecutar_select(SELECT, where_values, format_dict, where_switch, read, many)
+                    records = self.ejecutar_select(SELECT, where_values, format_dict, where_switch, read, many, chunk)
+                    
+                if track and not self.no_conn:
+                    if format_dict and formato is None and read != "stream":
+                        records = seguir(records, self.table, track)
+                    else:
+                        self.logger.warning("tratar_select: #track requiere #dict y lectura one, all o int")
             else:
-                self.logger.error(f"tratar_select: no table {data}")
+                self.logger.error("tratar_select: no table %s", data)
         finally:
             return records 
             
             
+    def leer_cache(self, SELECT, where_values, format_dict, where_switch, read, many):
+        '''Select a traves de la cache de resultados: un acierto devuelve una copia sin ir al servidor,
+        un fallo ejecuta la select y guarda el resultado.
+        salida: registro recuperados de la peticion SQL. LIST o DICT o TUPLE'''
+        
+        tablas = tablas_sql(self.table)
+        
+        try:
+            clave = (identidad_conn(self.conn), SELECT, tuple(where_values), format_dict, read,
+                     int(many) if read == "many" else None)
+            records = self.cache.get(clave, SIN_CACHE)
+            
+        except TypeError: # Valores del #where no hashables, sin cache
+            return self.ejecutar_select(SELECT, where_values, format_dict, where_switch, read, many)
+            
+        if records is SIN_CACHE:
+            generacion = self.cache.generacion(tablas)
+            records = self.ejecutar_select(SELECT, where_values, format_dict, where_switch, read, many)
+            
+            if records is not False:
+                filas = (1 if records else 0) if read == "one" else len(records)
+                self.cache.set(clave, tablas, records, bytes_registros(records) + BYTES_ROW * filas, generacion)
+                
+        return records
+        
+        
+    def paginar(self, paginate, where_switch, where_values, format_dict):
+        '''Preparamos la paginacion por clave de la select.
+        paginate: {'key': columna clave unica, 'size': rows por pagina, 'token': ultimo valor leido}. DICT
+        salida: Paginador o [SELECT, valores] de la primera pagina con conn=False. Paginador o LIST o FALSE'''
+        
+        pool = None
+        
+        if self.prestamo is not None and self.nivel_transaccion == 0:
+            pool = self.prestamo[0] # Cada pagina toma prestada su conexion
+            
+        paginador = self.crear_paginador(paginate, where_switch, where_values, format_dict, self.conn, pool)
+                              
+        if self.no_conn and paginador is not False:
+            return paginador.sentencia()
+        else:
+            return paginador
+            
+            
+    def crear_paginador(self, paginate, where_switch, where_values, format_dict, conn=None, pool=None):
+        '''Paginador de la select recien tratada, comprobando que la clave esta entre sus columnas.
+        conn/pool: Conexion fija o pool del que tomar una por pagina. OBJ
+        salida: Paginador o False si la clave no esta en #column. Paginador o FALSE'''
+        
+        select = (self.column, self.table, self.where_keys if where_switch else None)
+        columnas = columnas_select(self.column)
+        
+        if columnas is not None and paginate['key'].split('.')[-1] not in columnas:
+            self.logger.error("paginar: la clave %s no esta en #column %s", paginate['key'], self.column)
+            return False
+            
+        return Paginador(self, conn, pool, select, where_values, format_dict,
+                         paginate['key'], paginate['size'], paginate.get('token'))
+            
+            
+    def mold_pagina(self, column, table, where_keys, clave, size, con_token):
+        '''Formamos la select de una pagina: WHERE (where) AND clave > %s ORDER BY clave LIMIT size.
+        clave: Columna unica; con valores repetidos se saltan las rows con el valor del corte de pagina. STR
+        salida: SELECT en formato SQL para su ejecucion. STR'''
+        
+        clave_cache = ('pagina', column, table, where_keys, clave, size, con_token)
+        SELECT = cache_sentencias.get(clave_cache)
+        
+        if SELECT is None:
+            condiciones = []
+            
+            if where_keys:
+                condiciones.append(f"({where_keys})")
+                
+            if con_token:
+                condiciones.append(f"{clave} > %s")
+                
+            SELECT = f"SELECT {column} FROM {table}"
+            
+            if condiciones:
+                SELECT += " WHERE " + " AND ".join(condiciones)
+                
+            SELECT += f" ORDER BY {clave} LIMIT {size}"
+            cache_sentencias.set(clave_cache, SELECT)
+            
+        return SELECT
+        
+        
+    def ejecutar_pagina(self, conn, SELECT, valores, format_dict, clave):
+        '''Ejecutamos la select de una pagina y localizamos el ultimo valor de la clave.
+        conn: Conexion con la que leer la pagina. OBJ
+        clave: Columna clave de la paginacion. STR
+        salida: [rows de la pagina, ultimo valor de la clave]. LIST'''
+        
+        records = None
+        ultimo = None
+        columna = clave.split('.')[-1]
+        
+        try:
+            if format_dict:
+                c_pagina = self.cursor(pymysql.cursors.DictCursor, conn)
+            else:
+                c_pagina = self.cursor(pymysql.cursors.Cursor, conn)
+                
+            inicio = time.perf_counter() if self.hooks else None
+            c_pagina.execute(SELECT, valores)
+            records = c_pagina.fetchall()
+            duracion = time.perf_counter() - inicio if self.hooks else None
+            
+            if records and format_dict:
+                ultimo = records[-1][columna]
+            elif records:
+                ultimo = records[-1][[d[0] for d in c_pagina.description].index(columna)]
+                
+        except (pymysql.Error, ValueError, AttributeError, TypeError, KeyError):
+            self.logger.exception(f"ejecutar_pagina: ({SELECT},({valores}))")
+            self.marcar_fallo()
+            records = None
+        else:
+            c_pagina.close()
+            self.logger.info("ejecutar_pagina ok: %s", SELECT)
+            
+            if self.hooks:
+                self.emitir('select', SELECT, valores, duracion, len(records), records)
+        finally:
+            return [records, ultimo]
+            
+            
     def mold_select(self, where_switch, order_by_switch):
         '''Formamos la select con los datos entrantes.
         salida: SELECT en formato SQL para su ejecucion. STR'''
         
-        SELECT = f"SELECT {self.column} FROM {self.table}" 
+        clave = ('select', self.column, self.table,
+                 self.where_keys if where_switch else None,
+                 self.order_by_value if order_by_switch else None)
+        SELECT = cache_sentencias.get(clave)
+        
+        if SELECT is None:
+            SELECT = f"SELECT {self.column} FROM {self.table}" 
 
-        if where_switch:
-            SELECT += " WHERE " + self.where_keys
+            if where_switch:
+                SELECT += " WHERE " + self.where_keys
 
-        if order_by_switch:
-            SELECT += " ORDER BY " + self.order_by_value
+            if order_by_switch:
+                SELECT += " ORDER BY " + self.order_by_value
+                
+            cache_sentencias.set(clave, SELECT)
             
         return SELECT
         
         
-    def ejecutar_select(self, SELECT, where_values, format_dict=False, where_switch=False, read = "one", many=3):
+    def ejecutar_select(self, SELECT, where_values, format_dict=False, where_switch=False, read = "one", many=3, chunk=None,
+                        formato=None):
         '''
         SELECT: Codigo SQL para la recuperacion de datos en BBDD.
-        salida: registro recuperados de la peticion SQL. LIST o DICT
+        chunk: con read 'stream', rows por trozo o None para iterar row a row.
+        formato: 'columnar' para recuperar los registros en un ResultadoColumnar.
+        salida: registro recuperados de la peticion SQL. LIST o DICT o LecturaStream o ResultadoColumnar
         '''
         
+        records = None
+        
         try:
-            if format_dict:
-                c_select = self.conn.cursor(pymysql.cursors.DictCursor) # Declarramos cursor Dict
+            if formato == "columnar":
+                c_select = self.conn.cursor(pymysql.cursors.SSCursor) # Sin buffer, las rows pasan a columnas por trozos
+            elif format_dict and read == "stream":
+                c_select = self.conn.cursor(pymysql.cursors.SSDictCursor) # Declarramos cursor Dict sin buffer
+            elif read == "stream":
+                c_select = self.conn.cursor(pymysql.cursors.SSCursor) # Declarramos cursor Normal sin buffer
+            elif format_dict:
+                c_select = self.cursor(pymysql.cursors.DictCursor) # Declarramos cursor Dict
             else:
-                c_select = self.conn.cursor(pymysql.cursors.Cursor) # Declarramos cursor Normal
+                c_select = self.cursor(pymysql.cursors.Cursor) # Declarramos cursor Normal
 
+            inicio = time.perf_counter() if self.hooks else None
+            
             if where_switch:
                 c_select.execute(SELECT,(where_values))
             else:
                 c_select.execute(SELECT)
             
-            if read == "one":    
+            if formato == "columnar":
+                records = self.leer_columnar(c_select, format_dict, read, many)
+            elif read == "one":    
                 records = c_select.fetchone()
             elif read == "all":
                 records = c_select.fetchall()
             elif read == "many":
                 records = c_select.fetchmany(int(many))
+            elif read == "stream":
+                records = LecturaStream(c_select, chunk, self.ceder_conn())
+                
+            duracion = time.perf_counter() - inicio if self.hooks else None
                 
-        except (pymysql.Error,ValueError, AttributeError, TypeError):
-            self.logger.exception(f"ejecutar_select: ({SELECT},({where_values}))")   
+        except (pymysql.Error,ValueError, AttributeError, TypeError) as e:
+            self.logger.exception(f"ejecutar_select: ({SELECT},({where_values}))")
+            self.marcar_fallo()
+            self.fallo_conexion = self.fallo_conexion or error_conexion(e)
+            records = False
         else:
-            c_select.close()
-            self.logger.info(f"ejecutar_select ok: {SELECT}")
+            if read != "stream":
+                c_select.close()
+            self.logger.info("ejecutar_select ok: %s", SELECT)
+            
+            if self.hooks and read == "stream":
+                self.emitir('select', SELECT, where_values, duracion, None)
+            elif self.hooks:
+                rows = (1 if records else 0) if read == "one" and formato is None else len(records)
+                self.emitir('select', SELECT, where_values, duracion, rows, records)
         finally:
             return records
-            
\ No newline at end of file
+            
+            
+    def leer_columnar(self, c_select, format_dict, read, many):
+        '''Leemos las rows del cursor sin buffer por trozos y las guardamos por columnas.
+        read: 'one', 'all' o 'many' con many rows como maximo. STR
+        salida: Registros recuperados. ResultadoColumnar'''
+        
+        records = ResultadoColumnar(c_select.description, format_dict)
+        restantes = {'one': 1, 'many': int(many)}.get(read)
+        
+        while restantes is None or restantes > 0:
+            bloque = BLOQUE_COLUMNAR if restantes is None else min(BLOQUE_COLUMNAR, restantes)
+            filas = c_select.fetchmany(bloque)
+            
+            if not filas:
+                break
+                
+            records.anadir(filas)
+            
+            if restantes is not None:
+                restantes -= len(filas)
+                
+        return records
@@ -0,0 +1,430 @@
+#########################################################################################################################
+#
+# Version asyncio de PyMySqlArs, mismo formato DICT (ver mysqlars.py) sobre aiomysql.
+#
+#   ars = AsyncPyMySqlArs(pool_min=1, pool_max=50)
+#   filas = await ars.select({'#table': 't', '#where': {'id': ['=', 1]}}, conn='login.yaml')
+#
+#   conn: DICT o STR/PATH del login (se crea un pool aiomysql por login y event loop), un pool
+#       aiomysql ya creado o False para solo recibir las sentencias listas para ejecucion.
+#   Cada llamada toma prestada una conexion del pool, por lo que se pueden lanzar cientos de
+#   llamadas concurrentes desde un mismo proceso. Una lista en select se ejecuta en paralelo.
+#   {'#reading_type': 'stream'} devuelve un generador asincrono de rows (o trozos de '#chunk' rows).
+#   {'#paginate': {'key': 'id', 'size': 1000}} devuelve un iterador asincrono de paginas (PaginasAsync), cada
+#       una leida con una conexion del pool; token y error como en Paginador.
+#   El pool y las opciones de lectura de cada llamada se pasan como argumentos, no se guardan en la
+#   instancia: las llamadas concurrentes (gather, generadores sin iterar) no se pisan entre si.
+#   No se admiten {'#format': 'columnar'}, #track ni la cache de resultados (cache=): se ignoran con un
+#       aviso en el log y la select devuelve las rows normales sin pasar por la cache.
+#   Un dict de update/insert/delete que no se puede compilar tiene False en su posicion de la salida y
+#       el resto se ejecuta, como en PyMySqlArs.
+#
+# Requiere aiomysql (pip install aiomysql), dependencia opcional: sin el, mysqlars.py funciona igual y
+#   aqui solo conn=False compila las sentencias.
+#
+#########################################################################################################################
+
+import asyncio
+from pathlib import WindowsPath # Path
+
+import pymysql # Errores sql, aiomysql los reutiliza
+
+try:
+    import aiomysql # Conexion sql no bloqueante
+except ImportError:
+    aiomysql = None
+
+from mysqlars import PyMySqlArs
+from common.pool import clave_login
+
+
+pools_async = {} # Pools aiomysql por (clave de login, event loop)
+
+
+class PaginasAsync:
+
+    '''Iterador asincrono de paginas de una select por clave (keyset), cada pagina con una conexion del pool.
+    token: ultimo valor de la clave leido. error: True si se ha cortado por un error, como en Paginador.'''
+
+
+    def __init__(self, ars, pool, paginador):
+
+        self.ars = ars
+        self.pool = pool
+        self.paginador = paginador # Paginador sin conexion, solo forma las sentencias y guarda el estado
+
+
+    @property
+    def token(self):
+
+        return self.paginador.token
+
+
+    @property
+    def error(self):
+
+        return self.paginador.error
+
+
+    def __aiter__(self):
+
+        return self
+
+
+    async def __anext__(self):
+
+        paginador = self.paginador
+
+        if paginador.fin:
+            raise StopAsyncIteration
+
+        SELECT, valores = paginador.sentencia()
+        filas, ultimo = await self.ars.ejecutar_pagina_async(self.pool, SELECT, valores, paginador.format_dict,
+                                                             paginador.clave)
+
+        if filas is None or (filas and ultimo is None):
+            self.ars.logger.error("PaginasAsync: pagina tras %s con error", paginador.token)
+            paginador.error = True
+            paginador.fin = True
+            raise StopAsyncIteration
+
+        if not filas:
+            paginador.fin = True
+            raise StopAsyncIteration
+
+        if len(filas) < paginador.size:
+            paginador.fin = True
+
+        paginador.token = ultimo
+
+        return filas
+
+
+# Gestion asincrona de conexion con sql a traves de dict para su conversion a SQL
+class AsyncPyMySqlArs(PyMySqlArs):
+
+    '''Management of non-blocking connection with sql through dict for its conversion to SQL.'''
+
+
+    def __init__(self, pool_min=1, pool_max=10):
+
+        super().__init__()
+        self.pool_async = None # Ultimo pool indicado, el de las llamadas con conn=None
+        self.pool_async_config = {'minsize': pool_min, 'maxsize': pool_max}
+
+
+    async def check_pool(self, conn):
+        '''Recuperamos o creamos el pool aiomysql del login.
+        conn: DICT o STR/PATH de un fichero YAML o JSON, un pool aiomysql o None para el ultimo indicado.
+        salida: Pool de la llamada o None si no se puede crear. OBJ o NONE'''
+
+        if conn is None:
+            return self.pool_async
+        elif aiomysql is None:
+            self.logger.error('check_pool: aiomysql no instalado')
+        elif type(conn) is dict or type(conn) is WindowsPath or type(conn) is str:
+            data = conn if type(conn) is dict else self.rec_data(conn)
+
+            if data in [False, None]:
+                self.logger.error('check_pool: Error in login_sql')
+                return None
+
+            clave = (clave_login(data), asyncio.get_running_loop())
+            pool = pools_async.get(clave)
+
+            if pool is None:
+                pool = await aiomysql.create_pool(user = data['user'],
+                                                  password = data['password'],
+                                                  db = data['db'],
+                                                  host = data['host'],
+                                                  charset = data['charset'],
+                                                  autocommit = False,
+                                                  **self.pool_async_config)
+                pools_async[clave] = pool
+
+            self.pool_async = pool
+            return pool
+        else:
+            self.pool_async = conn
+            return conn
+
+        return None
+
+
+    def compilar(self, tratar, datos):
+        '''Reutilizamos la traduccion dict-SQL de PyMySqlArs en modo conn=False.
+        tratar: Metodo tratar_update, tratar_insert o tratar_delete. CALLABLE
+        salida: Lista de [SQL, valores], False en la de un dict que no se puede compilar, o False si
+        tratar_datos reporta error. LIST o FALSE'''
+
+        self.no_conn = True
+        data = self.tratar_datos(datos)
+
+        if data in [False, None]:
+            self.logger.warning('compilar: tratar_datos reporta error')
+            return False
+        elif type(data) is not list:
+            data = [data]
+
+        return [s if s not in [False, None] else False for s in (tratar(i) for i in data)]
+
+
+    async def ejecutar(self, pool, sentencias):
+        '''Ejecutamos las sentencias en una conexion del pool con un unico commit.
+        pool: Pool aiomysql de la llamada. OBJ
+        sentencias: Lista de [SQL, valores], False en las que no se han podido compilar. LIST
+        salida: rows afectadas por sentencia (False en las no compiladas) o False si da error. LIST o FALSE'''
+
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    salida = []
+
+                    try:
+                        for sentencia in sentencias:
+                            if sentencia is False:
+                                salida.append(False)
+                                continue
+
+                            await cursor.execute(*sentencia)
+                            salida.append(cursor.rowcount)
+
+                        await conn.commit()
+
+                    except pymysql.Error:
+                        await conn.rollback()
+                        raise
+
+        except (pymysql.Error, AttributeError, OSError):
+            self.logger.exception(f"ejecutar: {len(sentencias)} sentencias")
+            return False
+
+        self.logger.info("ejecutar ok: %s sentencias", len(sentencias))
+
+        return salida
+
+
+    async def escritura(self, tratar, datos, conn):
+        '''Comun a update, insert y delete: compilamos y ejecutamos las sentencias.'''
+
+        sentencias = self.compilar(tratar, datos) # Antes del primer await, sin otras llamadas entre medias
+
+        if sentencias in [False, None]:
+            return sentencias
+
+        return await self.ejecutar(await self.check_pool(conn), sentencias)
+
+
+    async def update(self, datos, conn=None):
+        '''Igual que PyMySqlArs.update sin bloquear el event loop.
+        salida: rows afectadas por sentencia, o las sentencias con conn=False. LIST o FALSE'''
+
+        if conn is False:
+            return super().update(datos, conn=False)
+
+        return await self.escritura(self.tratar_update, datos, conn)
+
+
+    async def insert(self, datos, conn=None, batch=False):
+        '''Igual que PyMySqlArs.insert sin bloquear el event loop.
+        batch: True para agrupar la lista en INSERT multi-row troceados. BOOL
+        salida: rows afectadas por sentencia, o las sentencias con conn=False. LIST o FALSE'''
+
+        if conn is False:
+            return super().insert(datos, conn=False, batch=batch)
+
+        if batch and type(datos) in [list, tuple]:
+            sentencias = super().insert(datos, conn=False, batch=True)
+
+            if sentencias in [False, None]:
+                return sentencias
+
+            return await self.ejecutar(await self.check_pool(conn), sentencias)
+
+        return await self.escritura(self.tratar_insert, datos, conn)
+
+
+    async def delete(self, datos, conn=None):
+        '''Igual que PyMySqlArs.delete sin bloquear el event loop.
+        salida: rows afectadas por sentencia, o las sentencias con conn=False. LIST o FALSE'''
+
+        if conn is False:
+            return super().delete(datos, conn=False)
+
+        return await self.escritura(self.tratar_delete, datos, conn)
+
+
+    async def select(self, data, conn=None):
+        '''Igual que PyMySqlArs.select sin bloquear el event loop, las listas se ejecutan en paralelo.
+        salida: Datos recuperados con la select o False si da error. DICT o LIST[DICT/LIST] o FALSE/NONE'''
+
+        salida = None
+
+        try:
+            if conn is False:
+                salida = super().select(data, conn=False)
+
+            elif type(data) is list:
+                consultas = [self.compilar_select(i) for i in data]
+                pool = await self.check_pool(conn)
+                salida = list(await asyncio.gather(*[self.tratar_select_async(pool, *i) for i in consultas]))
+            elif type(data) is dict:
+                consulta = self.compilar_select(data)
+                salida = await self.tratar_select_async(await self.check_pool(conn), *consulta)
+            else:
+                self.logger.error('select: Tipo de formato no soportada')
+
+        except (ValueError, AttributeError, TypeError):
+            self.logger.exception("select")
+            salida = False
+
+        return salida
+
+
+    def compilar_select(self, data):
+        '''Compilamos la select con tratar_select en modo conn=False, sin await entre medias, y devolvemos
+        junto a ella sus opciones de lectura, que tratar_select deja en la instancia.
+        salida: (sentencia [SELECT, valores], Paginador o None, [format_dict, read, many, chunk]). TUPLE'''
+
+        self.no_conn = True
+        paginate = data.get('#paginate') if type(data) is dict else None
+
+        if type(data) is dict and (data.get('#format') or data.get('#track')):
+            self.logger.warning("compilar_select: #format y #track no se admiten en async, se ignoran")
+            data = {k: v for k, v in data.items() if k not in ['#format', '#track']}
+
+        if self.cache is not None:
+            self.logger.warning("compilar_select: la cache de resultados no se usa en async")
+
+        if not paginate:
+            sentencia = self.tratar_select(data)
+            return sentencia, None, list(self.lectura)
+
+        sentencia = self.tratar_select({k: v for k, v in data.items() if k != '#paginate'})
+        lectura = list(self.lectura)
+
+        if sentencia in [False, None]:
+            return sentencia, None, lectura
+
+        where_switch = data.get('#where') not in [None, ""]
+        paginador = self.crear_paginador(paginate, where_switch, sentencia[1], lectura[0])
+
+        return (False if paginador is False else sentencia), paginador, lectura
+
+
+    async def tratar_select_async(self, pool, sentencia, paginador, lectura):
+        '''Ejecutamos una select compilada con compilar_select en una conexion del pool.
+        pool: Pool aiomysql de la llamada. OBJ
+        salida: Datos recuperados de la ejecucion de la select. DICT o LIST o generador asincrono'''
+
+        format_dict, read, many, chunk = lectura
+
+        if sentencia in [False, None]:
+            return sentencia
+        elif paginador is not None:
+            return PaginasAsync(self, pool, paginador)
+        elif read == "stream":
+            return self.leer_stream(pool, sentencia, format_dict, chunk)
+        else:
+            return await self.ejecutar_select_async(pool, sentencia, format_dict, read, many)
+
+
+    async def ejecutar_select_async(self, pool, sentencia, format_dict, read, many):
+        '''pool: Pool aiomysql de la llamada. OBJ
+        sentencia: [SELECT, valores] listos para ejecucion. LIST
+        salida: registro recuperados de la peticion SQL o False si da error. LIST o DICT o FALSE'''
+
+        SELECT, where_values = sentencia
+        records = None
+
+        try:
+            async with pool.acquire() as conn:
+                clase = aiomysql.DictCursor if format_dict else aiomysql.Cursor
+
+                async with conn.cursor(clase) as c_select:
+                    await c_select.execute(SELECT, where_values or None)
+
+                    if read == "one":
+                        records = await c_select.fetchone()
+                    elif read == "all":
+                        records = await c_select.fetchall()
+                    elif read == "many":
+                        records = await c_select.fetchmany(int(many))
+
+                await conn.commit() # Cerramos la transaccion de lectura antes de devolverla al pool
+
+        except (pymysql.Error, ValueError, AttributeError, TypeError, OSError):
+            self.logger.exception(f"ejecutar_select_async: ({SELECT},({where_values}))")
+            return False
+
+        self.logger.info("ejecutar_select_async ok: %s", SELECT)
+
+        return records
+
+
+    async def ejecutar_pagina_async(self, pool, SELECT, valores, format_dict, clave):
+        '''Leemos una pagina en una conexion del pool y localizamos el ultimo valor de la clave.
+        clave: Columna clave de la paginacion. STR
+        salida: [rows de la pagina o None si da error, ultimo valor de la clave]. LIST'''
+
+        records = None
+        ultimo = None
+        columna = clave.split('.')[-1]
+
+        try:
+            async with pool.acquire() as conn:
+                clase = aiomysql.DictCursor if format_dict else aiomysql.Cursor
+
+                async with conn.cursor(clase) as c_pagina:
+                    await c_pagina.execute(SELECT, valores or None)
+                    records = await c_pagina.fetchall()
+
+                    if records and format_dict:
+                        ultimo = records[-1][columna]
+                    elif records:
+                        ultimo = records[-1][[d[0] for d in c_pagina.description].index(columna)]
+
+                await conn.commit()
+
+        except (pymysql.Error, ValueError, AttributeError, TypeError, KeyError, OSError):
+            self.logger.exception(f"ejecutar_pagina_async: ({SELECT},({valores}))")
+            return [None, None]
+
+        self.logger.info("ejecutar_pagina_async ok: %s", SELECT)
+
+        return [records, ultimo]
+
+
+    async def leer_stream(self, pool, sentencia, format_dict, chunk):
+        '''Generador asincrono sobre un cursor sin buffer, de rows o de trozos de chunk rows.
+        La conexion vuelve al pool al agotarlo o cerrarlo (aclose).'''
+
+        SELECT, where_values = sentencia
+        conn = await pool.acquire()
+
+        try:
+            clase = aiomysql.SSDictCursor if format_dict else aiomysql.SSCursor
+            c_select = await conn.cursor(clase)
+
+            try:
+                await c_select.execute(SELECT, where_values or None)
+
+                while True:
+                    if chunk:
+                        filas = await c_select.fetchmany(chunk)
+                    else:
+                        filas = await c_select.fetchone()
+
+                    if not filas:
+                        break
+
+                    yield filas
+
+            finally:
+                await c_select.close()
+                await conn.commit()
+
+        except (pymysql.Error, OSError):
+            self.logger.exception(f"leer_stream: ({SELECT},({where_values}))")
+        finally:
+            pool.release(conn)
@@ -0,0 +1,294 @@
+#########################################################################################################################
+#
+# Exportacion en paralelo de una tabla a ficheros, a partir del formato DICT de la select (ver mysqlars.py).
+#
+#   manifiesto = exportar({'#table': 'pedidos', '#where': {'estado': ['=', 'cerrado']}}, 'sql/login/login.yaml',
+#                         'export/pedidos', workers=8, formato='ndjson')
+#
+#   La tabla se reparte en rangos de igual anchura de la clave (por defecto la primera columna de la clave
+#   primaria, debe ser entera) entre MIN y MAX de las rows del #where. Cada rango se lee en un proceso aparte
+#   con su propia conexion y cursor sin buffer (SSCursor), trozo a trozo, y se escribe en su fichero parte:
+#       csv: campos como carga_masiva (NULL como \N, textos entre comillas, \ como escape), con cabecera.
+#       ndjson: un objeto JSON por row; fechas en ISO, decimales como texto y bytes en base64.
+#   comprimir=True escribe las partes en gzip (.gz). Hay mas partes que workers (partes=workers*4 por defecto)
+#   para repartir la carga si los rangos no son uniformes.
+#   El manifiesto (manifest.json en destino, tambien devuelto) lista por parte fichero, rango, rows, bytes y
+#   segundos, o el error si ha fallado; ok es False si falla alguna. Se escribe en ficheros .tmp que se
+#   renombran al terminar, una parte incompleta nunca queda con su nombre final.
+#   Con una clave no entera, o sin clave y sin clave primaria en la tabla, se exporta en una unica parte.
+#   Si la clave admite NULL, sus rows con la clave a NULL van en una parte mas (range null en el manifiesto).
+#   partes y workers deben ser al menos 1, si no exportar devuelve False.
+#   Se ignoran #order_by y #reading_type.
+#   login con topologia primaria/replicas: las partes se reparten entre las replicas, sin ellas la primaria.
+#
+#########################################################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+import base64
+import datetime
+import decimal
+import gzip
+import json
+import logging
+import os
+import time
+
+import pymysql # Conexion sql
+
+from mysqlars import PyMySqlArs
+from common.topologia import es_topologia
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_EXPORT = 10000 # Rows leidas del cursor por trozo
+NIVEL_GZIP = 6 # Compresion de las partes, 9 apenas reduce mas y es bastante mas lento
+FORMATOS = {'csv': '.csv', 'ndjson': '.ndjson'}
+
+
+def valor_json(valor):
+
+    '''Valores de MySQL sin equivalente en JSON, para json.dumps(default=).'''
+
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    elif isinstance(valor, datetime.timedelta):
+        return str(valor)
+    elif isinstance(valor, decimal.Decimal):
+        return str(valor)
+    elif type(valor) is bytes or type(valor) is bytearray:
+        return base64.b64encode(valor).decode('ascii')
+    elif isinstance(valor, set):
+        return sorted(valor)
+
+    raise TypeError(f"valor_json: tipo no soportado {type(valor)}")
+
+
+def rangos(minimo, maximo, partes):
+
+    '''Rangos [desde, hasta) de igual anchura que cubren de minimo a maximo, ambos incluidos.
+    Salida: Generador de (desde, hasta). TUPLE'''
+
+    ancho = max(1, -(-(maximo - minimo + 1) // partes))
+    desde = minimo
+
+    while desde <= maximo:
+        yield desde, desde + ancho
+        desde += ancho
+
+
+def logins_export(login):
+
+    '''Logins en DICT con los que leer las partes, las replicas si el login es una topologia.
+    Salida: Logins, se reparten entre las partes en orden. LIST[DICT]'''
+
+    ars = PyMySqlArs()
+    data = login if type(login) is dict else ars.rec_data(login)
+
+    if data in [False, None]:
+        raise ValueError("exportar: Error in login_sql")
+
+    if not es_topologia(data):
+        return [data]
+
+    resolver = lambda l: l if type(l) is dict else ars.rec_data(l)
+    replicas = [r for r in (resolver(l) for l in data.get('replicas', [])) if type(r) is dict]
+
+    return replicas or [resolver(data['primary'])]
+
+
+def clave_primaria(conn, tabla):
+
+    '''Salida: Primera columna de la clave primaria de la tabla o None si no tiene. STR o NONE'''
+
+    c_clave = conn.cursor()
+    c_clave.execute(f"SHOW KEYS FROM {tabla} WHERE Key_name = 'PRIMARY'")
+    columnas = sorted(c_clave.fetchall(), key=lambda k: k[3]) # Seq_in_index
+    c_clave.close()
+
+    return columnas[0][4] if columnas else None
+
+
+def exportar_parte(tarea):
+
+    '''Leemos un rango con un cursor sin buffer y lo escribimos en su fichero parte. Se ejecuta en un proceso.
+    tarea: login, sql, valores, fichero, formato, comprimir, chunk y rango. DICT
+    Salida: Entrada del manifiesto de la parte. DICT'''
+
+    ars = PyMySqlArs()
+    inicio = time.perf_counter()
+    temporal = tarea['fichero'] + '.tmp'
+    parte = {'file': os.path.basename(tarea['fichero']), 'range': tarea['rango'], 'rows': 0}
+    conn = None
+
+    try:
+        conn = ars.nueva_conexion(tarea['login'])
+        c_export = conn.cursor(pymysql.cursors.SSCursor)
+        c_export.execute(tarea['sql'], tarea['valores'])
+        columnas = [d[0] for d in c_export.description]
+        abrir = gzip.open if tarea['comprimir'] else open
+        opciones = {'compresslevel': NIVEL_GZIP} if tarea['comprimir'] else {}
+
+        with abrir(temporal, 'wb', **opciones) as f:
+            if tarea['formato'] == 'csv':
+                f.write(ars.linea_csv(columnas, columnas))
+
+            while True:
+                filas = c_export.fetchmany(tarea['chunk'])
+
+                if not filas:
+                    break
+
+                if tarea['formato'] == 'csv':
+                    f.write(b''.join(ars.linea_csv(fila, columnas) for fila in filas))
+                else:
+                    f.write(''.join(json.dumps(dict(zip(columnas, fila)), default=valor_json, ensure_ascii=False)
+                                    + '\n' for fila in filas).encode('utf8'))
+
+                parte['rows'] += len(filas)
+
+        c_export.close()
+        os.replace(temporal, tarea['fichero'])
+
+    except Exception as e: # Frontera del proceso: cualquier fallo queda en el manifiesto, no rompe el pool
+        logger.exception("exportar_parte: %s", parte['file'])
+        parte['error'] = f"{type(e).__name__}: {e}"
+
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    else:
+        parte['columns'] = columnas
+        parte['bytes'] = os.path.getsize(tarea['fichero'])
+    finally:
+        if conn is not None:
+            conn.close()
+
+    parte['seconds'] = time.perf_counter() - inicio
+
+    return parte
+
+
+def exportar(data, login, destino, clave=None, partes=None, workers=4, formato="csv", comprimir=True,
+             chunk=CHUNK_EXPORT):
+
+    '''Exportamos las rows de una select a ficheros parte por rangos de la clave, leidos en paralelo.
+    data: Select en formato DICT, se usan #table, #column y #where. DICT
+    login: Informacion necesaria para el login. DICT o STR/PATH de un fichero YAML o JSON
+    destino: Directorio de las partes y del manifest.json, se crea si no existe. STR/PATH
+    clave: Columna entera por la que repartir, por defecto la primera de la clave primaria. STR
+    partes: Numero de rangos, por defecto workers * 4, al menos 1. INT
+    workers: Procesos leyendo a la vez, al menos 1. INT
+    formato: 'csv' o 'ndjson'. STR
+    comprimir: True para partes en gzip. BOOL
+    chunk: Rows leidas del cursor por trozo. INT
+    Salida: Manifiesto de la exportacion o False si no se puede preparar. DICT o FALSE'''
+
+    ars = PyMySqlArs()
+    inicio = time.perf_counter()
+    conn = None
+
+    try:
+        if formato not in FORMATOS:
+            raise ValueError(f"exportar: formato no soportado {formato}")
+
+        workers = int(workers)
+        partes = int(partes) if partes is not None else workers * 4
+
+        if workers < 1 or partes < 1:
+            raise ValueError(f"exportar: workers {workers} y partes {partes} deben ser al menos 1")
+
+        for k in data:
+            if k in ['#order_by', '#reading_type', '#dict', '#chunk', '#format', '#paginate']:
+                logger.warning("exportar: se ignora %s", k)
+
+        tabla = data['#table']
+        logins = logins_export(login)
+        conn = ars.nueva_conexion(logins[0])
+        clave = clave or clave_primaria(conn, tabla)
+        condiciones, valores = [], []
+        minimo, maximo, nulos = None, None, 0
+
+        if data.get('#where'):
+            where, valores = ars.compilar_where(data['#where'], "select")
+            condiciones.append(f"({where})")
+
+        if clave is not None:
+            c_limites = conn.cursor()
+            c_limites.execute(f"SELECT MIN({clave}), MAX({clave}), COUNT(*) - COUNT({clave}) FROM {tabla}" +
+                              (" WHERE " + condiciones[0] if condiciones else ""), valores)
+            minimo, maximo, nulos = c_limites.fetchone()
+            c_limites.close()
+
+    except (pymysql.Error, ValueError, TypeError, KeyError):
+        logger.exception("exportar")
+        return False
+
+    finally:
+        if conn is not None:
+            conn.close()
+
+    SELECT = f"SELECT {data.get('#column') or '*'} FROM {tabla} WHERE " + " AND ".join(condiciones + [
+        f"{clave} >= %s", f"{clave} < %s"])
+    nombre = ''.join(c if c.isalnum() else '_' for c in tabla)
+    sufijo = FORMATOS[formato] + ('.gz' if comprimir else '')
+
+    if clave is not None and minimo is None:
+        tramos = [] # Sin rows o todas con la clave a NULL
+    elif type(minimo) is int and type(maximo) is int:
+        tramos = [(SELECT, list(valores) + [desde, hasta], [desde, hasta])
+                  for desde, hasta in rangos(minimo, maximo, partes)]
+    else:
+        logger.warning("exportar: clave %s no entera o sin clave primaria, se exporta en una unica parte",
+                       clave)
+        SELECT = f"SELECT {data.get('#column') or '*'} FROM {tabla}" + (
+            " WHERE " + condiciones[0] if condiciones else "")
+        tramos = [(SELECT, list(valores), None)]
+        nulos = 0 # Incluidas en la unica parte
+
+    if nulos:
+        NULOS = f"SELECT {data.get('#column') or '*'} FROM {tabla} WHERE " + " AND ".join(condiciones + [
+            f"{clave} IS NULL"])
+        tramos.append((NULOS, list(valores), None))
+
+    os.makedirs(destino, exist_ok=True)
+    tareas = [{'login': logins[i % len(logins)],
+               'sql': sql,
+               'valores': valores_tramo,
+               'fichero': os.path.join(destino, f"{nombre}-{i:05d}{sufijo}"),
+               'formato': formato,
+               'comprimir': comprimir,
+               'chunk': chunk,
+               'rango': rango}
+              for i, (sql, valores_tramo, rango) in enumerate(tramos)]
+
+    if tareas:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tareas))) as executor:
+            resultado = list(executor.map(exportar_parte, tareas))
+    else:
+        resultado = []
+
+    columnas = next((p.pop('columns') for p in resultado if 'columns' in p), None)
+
+    for p in resultado:
+        p.pop('columns', None)
+
+    manifiesto = {'table': tabla,
+                  'key': clave,
+                  'format': formato,
+                  'compressed': comprimir,
+                  'columns': columnas,
+                  'rows': sum(p['rows'] for p in resultado),
+                  'bytes': sum(p.get('bytes', 0) for p in resultado),
+                  'seconds': time.perf_counter() - inicio,
+                  'ok': all('error' not in p for p in resultado),
+                  'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                  'parts': resultado}
+
+    fichero = os.path.join(destino, "manifest.json")
+
+    with open(fichero + '.tmp', 'w', encoding='utf8') as f:
+        json.dump(manifiesto, f, indent=2, default=valor_json)
+
+    os.replace(fichero + '.tmp', fichero)
+
+    return manifiesto
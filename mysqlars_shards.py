@@ -0,0 +1,363 @@
+#########################################################################################################################
+#
+# Version de PyMySqlArs repartida en shards, mismo formato DICT (ver mysqlars.py) sobre varias BBDD.
+#
+#   ars = PyMySqlArsShards('sql/login/shards.yaml')
+#   ars.insert([{'#table': 'pedidos', 'cliente_id': 7, ...}, ...])
+#   filas = ars.select({'#table': 'pedidos', '#where': {'cliente_id': ['=', 7]}, '#reading_type': 'all'})
+#
+#   Configuracion en DICT o fichero YAML/JSON:
+#       shards: {'nombre': login, ...} - login en DICT, ruta a su fichero o una topologia primaria/replicas.
+#       tables: {'tabla': {'key': 'columna', 'hash': ['s0', 's1', ...]}} - shard por crc32 del valor.
+#               {'tabla': {'key': 'columna', 'range': [[None, 's0'], [100000, 's1'], ...]}} - shard por el
+#               ultimo limite inferior (incluido) menor o igual que el valor, None es el minimo.
+#       default: shard de las tablas que no estan en tables, opcional.
+#
+#   insert/update/delete: la lista se reparte por shard segun el valor de la clave (en el insert la columna,
+#       en update/delete una igualdad en el #where unida por 'and') y cada shard se ejecuta en paralelo con
+#       una conexion de su pool. Un update/delete sin la clave va a todos los shards de la tabla.
+#       salida: {shard: salida de PyMySqlArs en ese shard}. Un generador se reparte por trozos de chunk.
+#   select: con una igualdad de la clave en el #where se lee solo su shard y se devuelve como en PyMySqlArs;
+#       sin ella se lee en paralelo de todos (scatter-gather) y se juntan las rows: con #order_by se ordenan
+#       (en tuplas las columnas deben estar en #column), con #reading_type int se recorta a n, 'one' devuelve
+#       la primera y 'stream' encadena los de cada shard. Los agregados (COUNT, SUM...) no se combinan.
+#       '#paginate' solo en un unico shard. Si falla algun shard la select devuelve False.
+#   conn=False: {shard: sentencias listas para ejecucion}.
+#   Cada shard confirma por separado, no hay transacciones entre shards.
+#
+#########################################################################################################################
+
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import zlib
+
+from mysqlars import PyMySqlArs, es_stream, trozos, CHUNK_STREAM
+
+
+TODOS = object() # Marca de dict sin valor de la clave, va a todos los shards de la tabla
+
+
+# Gestion de conexion con sql repartida en shards a traves de dict para su conversion a SQL
+class PyMySqlArsShards(PyMySqlArs):
+
+    '''Management of sharded connections with sql through dict for its conversion to SQL.'''
+
+
+    def __init__(self, shards, workers=None, **opciones):
+
+        super().__init__(pool=True, **opciones)
+        self.shards_config = shards
+        self.workers = workers # Shards en paralelo como maximo, por defecto todos
+        self.mapa = None # Configuracion de shards leida
+
+
+    def config(self):
+        '''Leemos la configuracion de shards y preparamos los limites de los mapas por rango.
+        salida: {'shards', 'tables', 'default'}. DICT'''
+
+        if self.mapa is None:
+            if type(self.shards_config) is dict:
+                data = self.shards_config
+            else:
+                data = self.rec_data(self.shards_config)
+
+            if type(data) is not dict or 'shards' not in data:
+                raise ValueError("config: configuracion de shards sin 'shards'")
+
+            tablas = {}
+
+            for tabla, mapa in data.get('tables', {}).items():
+                mapa = dict(mapa)
+
+                if 'range' in mapa:
+                    rangos = sorted(mapa['range'], key=lambda r: (r[0] is not None, r[0]))
+                    mapa['limites'] = [r[0] for r in rangos if r[0] is not None]
+                    mapa['range'] = rangos
+
+                for nombre in mapa.get('hash') or [r[1] for r in mapa['range']]:
+                    if nombre not in data['shards']:
+                        raise ValueError(f"config: shard desconocido {nombre} en {tabla}")
+
+                tablas[tabla] = mapa
+
+            self.mapa = {'shards': data['shards'], 'tables': tablas, 'default': data.get('default')}
+
+        return self.mapa
+
+
+    def shards_tabla(self, tabla):
+        '''salida: Nombres de los shards de la tabla. LIST[STR]'''
+
+        mapa = self.config()['tables'].get(tabla)
+
+        if mapa is None:
+            default = self.config()['default']
+
+            if default is None:
+                raise ValueError(f"shards_tabla: tabla {tabla} sin shards ni default")
+
+            return [default]
+        elif 'hash' in mapa:
+            return list(mapa['hash'])
+
+        return list(dict.fromkeys(r[1] for r in mapa['range']))
+
+
+    def shard_de(self, tabla, valor):
+        '''Shard de un valor de la clave de la tabla.
+        salida: Nombre del shard. STR'''
+
+        mapa = self.config()['tables'].get(tabla)
+
+        if mapa is None:
+            return self.shards_tabla(tabla)[0]
+        elif 'hash' in mapa:
+            return mapa['hash'][zlib.crc32(str(valor).encode('utf8')) % len(mapa['hash'])]
+
+        posicion = bisect_right(mapa['limites'], valor)
+        rangos = mapa['range']
+
+        if rangos[0][0] is None:
+            return rangos[posicion][1]
+        elif posicion == 0:
+            raise ValueError(f"shard_de: {valor} por debajo del primer rango de {tabla}")
+
+        return rangos[posicion - 1][1]
+
+
+    def valor_clave(self, d, tipo):
+        '''Valor de la clave de shard en un dict de entrada.
+        tipo: 'insert' la columna, 'update'/'delete'/'select' una igualdad del #where. STR
+        salida: Valor de la clave o TODOS si no la tiene. OBJ'''
+
+        mapa = self.config()['tables'].get(d.get('#table'))
+
+        if mapa is None:
+            return None # Tabla sin shards, va al default
+
+        clave = mapa['key']
+
+        if tipo == "insert":
+            return d.get(clave, TODOS)
+
+        where = d.get('#where')
+
+        if type(where) is not dict:
+            return TODOS
+
+        condiciones = list(where.items())
+
+        if any(type(v) in [list, tuple] and len(v) > 2 and str(v[2]).strip().upper() == "OR" for _, v in condiciones):
+            return TODOS # Con 'or' la igualdad no limita las rows a un shard
+
+        for columna, v in condiciones:
+            if (columna == clave or columna.endswith('.' + clave)) and type(v) in [list, tuple] \
+                    and len(v) >= 2 and v[0] == '=':
+                return v[1]
+
+        return TODOS
+
+
+    def repartir(self, datos, tipo):
+        '''Repartimos una lista de dicts por shard.
+        salida: {shard: [dicts]} en el orden en que aparecen los shards. DICT'''
+
+        grupos = {}
+
+        for d in ([datos] if type(datos) is dict else datos):
+            valor = self.valor_clave(d, tipo)
+
+            if valor is TODOS and tipo == "insert":
+                raise ValueError(f"repartir: insert sin la clave de shard {d}")
+            elif valor is TODOS:
+                destinos = self.shards_tabla(d['#table'])
+            else:
+                destinos = [self.shard_de(d['#table'], valor)]
+
+            for nombre in destinos:
+                grupos.setdefault(nombre, []).append(d)
+
+        return grupos
+
+
+    def en_paralelo(self, tareas):
+        '''Ejecutamos un metodo de PyMySqlArs en cada shard en paralelo, cada uno con su instancia y pool.
+        tareas: {shard: (metodo, datos, opciones)}. DICT
+        salida: {shard: salida del metodo}. DICT'''
+
+        def ejecutar(nombre):
+            metodo, datos, opciones = tareas[nombre]
+            ars = PyMySqlArs(pool=True, cache=self.cache, preparadas=self.preparadas,
+                             leer_primaria=self.leer_primaria)
+            ars.pool_config = self.pool_config
+            ars.hooks = self.hooks
+
+            try:
+                return getattr(ars, metodo)(datos, conn=self.config()['shards'][nombre], **opciones)
+            except Exception:
+                self.logger.exception(f"en_paralelo: shard {nombre}")
+                return False
+
+        nombres = list(tareas)
+
+        if len(nombres) == 1:
+            return {nombres[0]: ejecutar(nombres[0])}
+
+        with ThreadPoolExecutor(max_workers=self.workers or len(nombres)) as executor:
+            return dict(zip(nombres, executor.map(ejecutar, nombres)))
+
+
+    def escritura(self, metodo, datos, conn, opciones):
+        '''Comun a update, insert y delete: repartimos por shard y ejecutamos en paralelo.
+        salida: {shard: salida} o False si da error. DICT o FALSE'''
+
+        salida = None
+
+        try:
+            if es_stream(datos):
+                salida = {}
+
+                for trozo in trozos(datos, opciones.pop('chunk', CHUNK_STREAM)):
+                    for nombre, s in self.escritura(metodo, trozo, conn, dict(opciones)).items():
+                        salida.setdefault(nombre, []).append(s)
+
+            elif conn is False:
+                salida = {nombre: getattr(super(PyMySqlArsShards, self), metodo)(grupo, conn=False, **opciones)
+                          for nombre, grupo in self.repartir(datos, metodo).items()}
+            else:
+                tareas = {nombre: (metodo, grupo, opciones) for nombre, grupo in self.repartir(datos, metodo).items()}
+                salida = self.en_paralelo(tareas)
+
+        except (ValueError, AttributeError, TypeError, KeyError):
+            self.logger.exception(metodo)
+            salida = False
+        finally:
+            return salida
+
+
+    def update(self, datos, conn=None, **opciones):
+        '''Igual que PyMySqlArs.update repartido por shard; conn solo admite False.
+        salida: {shard: salida}. DICT o FALSE'''
+
+        return self.escritura("update", datos, conn, opciones)
+
+
+    def insert(self, datos, conn=None, **opciones):
+        '''Igual que PyMySqlArs.insert repartido por shard; conn solo admite False.
+        salida: {shard: salida}. DICT o FALSE'''
+
+        return self.escritura("insert", datos, conn, opciones)
+
+
+    def delete(self, datos, conn=None, **opciones):
+        '''Igual que PyMySqlArs.delete repartido por shard; conn solo admite False.
+        salida: {shard: salida}. DICT o FALSE'''
+
+        return self.escritura("delete", datos, conn, opciones)
+
+
+    def select(self, data, conn=None):
+        '''Igual que PyMySqlArs.select en el shard de la clave, o en todos juntando las rows.
+        data: Informacion requerida para formar la select. DICT o LIST[DICT]
+        conn: False para recibir {shard: [SELECT, valores]}.
+        salida: Datos recuperados con la select o False si da error. DICT o LIST o FALSE/NONE'''
+
+        salida = None
+
+        try:
+            if type(data) is list:
+                salida = [self.select(d, conn) for d in data]
+            elif type(data) is dict:
+                valor = self.valor_clave(data, "select")
+
+                if valor is TODOS:
+                    nombres = self.shards_tabla(data['#table'])
+                else:
+                    nombres = [self.shard_de(data['#table'], valor)]
+
+                if conn is False:
+                    salida = {nombre: super(PyMySqlArsShards, self).select(data, conn=False) for nombre in nombres}
+                elif len(nombres) == 1:
+                    salida = self.en_paralelo({nombres[0]: ("select", data, {})})[nombres[0]]
+                elif '#paginate' in data:
+                    self.logger.error('select: #paginate requiere la clave de shard en el #where')
+                    salida = False
+                else:
+                    resultados = self.en_paralelo({nombre: ("select", data, {}) for nombre in nombres})
+                    salida = self.juntar(data, list(resultados.values()))
+            else:
+                self.logger.error('select: Tipo de formato no soportada')
+
+        except (ValueError, AttributeError, TypeError, KeyError):
+            self.logger.exception("select")
+            salida = False
+        finally:
+            return salida
+
+
+    def juntar(self, data, resultados):
+        '''Juntamos las rows de la select de cada shard (scatter-gather).
+        resultados: Salida de la select en cada shard. LIST
+        salida: Rows como las devolveria una unica select. LIST o DICT o TUPLE o ITERADOR o FALSE'''
+
+        if any(r is False for r in resultados):
+            self.logger.error('juntar: select con error en algun shard')
+            return False
+
+        read = data.get('#reading_type', 'one')
+        read = read.upper() if type(read) is str else read
+
+        if read == "STREAM":
+            return chain.from_iterable(resultados)
+
+        filas = []
+
+        for r in resultados:
+            if read == "ONE" or read == "":
+                if r:
+                    filas.append(r)
+            elif r:
+                filas.extend(r)
+
+        if data.get('#order_by'):
+            self.ordenar(filas, data)
+
+        if read == "ONE" or read == "":
+            return filas[0] if filas else None
+        elif type(read) is int:
+            return filas[:read]
+
+        return filas
+
+
+    def ordenar(self, filas, data):
+        '''Ordenamos las rows juntadas segun el #order_by, como MySQL los NULL primero en ASC.
+        filas: Rows en dict o tupla. LIST'''
+
+        criterios = []
+
+        for parte in data['#order_by'].split(','):
+            palabras = parte.split()
+
+            if not palabras or palabras[0].upper() in ["ASC", "DESC"]:
+                continue
+
+            criterios.append((palabras[0], len(palabras) > 1 and palabras[-1].upper() == "DESC"))
+
+        if not criterios or not filas:
+            return
+
+        if type(filas[0]) is dict:
+            posicion = lambda columna: columna.split('.')[-1]
+        else:
+            columnas = [c.split()[-1].split('.')[-1] for c in data.get('#column', '*').split(',')]
+            posicion = lambda columna: columnas.index(columna.split('.')[-1])
+
+        try:
+            for columna, descendente in reversed(criterios): # Ordenacion estable, del ultimo criterio al primero
+                campo = posicion(columna)
+                filas.sort(key=lambda f: (f[campo] is not None, f[campo]), reverse=descendente)
+
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.logger.warning('ordenar: #order_by %s no aplicable a las rows, se devuelven por shard', data['#order_by'])
@@ -0,0 +1,12 @@
+#
+# Pruebas sin servidor: la raiz del repositorio y tests (falsos.py) en el path
+#
+
+import os
+import sys
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+for ruta in [os.path.dirname(TESTS), TESTS]:
+    if ruta not in sys.path:
+        sys.path.insert(0, ruta)
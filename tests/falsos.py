@@ -0,0 +1,134 @@
+#
+# Conexion y cursor sin servidor para las pruebas (copia de los de bench/bench_mysqlars.py, que ademas
+# guarda las sentencias ejecutadas)
+#
+
+import pymysql
+from pymysql.constants import FIELD_TYPE
+
+
+class CursorFalso:
+
+    '''Cursor sin servidor: acepta cualquier sentencia y genera rows al vuelo para la select.'''
+
+
+    def __init__(self, conn, cursorclass=None):
+
+        self.conn = conn
+        self.dict = cursorclass in [pymysql.cursors.DictCursor, pymysql.cursors.SSDictCursor]
+        self.rowcount = 0
+        self.description = None
+        self.filas = iter(())
+        self.restantes = 0
+
+
+    def execute(self, query, args=None):
+
+        if args is not None:
+            query = query % self.conn.escape_args(args)
+
+        self.conn.sentencias.append(query)
+
+        if self.conn.error is not None and self.conn.error in query:
+            raise pymysql.err.ProgrammingError(1064, f"error en {self.conn.error}")
+
+        if query.startswith("SELECT @@max_allowed_packet"):
+            self.filas = iter([(self.conn.max_packet,)])
+        elif query.startswith("SELECT"):
+            self.description = [(f"c{i}", FIELD_TYPE.LONGLONG if i == 0 else FIELD_TYPE.VAR_STRING)
+                                 for i in range(self.conn.columnas)]
+            self.filas = (self.fila(i) for i in range(self.conn.rows_select))
+        else:
+            self.rowcount = 1
+            self.restantes = query.count(';\n') # Multi-sentencia: un resultado por sentencia
+
+        return self.rowcount
+
+
+    def nextset(self):
+
+        if not self.restantes:
+            return None
+
+        self.restantes -= 1
+
+        return True
+
+
+    def fila(self, i):
+
+        fila = tuple([i] + [f"valor {i} {c}" for c in range(1, self.conn.columnas)])
+
+        if self.dict:
+            return dict(zip((d[0] for d in self.description), fila))
+
+        return fila
+
+
+    def fetchone(self):
+
+        return next(self.filas, None)
+
+
+    def fetchmany(self, size=1):
+
+        return [f for _, f in zip(range(size), self.filas)]
+
+
+    def fetchall(self):
+
+        return list(self.filas)
+
+
+    def close(self):
+
+        self.filas = iter(())
+
+
+class ConexionFalsa:
+
+    '''Conexion sin servidor: sentencias guarda lo que se ejecuta, commits y rollbacks las veces.
+    error: Las sentencias que lo contienen fallan con ProgrammingError.'''
+
+
+    def __init__(self, rows_select=0, columnas=4, max_packet=4194304):
+
+        self.rows_select = rows_select
+        self.columnas = columnas
+        self.max_packet = max_packet
+        self.encoding = 'utf8'
+        self.server_status = 0
+        self.sentencias = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.error = None
+
+
+    def cursor(self, cursorclass=None):
+
+        return CursorFalso(self, cursorclass)
+
+
+    def escape(self, obj):
+
+        return pymysql.converters.escape_item(obj, self.encoding)
+
+
+    def escape_args(self, args):
+
+        return tuple(self.escape(a) for a in args)
+
+
+    def commit(self):
+
+        self.commits += 1
+
+
+    def rollback(self):
+
+        self.rollbacks += 1
+
+
+    def begin(self):
+
+        pass
@@ -0,0 +1,231 @@
+#
+# API asyncio con un pool aiomysql falso
+#
+
+import asyncio
+import logging
+import types
+
+import pymysql
+import pytest
+
+import mysqlars_async
+from mysqlars_async import AsyncPyMySqlArs
+
+
+class CursorAsync:
+
+    '''Cursor aiomysql falso: rows de la conexion, ERROR en la sentencia lanza ProgrammingError.'''
+
+
+    def __init__(self, conn, clase):
+
+        self.conn = conn
+        self.dict = clase in ['DictCursor', 'SSDictCursor']
+        self.rowcount = 0
+        self.description = [('id',), ('a',)]
+        self.filas = iter(())
+
+
+    def __await__(self):
+
+        yield from asyncio.sleep(0).__await__()
+
+        return self
+
+
+    async def __aenter__(self):
+
+        return self
+
+
+    async def __aexit__(self, *args):
+
+        await self.close()
+
+
+    async def execute(self, query, args=None):
+
+        self.conn.sentencias.append((query, args))
+
+        if self.conn.excepcion is not None:
+            raise self.conn.excepcion
+        elif 'ERROR' in query:
+            raise pymysql.err.ProgrammingError(1064, 'error de sintaxis')
+
+        if query.startswith('SELECT'):
+            filas = [f for f in self.conn.filas if not args or f[0] > args[-1]] # Paginas por id > token
+            limite = int(query.rsplit('LIMIT', 1)[1]) if 'LIMIT' in query else len(filas)
+            self.filas = iter(dict(zip(['id', 'a'], f)) if self.dict else f for f in filas[:limite])
+        else:
+            self.rowcount = 1
+
+
+    async def fetchone(self):
+
+        return next(self.filas, None)
+
+
+    async def fetchmany(self, size):
+
+        return [f for _, f in zip(range(size), self.filas)]
+
+
+    async def fetchall(self):
+
+        return list(self.filas)
+
+
+    async def close(self):
+
+        self.filas = iter(())
+
+
+class ConexionAsync:
+
+    def __init__(self, pool):
+
+        self.sentencias = pool.sentencias
+        self.filas = pool.filas
+        self.excepcion = pool.excepcion
+        self.commits = 0
+        self.rollbacks = 0
+
+
+    def cursor(self, clase=None):
+
+        return CursorAsync(self, clase)
+
+
+    async def commit(self):
+
+        self.commits += 1
+
+
+    async def rollback(self):
+
+        self.rollbacks += 1
+
+
+class Prestamo:
+
+    '''Como el de aiomysql: await pool.acquire() o async with pool.acquire().'''
+
+
+    def __init__(self, pool):
+
+        self.pool = pool
+        self.conn = None
+
+
+    def __await__(self):
+
+        yield from asyncio.sleep(0).__await__()
+        self.conn = ConexionAsync(self.pool)
+
+        return self.conn
+
+
+    async def __aenter__(self):
+
+        return await self
+
+
+    async def __aexit__(self, *args):
+
+        self.pool.release(self.conn)
+
+
+class PoolAsync:
+
+    def __init__(self, filas=(), excepcion=None):
+
+        self.filas = list(filas)
+        self.excepcion = excepcion
+        self.sentencias = []
+        self.prestadas = 0
+
+
+    def acquire(self):
+
+        self.prestadas += 1
+
+        return Prestamo(self)
+
+
+    def release(self, conn):
+
+        self.prestadas -= 1
+
+
+@pytest.fixture(autouse=True)
+def aiomysql_falso(monkeypatch):
+
+    clases = types.SimpleNamespace(Cursor='Cursor', DictCursor='DictCursor', SSCursor='SSCursor',
+                                   SSDictCursor='SSDictCursor')
+    monkeypatch.setattr(mysqlars_async, 'aiomysql', clases)
+
+
+def test_escritura_con_un_dict_sin_compilar():
+
+    pool = PoolAsync()
+    datos = [{'#table': 't', 'a': 1, '#where': {'id': ['=', 1]}},
+             {'#table': 't', 'a': 2}, # Sin #where
+             {'#table': 't', 'a': 3, '#where': {'id': ['=', 3]}}]
+
+    assert asyncio.run(AsyncPyMySqlArs().update(datos, conn=pool)) == [1, False, 1]
+    assert [valores for _, valores in pool.sentencias] == [[1, 1], [3, 3]]
+    assert pool.prestadas == 0
+
+
+def test_select_con_error_devuelve_false():
+
+    pool = PoolAsync(filas=[(1, 'x')])
+    ars = AsyncPyMySqlArs()
+
+    assert asyncio.run(ars.select({'#table': 't', '#dict': ''}, conn=pool)) == {'id': 1, 'a': 'x'}
+    assert asyncio.run(ars.select({'#table': 'ERROR'}, conn=pool)) is False
+    assert asyncio.run(ars.update({'#table': 'ERROR', 'a': 1, '#where': {'id': ['=', 1]}}, conn=pool)) is False
+
+
+def test_cancelacion_no_se_pierde():
+
+    pool = PoolAsync(excepcion=asyncio.CancelledError())
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(AsyncPyMySqlArs().select({'#table': 't'}, conn=pool))
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(AsyncPyMySqlArs().insert({'#table': 't', 'a': 1}, conn=pool))
+
+
+def test_format_y_track_se_ignoran(caplog):
+
+    pool = PoolAsync(filas=[(1, 'x'), (2, 'y')])
+    data = {'#table': 't', '#dict': '', '#reading_type': 'all', '#format': 'columnar', '#track': 'id'}
+
+    with caplog.at_level(logging.WARNING):
+        filas = asyncio.run(AsyncPyMySqlArs().select(data, conn=pool))
+
+    assert filas == [{'id': 1, 'a': 'x'}, {'id': 2, 'a': 'y'}]
+    assert all(type(f) is dict for f in filas)
+    assert 'no se admiten en async' in caplog.text
+
+
+def test_paginas():
+
+    pool = PoolAsync(filas=[(i, str(i)) for i in range(1, 6)])
+    ars = AsyncPyMySqlArs()
+
+    async def leer():
+
+        paginas = await ars.select({'#table': 't', '#column': 'id, a', '#paginate': {'key': 'id', 'size': 2}},
+                                   conn=pool)
+
+        return [[f[0] for f in pagina] async for pagina in paginas], paginas
+
+    ids, paginas = asyncio.run(leer())
+
+    assert ids == [[1, 2], [3, 4], [5]]
+    assert paginas.token == 5
+    assert paginas.error is False
@@ -0,0 +1,94 @@
+#
+# Cache de resultados: clave por conexion e invalidacion por tabla
+#
+
+from falsos import ConexionFalsa, CursorFalso
+from common.cache import CacheResultados
+from mysqlars import PyMySqlArs, identidad_conn
+
+
+class ConexionContada(ConexionFalsa):
+
+    '''ConexionFalsa que cuenta las selects que llegan al servidor.'''
+
+
+    def __init__(self, rows_select):
+
+        super().__init__(rows_select=rows_select)
+        self.selects = 0
+
+
+    def cursor(self, cursorclass=None):
+
+        conn = self
+
+        class Cursor(CursorFalso):
+
+            def execute(self, query, args=None):
+
+                if query.startswith("SELECT") and "@@" not in query:
+                    conn.selects += 1
+
+                return super().execute(query, args)
+
+        return Cursor(self, cursorclass)
+
+
+def test_identidad_conn():
+
+    a, b = ConexionFalsa(), ConexionFalsa()
+
+    assert identidad_conn(a) == identidad_conn(a)
+    assert identidad_conn(a) != identidad_conn(b)
+
+
+def test_clave_por_conexion():
+
+    cache = CacheResultados(10**6, 60)
+    ars = PyMySqlArs(cache=cache)
+    shard_a, shard_b = ConexionContada(3), ConexionContada(5)
+    data = {'#table': 't', '#reading_type': 'all'}
+
+    assert len(ars.select(data, conn=shard_a)) == 3
+    assert len(ars.select(data, conn=shard_b)) == 5 # Misma SQL en otra base de datos, no es un acierto
+    assert len(ars.select(data, conn=shard_a)) == 3
+    assert (shard_a.selects, shard_b.selects) == (1, 1)
+
+
+def test_invalidacion_por_escritura():
+
+    cache = CacheResultados(10**6, 60)
+    ars = PyMySqlArs(cache=cache)
+    conn = ConexionContada(2)
+    data = {'#table': 't', '#reading_type': 'all'}
+
+    ars.select(data, conn=conn)
+    ars.select({'#table': 'u', '#reading_type': 'all'}, conn=conn)
+    ars.insert({'#table': 't', 'id': 1}, conn=conn)
+    ars.select(data, conn=conn)
+    ars.select({'#table': 'u', '#reading_type': 'all'}, conn=conn)
+
+    assert conn.selects == 3 # Solo se vuelve a leer la tabla escrita
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_generacion_descarta_lecturas_anteriores():
+
+    cache = CacheResultados(10**6, 60)
+    generacion = cache.generacion(('t',))
+    cache.invalidar('t') # Escritura mientras se leia
+    cache.set('clave', ('t',), [1], 10, generacion)
+
+    assert cache.get('clave') is None
+
+
+def test_copias_y_ttl():
+
+    cache = CacheResultados(10**6, 60, ttl_tablas={'volatil': 0})
+    cache.set('clave', ('t',), [[1]], 10)
+    cache.set('otra', ('volatil',), [[1]], 10)
+    copia = cache.get('clave')
+    copia[0].append(2)
+
+    assert cache.get('clave') == [[1]]
+    assert cache.get('otra') is None
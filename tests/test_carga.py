@@ -0,0 +1,58 @@
+#
+# Carga masiva con LOAD DATA LOCAL INFILE: lineas CSV y fichero temporal
+#
+
+import datetime
+import math
+import os
+
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+
+
+def test_linea_csv():
+
+    ars = PyMySqlArs()
+    fila = [1, 2.5, None, True, 'a "b"\n\\', b'\x00x', datetime.datetime(2024, 1, 2, 3, 4, 5)]
+
+    assert ars.linea_csv(fila, None) == (b'1,2.5,\\N,1,"a \\"b\\"\\n\\\\","\\0x","2024-01-02 03:04:05"\n')
+
+
+def test_no_finitos_como_null():
+
+    ars = PyMySqlArs()
+
+    assert ars.linea_csv({'x': math.nan, 'y': math.inf, 'z': -math.inf}, ['x', 'y', 'z']) == b'\\N,\\N,\\N\n'
+
+
+def test_carga_masiva():
+
+    conn = ConexionFalsa()
+    ficheros = []
+    cursor = conn.cursor
+
+    def cursor_con_fichero(cursorclass=None):
+
+        c = cursor(cursorclass)
+        execute = c.execute
+
+        def execute_con_fichero(query, args=None):
+
+            if query.startswith('LOAD DATA'):
+                ficheros.append(args[0])
+
+                with open(args[0], 'rb') as f:
+                    assert f.read() == b'1,"x"\n2,\\N\n'
+
+            return execute(query, args)
+
+        c.execute = execute_con_fichero
+
+        return c
+
+    conn.cursor = cursor_con_fichero
+    datos = ({'#table': 't', 'id': i, 'a': a} for i, a in [(1, 'x'), (2, None)])
+
+    assert PyMySqlArs().carga_masiva(datos, conn) == 1
+    assert len(ficheros) == 1 and not os.path.exists(ficheros[0])
+    assert PyMySqlArs().carga_masiva([[1]], False, 't', ['id'])[0].startswith('LOAD DATA LOCAL INFILE %s IGNORE')
@@ -0,0 +1,49 @@
+#
+# Resultados de select en columnas ('#format': 'columnar')
+#
+
+from array import array
+
+from pymysql.constants import FIELD_TYPE
+import pytest
+
+from common.columnar import ResultadoColumnar
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+
+
+def test_columnas_numericas_en_array():
+
+    r = ResultadoColumnar([('id', FIELD_TYPE.LONG), ('x', FIELD_TYPE.DOUBLE), ('n', FIELD_TYPE.VAR_STRING)])
+    r.anadir([(1, 0.5, 'a'), (2, 1.5, 'b')])
+    r.anadir([(3, None, 'c')]) # NULL en x, pasa a lista
+
+    assert type(r.columna('id')) is array and r.columna('id').tolist() == [1, 2, 3]
+    assert r.columna('x') == [0.5, 1.5, None]
+    assert len(r) == 3 and r[-1] == (3, None, 'c') and r[:2] == [(1, 0.5, 'a'), (2, 1.5, 'b')]
+    assert list(r) == [(1, 0.5, 'a'), (2, 1.5, 'b'), (3, None, 'c')]
+    assert r.nbytes == 3 * 8 + 3 * 8 + 3 * (1 + 8)
+
+    with pytest.raises(IndexError):
+        r[3]
+
+
+def test_select_columnar():
+
+    conn = ConexionFalsa(rows_select=3, columnas=2)
+    r = PyMySqlArs().select({'#table': 't', '#reading_type': 'all', '#format': 'columnar', '#dict': ''}, conn)
+
+    assert type(r) is ResultadoColumnar
+    assert r.columna('c0').tolist() == [0, 1, 2]
+    assert r[1] == {'c0': 1, 'c1': 'valor 1 1'}
+
+
+def test_numpy_sin_copia():
+
+    numpy = pytest.importorskip('numpy')
+    r = ResultadoColumnar([('id', FIELD_TYPE.LONGLONG)])
+    r.anadir([(1,), (2,)])
+    columna = r.numpy('id')
+
+    assert columna.dtype == numpy.int64 and columna.tolist() == [1, 2]
+    assert numpy.shares_memory(columna, numpy.frombuffer(r.columna('id'), dtype='int64'))
@@ -0,0 +1,155 @@
+#
+# Traduccion dict-SQL con conn=False
+#
+
+import math
+
+from falsos import ConexionFalsa, CursorFalso
+from mysqlars import PyMySqlArs
+
+
+def test_insert():
+
+    ars = PyMySqlArs()
+
+    assert ars.insert({'#table': 't', 'id': 1, 'n': 'a'}, conn=False) == [
+        'INSERT IGNORE INTO t(id, n) VALUES (%s, %s);', [1, 'a']]
+
+
+def test_insert_batch():
+
+    ars = PyMySqlArs()
+    datos = [{'#table': 't', 'id': i, 'n': n} for i, n in [(1, 'a'), (2, 'b')]]
+
+    assert ars.insert(datos, conn=False, batch=True) == [
+        ['INSERT IGNORE INTO t(id, n) VALUES (%s, %s), (%s, %s)', [1, 'a', 2, 'b']]]
+
+
+def test_update_y_delete():
+
+    ars = PyMySqlArs()
+
+    assert ars.update({'#table': 't', 'n': 'b', '#where': {'id': ['=', 1]}}, conn=False) == [
+        'UPDATE t SET n = %s WHERE id = %s', ['b', 1]]
+    assert ars.delete({'#table': 't', '#where': {'id': ['=', 1, 'and'], 'n': ['!=', 'x']}}, conn=False) == [
+        'DELETE FROM t WHERE id = %s and n != %s', [1, 'x']]
+
+
+def test_select():
+
+    ars = PyMySqlArs()
+    data = {'#table': 't', '#column': 'id, n', '#where': {'id': ['>', 1]}, '#order_by': 'id'}
+
+    assert ars.select(data, conn=False) == ['SELECT id, n FROM t WHERE id > %s ORDER BY id', [1]]
+    assert ars.select([{'#table': 't'}, {'#table': 'u', '#where': {'id': ['=', 1]}}], conn=False) == [
+        ['SELECT * FROM t', []], ['SELECT * FROM u WHERE id = %s', [1]]]
+
+
+def test_select_paginada():
+
+    ars = PyMySqlArs()
+    data = {'#table': 't', '#column': 'id, n', '#paginate': {'key': 'id', 'size': 10, 'token': 5}}
+
+    assert ars.select(data, conn=False) == ['SELECT id, n FROM t WHERE id > %s ORDER BY id LIMIT 10', [5]]
+    assert ars.select({**data, '#column': 'n'}, conn=False) is False # La clave debe estar en #column
+
+
+def test_update_upsert():
+
+    ars = PyMySqlArs()
+    datos = [{'#table': 't', 'n': 'b', '#where': {'id': ['=', i]}} for i in (1, 2)]
+
+    assert ars.update(datos, conn=False, batch='upsert') == [
+        ['INSERT INTO t(id, n) VALUES (%s, %s), (%s, %s) ON DUPLICATE KEY UPDATE n = VALUES(n)', [1, 'b', 2, 'b']]]
+
+
+def test_update_join_elimina_la_temporal():
+
+    ars = PyMySqlArs()
+    datos = [{'#table': 't', 'n': 'b', '#where': {'id': ['=', i]}} for i in (1, 2)]
+    sentencias = [s[0] for s in ars.update(datos, conn=False, batch='join')]
+
+    assert sentencias[1] == 'CREATE TEMPORARY TABLE ars_bulk_t AS SELECT id, n FROM t LIMIT 0'
+    assert 'UPDATE t t JOIN ars_bulk_t s ON t.id = s.id SET t.n = s.n' in sentencias
+    assert sentencias[-1] == 'DROP TEMPORARY TABLE IF EXISTS ars_bulk_t'
+
+
+def test_delete_batch_en_orden():
+
+    ars = PyMySqlArs()
+    datos = [{'#table': 't', '#where': {'x': ['>', 1]}},
+             {'#table': 't', '#where': {'id': ['=', 1]}},
+             {'#table': 'u', '#where': {'id': ['=', 2]}},
+             {'#table': 't', '#where': {'a': ['=', 1, 'and'], 'b': ['=', 2]}},
+             {'#table': 't', '#where': {'id': ['=', 3]}}]
+
+    assert ars.delete(datos, conn=False, batch=True) == [
+        ['DELETE FROM t WHERE x > %s', [1]],
+        ['DELETE FROM t WHERE id IN (%s, %s)', [1, 3]],
+        ['DELETE FROM u WHERE id IN (%s)', [2]],
+        ['DELETE FROM t WHERE a = %s and b = %s', [1, 2]]]
+
+
+def test_delete_batch_descartados_no_mueven_posiciones():
+
+    ars = PyMySqlArs()
+    datos = [5, # No es un dict
+             {'#where': {'x': ['>', 1]}}, # Sin #table, tratar_datos lo descarta
+             {'#table': 't', '#where': {'x': ['>', 2]}},
+             {'#table': 't', '#where': {'id': ['=', 1]}},
+             {'#table': 't', '#where': {'y': ['<', 3]}}]
+
+    assert ars.delete(datos, conn=False, batch=True) == [
+        ['DELETE FROM t WHERE x > %s', [2]],
+        ['DELETE FROM t WHERE id IN (%s)', [1]],
+        ['DELETE FROM t WHERE y < %s', [3]]]
+
+
+def test_insert_columnas():
+
+    ars = PyMySqlArs()
+    salida = ars.insert_columnas({'#table': 't', 'x': [1, 2, 3], 'y': [1.5, float('nan'), None],
+                                  'z': ['a', 'b', math.inf]}, conn=False)
+
+    assert salida == [["INSERT IGNORE INTO t(x, y, z) VALUES (1, 1.5e0, 'a'), (2, NULL, 'b'), (3, NULL, NULL)",
+                       None]]
+    assert ars.insert_columnas({'#table': 't', 'x': [1, 2], 'y': [1]}, conn=False) is False
+
+
+def test_borrar_por_lotes_con_limite_str():
+
+    class Cursor(CursorFalso):
+
+        def execute(self, query, args=None):
+
+            super().execute(query, args)
+
+            if query.startswith('DELETE'):
+                self.rowcount = self.conn.lotes.pop(0)
+
+            return self.rowcount
+
+    conn = ConexionFalsa()
+    conn.lotes = [2, 2, 1]
+    conn.cursor = lambda cursorclass=None: Cursor(conn, cursorclass)
+
+    assert PyMySqlArs().borrar_por_lotes({'#table': 't', '#where': {'x': ['>', 1]}}, conn, limite='2') == 5
+    assert conn.lotes == []
+
+
+def test_batch_escapa_cada_fila_una_vez():
+
+    conn = ConexionFalsa()
+    escapadas = []
+    escape = conn.escape
+    conn.escape = lambda obj: escapadas.append(obj) or escape(obj)
+    ars = PyMySqlArs()
+
+    assert ars.insert([{'#table': 't', 'a': i} for i in range(3)], conn, batch=True) == [1]
+    assert escapadas == [(0,), (1,), (2,)]
+
+    escapadas.clear()
+
+    assert ars.delete([{'#table': 't', '#where': {'id': ['=', i]}} for i in range(3)], conn, batch=True) == [1]
+    assert escapadas == [0, 1, 2]
+    assert conn.sentencias[-1] == 'DELETE FROM t WHERE id IN (0, 1, 2)'
@@ -0,0 +1,107 @@
+#
+# Exportacion: rangos, valores JSON y partes con una conexion falsa
+#
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import decimal
+import json
+
+import pytest
+
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+import mysqlars_export
+from mysqlars_export import exportar, rangos, valor_json
+
+
+def test_rangos_cubren_los_limites():
+
+    tramos = list(rangos(1, 10, 3))
+
+    assert tramos == [(1, 5), (5, 9), (9, 13)]
+    assert tramos[0][0] == 1 and tramos[-1][1] > 10
+
+
+def test_rangos_mas_partes_que_valores():
+
+    assert list(rangos(5, 6, 8)) == [(5, 6), (6, 7)]
+    assert list(rangos(7, 7, 4)) == [(7, 8)]
+
+
+def test_valor_json():
+
+    fila = {'f': datetime.date(2024, 1, 2), 'h': datetime.timedelta(hours=1), 'd': decimal.Decimal('1.50'),
+            'b': b'\x00\x01', 's': {'b', 'a'}}
+
+    assert json.loads(json.dumps(fila, default=valor_json)) == {
+        'f': '2024-01-02', 'h': '1:00:00', 'd': '1.50', 'b': 'AAE=', 's': ['a', 'b']}
+
+    with pytest.raises(TypeError):
+        valor_json(object())
+
+
+class ConexionExport(ConexionFalsa):
+
+    '''ConexionFalsa con MIN, MAX y NULL de la clave fijos en la consulta de limites.'''
+
+
+    def cursor(self, cursorclass=None):
+
+        c = super().cursor(cursorclass)
+        execute = c.execute
+
+        def execute_limites(query, args=None):
+
+            rowcount = execute(query, args)
+
+            if query.startswith('SELECT MIN('):
+                c.filas = iter([(1, 10, 2)])
+
+            return rowcount
+
+        c.execute = execute_limites
+
+        return c
+
+
+    def close(self):
+
+        pass
+
+
+@pytest.fixture
+def export_sin_servidor(monkeypatch):
+
+    conexiones = []
+
+    def nueva_conexion(self, data):
+
+        conexiones.append(ConexionExport(rows_select=1, columnas=2))
+
+        return conexiones[-1]
+
+    monkeypatch.setattr(PyMySqlArs, 'nueva_conexion', nueva_conexion)
+    monkeypatch.setattr(mysqlars_export, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+    return conexiones
+
+
+def test_workers_y_partes_no_validos(export_sin_servidor, tmp_path):
+
+    assert exportar({'#table': 't'}, {}, tmp_path, clave='id', partes=0) is False
+    assert exportar({'#table': 't'}, {}, tmp_path, clave='id', workers=0) is False
+    assert export_sin_servidor == []
+
+
+def test_clave_con_null_en_una_parte_mas(export_sin_servidor, tmp_path):
+
+    manifiesto = exportar({'#table': 't', '#where': {'x': ['>', 0]}}, {}, tmp_path, clave='id', partes=2,
+                          workers=2, comprimir=False)
+    sentencias = [s for conn in export_sin_servidor for s in conn.sentencias if not s.startswith('SELECT MIN(')]
+
+    assert [p['range'] for p in manifiesto['parts']] == [[1, 6], [6, 11], None]
+    assert sorted(sentencias) == ['SELECT * FROM t WHERE (x > 0) AND id >= 1 AND id < 6',
+                                  'SELECT * FROM t WHERE (x > 0) AND id >= 6 AND id < 11',
+                                  'SELECT * FROM t WHERE (x > 0) AND id IS NULL']
+    assert manifiesto['ok'] and manifiesto['rows'] == 3
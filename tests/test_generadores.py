@@ -0,0 +1,53 @@
+#
+# Escritura desde generadores por trozos de chunk dicts
+#
+
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs, es_stream, trozos
+
+
+def filas(n, tabla='t'):
+
+    return ({'#table': tabla, 'a': i} for i in range(n))
+
+
+def test_trozos():
+
+    assert list(trozos(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert es_stream(filas(1)) and not es_stream([{}]) and not es_stream({'#table': 't'})
+
+
+def test_un_commit_por_trozo():
+
+    conn = ConexionFalsa()
+    salida = PyMySqlArs().insert(filas(5), conn, chunk=2)
+
+    assert salida == [True, True, True] and conn.commits == 3
+    assert len([s for s in conn.sentencias if s.startswith('INSERT')]) == 5
+
+
+def test_trozo_con_error_se_deshace_y_se_detiene():
+
+    conn = ConexionFalsa()
+    conn.error = 'ars_error'
+    leidas = []
+
+    def datos():
+
+        for i in range(6):
+            leidas.append(i)
+            yield {'#table': 'ars_error' if i == 3 else 't', 'a': i}
+
+    salida = PyMySqlArs().insert(datos(), conn, chunk=2)
+
+    assert salida == [True, False] # Una entrada por trozo, False en el deshecho
+    assert conn.commits == 1 and conn.rollbacks == 1
+    assert leidas == [0, 1, 2, 3] # El resto del generador no se consume
+
+
+def test_sentencias_con_conn_false():
+
+    sentencias = PyMySqlArs().insert(filas(3), False, chunk=2)
+
+    assert not isinstance(sentencias, list)
+    assert list(sentencias) == [['INSERT IGNORE INTO t(a) VALUES (%s);', [i]] for i in range(3)]
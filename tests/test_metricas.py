@@ -0,0 +1,58 @@
+#
+# Hooks de metricas por sentencia e histogramas de latencia
+#
+
+from common.metricas import HistogramaLatencias, bytes_registros, huella
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+
+
+def test_evento_por_sentencia():
+
+    conn = ConexionFalsa(rows_select=2, columnas=2)
+    eventos = []
+    ars = PyMySqlArs()
+    ars.registrar_hook(eventos.append)
+
+    ars.update({'#table': 't', 'a': 'x', '#where': {'id': ['=', 1]}}, conn)
+    ars.select({'#table': 'u', '#reading_type': 'all'}, conn)
+
+    update, select = eventos
+
+    assert update['kind'] == 'update' and update['table'] == 't'
+    assert update['sql'] == 'UPDATE t SET a = %s WHERE id = %s' and update['values'] == ['x', 1]
+    assert update['fingerprint'] == huella(update['sql']) and update['rows'] == 1
+    assert select['kind'] == 'select' and select['rows'] == 2
+    assert select['bytes'] == bytes_registros([(0, 'valor 0 1'), (1, 'valor 1 1')]) == 34
+    assert all(e['server_time'] >= 0 and e['compile_time'] >= 0 for e in eventos)
+
+    ars.quitar_hook(eventos.append)
+    ars.select({'#table': 'u'}, conn)
+
+    assert len(eventos) == 2
+
+
+def test_hook_con_error_no_corta_la_sentencia():
+
+    def hook(evento):
+
+        raise RuntimeError('hook')
+
+    ars = PyMySqlArs()
+    ars.registrar_hook(hook)
+
+    assert ars.update({'#table': 't', 'a': 1, '#where': {'id': ['=', 1]}}, ConexionFalsa()) is True
+
+
+def test_histograma():
+
+    histograma = HistogramaLatencias(limites=(0.01, 0.1, float('inf')))
+
+    for segundos in [0.005, 0.005, 0.05, 2.0]:
+        histograma({'fingerprint': 'f', 'sql': 'SELECT 1', 'kind': 'select', 'server_time': segundos})
+
+    informe = histograma.informe()['f']
+
+    assert informe['count'] == 4 and informe['max'] == 2.0
+    assert informe['p50'] == 0.01 and informe['p95'] == float('inf')
+    assert informe['buckets'] == {0.01: 2, 0.1: 1, float('inf'): 1}
@@ -0,0 +1,27 @@
+#
+# select() de una lista en paralelo con conexiones del pool
+#
+
+from common import pool
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+
+
+LOGIN = {'user': 'u', 'password': 'p', 'db': 'prueba_paralelo', 'host': 'falso', 'charset': 'utf8mb4'}
+
+
+def test_select_paralelo_en_orden_y_con_hooks(monkeypatch):
+
+    monkeypatch.setattr(PyMySqlArs, 'nueva_conexion', lambda self, data: ConexionFalsa(rows_select=6))
+    eventos = []
+    ars = PyMySqlArs(pool=True)
+    ars.registrar_hook(eventos.append)
+    data = [{'#table': f't{i}', '#reading_type': i + 1} for i in range(6)]
+
+    try:
+        salida = ars.select(data, LOGIN, workers=3)
+    finally:
+        pool.pools.pop(pool.clave_login(LOGIN), None)
+
+    assert [len(filas) for filas in salida] == [1, 2, 3, 4, 5, 6]
+    assert sorted(e['table'] for e in eventos if e['kind'] == 'select') == [f't{i}' for i in range(6)]
@@ -0,0 +1,86 @@
+#
+# Perfilador de sentencias lentas: captura, lugar de llamada y EXPLAIN en segundo plano
+#
+
+import json
+
+from common.perfilador import avisos_plan, explicable
+from falsos import ConexionFalsa, CursorFalso
+from mysqlars import PyMySqlArs
+
+
+PLAN = {'query_block': {'ordering_operation': {'using_filesort': True,
+                                               'table': {'table_name': 't', 'access_type': 'ALL'}}}}
+
+
+class ConexionExplain(ConexionFalsa):
+
+    '''ConexionFalsa que responde a EXPLAIN FORMAT=JSON con PLAN.'''
+
+
+    def cursor(self, cursorclass=None):
+
+        c = CursorFalso(self, cursorclass)
+        execute = c.execute
+
+        def execute_explain(query, args=None):
+
+            execute(query, args)
+
+            if query.startswith('EXPLAIN'):
+                c.filas = iter([(json.dumps(PLAN),)])
+
+        c.execute = execute_explain
+
+        return c
+
+
+    def close(self):
+
+        pass
+
+
+def test_avisos_y_explicables():
+
+    assert avisos_plan(PLAN) == ['filesort', 'full_scan:t']
+    assert explicable(['SELECT * FROM t', None]) and explicable([' update t SET a = 1', None])
+    assert not explicable(['INSERT INTO t VALUES (1)', None]) and not explicable(None)
+
+
+def test_captura_y_explica(monkeypatch):
+
+    explain = ConexionExplain()
+    monkeypatch.setattr(PyMySqlArs, 'conexion', lambda self, login: explain)
+    conn = ConexionFalsa()
+    ars = PyMySqlArs()
+    perfilador = ars.perfilar({}, umbral=0)
+
+    try:
+        for i in range(3):
+            ars.update({'#table': 't', 'a': i, '#where': {'id': ['=', i]}}, conn)
+
+        ars.insert({'#table': 't', 'a': 1}, conn)
+        perfilador.esperar()
+        informe = perfilador.informe()
+    finally:
+        perfilador.cerrar()
+
+    update = next(d for d in informe.values() if d['kind'] == 'update')
+    insert = next(d for d in informe.values() if d['kind'] == 'insert')
+
+    assert update['count'] == 3 and update['sql'] == 'UPDATE t SET a = %s WHERE id = %s'
+    origen, = update['origins'] # Las tres desde la misma linea de este test
+    assert origen.startswith(__file__ + ':') and origen.endswith(' en test_captura_y_explica')
+    assert update['flags'] == ['filesort', 'full_scan:t'] and update['plan'] == PLAN
+    assert insert['plan'] is None # INSERT no se explica
+    assert [s for s in explain.sentencias if s.startswith('EXPLAIN')] == [
+        f"EXPLAIN FORMAT=JSON UPDATE t SET a = {i} WHERE id = {i}" for i in range(3)]
+
+
+def test_bajo_el_umbral_no_se_captura():
+
+    ars = PyMySqlArs()
+    perfilador = ars.perfilar({}, umbral=60)
+    ars.update({'#table': 't', 'a': 1, '#where': {'id': ['=', 1]}}, ConexionFalsa())
+
+    assert perfilador.informe() == {}
@@ -0,0 +1,43 @@
+#
+# Pipeline de escrituras: cola, envio en multi-sentencia y upsert no admitido
+#
+
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+
+
+def test_envio_en_un_viaje():
+
+    conn = ConexionFalsa()
+    ars = PyMySqlArs()
+    pipe = ars.pipeline(conn)
+
+    assert pipe.insert({'#table': 't', 'a': 1}) == 1
+    assert pipe.update({'#table': 't', 'a': 2, '#where': {'id': ['=', 1]}}) == 1
+    assert pipe.delete({'#table': 'u', '#where': {'id': ['=', 2]}}) == 1
+    assert len(pipe) == 3
+
+    conn.sentencias.clear()
+
+    assert pipe.enviar() == [1, 1, 1]
+    assert len([s for s in conn.sentencias if not s.startswith('SELECT @@')]) == 1
+    assert conn.commits == 1
+    assert len(pipe) == 0
+
+
+def test_datos_con_error_no_se_encolan():
+
+    pipe = PyMySqlArs().pipeline(ConexionFalsa())
+
+    assert pipe.insert({'a': 2}) is False # Sin #table
+    assert len(pipe) == 0
+
+
+def test_upsert_no_admitido():
+
+    pipe = PyMySqlArs().pipeline(ConexionFalsa())
+    datos = [{'#table': 't', 'a': i, '#where': {'id': ['=', i]}} for i in range(3)]
+
+    assert pipe.update(datos, batch='upsert') is False
+    assert len(pipe) == 0
+    assert pipe.update(datos, batch='join')
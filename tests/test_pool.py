@@ -0,0 +1,120 @@
+#
+# Pool de conexiones: prestamo, devolucion y cierre de las libres caducadas
+#
+
+import time
+
+from common import pool
+from common.pool import PoolConexiones
+
+
+class ConexionPool:
+
+    '''Conexion minima para el pool, sin servidor.'''
+
+    abiertas = 0
+
+
+    def __init__(self):
+
+        ConexionPool.abiertas += 1
+        self.open = True
+        self.server_status = 0
+
+
+    def close(self):
+
+        ConexionPool.abiertas -= 1
+        self.open = False
+
+
+    def ping(self, reconnect=False):
+
+        pass
+
+
+def test_prestar_reutiliza_la_mas_reciente():
+
+    pool = PoolConexiones(ConexionPool, min_size=1, max_size=3)
+    a, b = pool.prestar(), pool.prestar()
+    pool.devolver(a)
+    pool.devolver(b)
+
+    assert pool.prestar() is b
+    assert pool.total == 2
+
+
+def test_espera_agotada():
+
+    pool = PoolConexiones(ConexionPool, min_size=0, max_size=1)
+    conn = pool.prestar()
+
+    assert pool.prestar(espera=0.01) is None
+
+    pool.devolver(conn)
+
+    assert pool.prestar(espera=0.01) is conn
+
+
+def test_cerrada_no_vuelve_al_pool():
+
+    pool = PoolConexiones(ConexionPool, min_size=0, max_size=2)
+    conn = pool.prestar()
+    conn.close()
+    pool.devolver(conn)
+
+    assert pool.total == 0 and not pool.libres
+
+
+def test_recoge_las_libres_caducadas():
+
+    pool = PoolConexiones(ConexionPool, min_size=1, max_size=5, idle_timeout=0.05)
+    conexiones = [pool.prestar() for _ in range(4)]
+
+    for conn in conexiones:
+        pool.devolver(conn)
+
+    time.sleep(0.1)
+    conn = pool.prestar()
+
+    assert pool.total == 1 and not pool.libres # Las caducadas de la izquierda se cierran hasta min_size
+    assert all(not c.open for c in conexiones if c is not conn)
+
+    pool.devolver(conn)
+
+    assert pool.total == 1 and len(pool.libres) == 1
+
+
+def test_cerrar():
+
+    pool = PoolConexiones(ConexionPool, min_size=2, max_size=3)
+    prestada = pool.prestar()
+    pool.cerrar()
+
+    assert not pool.libres
+
+    pool.devolver(prestada)
+
+    assert not prestada.open and pool.total == 0
+
+
+def test_obtener_pool_abre_fuera_del_lock():
+
+    bloqueado = []
+
+    def conectar(data):
+
+        bloqueado.append(pool.pools_lock.locked())
+
+        return ConexionPool()
+
+    data = {'host': 'prueba_lock', 'user': 'u'}
+
+    try:
+        nuevo = pool.obtener_pool(data, conectar, min_size=2, max_size=3)
+
+        assert bloqueado == [False, False]
+        assert nuevo.total == 2 and len(nuevo.libres) == 2
+        assert pool.obtener_pool(data, conectar) is nuevo and len(bloqueado) == 2
+    finally:
+        pool.pools.pop(pool.clave_login(data), None).cerrar()
@@ -0,0 +1,135 @@
+#
+# Texto de las sentencias preparadas
+#
+
+import datetime
+import decimal
+import io
+import struct
+
+import pymysql
+from pymysql.constants import COMMAND, FIELD_TYPE
+import pytest
+
+from common.preparadas import codificar, cursor_preparado, texto_preparado
+
+
+def test_marcadores():
+
+    assert texto_preparado("SELECT * FROM t WHERE a = %s AND b = %s;") == "SELECT * FROM t WHERE a = ? AND b = ?"
+    assert texto_preparado("SELECT a FROM t WHERE c LIKE '100%%' AND d = %s") == \
+        "SELECT a FROM t WHERE c LIKE '100%' AND d = ?"
+
+
+def test_interrogacion_en_literales():
+
+    assert texto_preparado("SELECT * FROM t WHERE a = %s AND b LIKE '%%?%%'") == \
+        "SELECT * FROM t WHERE a = ? AND b LIKE '%?%'"
+    assert texto_preparado("SELECT 'it''s ?', \"a\\\"?\", `c?` FROM t WHERE id = %s") == \
+        "SELECT 'it''s ?', \"a\\\"?\", `c?` FROM t WHERE id = ?"
+
+
+def test_no_preparables():
+
+    assert texto_preparado("SELECT a FROM t WHERE x = ?") is None # El servidor lo tomaria por parametro
+    assert texto_preparado("SELECT '%s'") is None # pymysql enlaza dentro del literal
+
+
+class SocketFalso:
+
+    '''Socket sin servidor: guarda lo que envia pymysql, las respuestas se leen de _rfile.'''
+
+
+    def __init__(self):
+
+        self.enviado = bytearray()
+
+
+    def sendall(self, datos):
+
+        self.enviado += datos
+
+
+    def settimeout(self, segundos):
+
+        pass
+
+
+    def close(self):
+
+        pass
+
+
+def paquete(secuencia, datos):
+
+    return struct.pack('<I', len(datos))[:3] + bytes((secuencia,)) + datos
+
+
+def respuesta_ok(filas=1):
+
+    return paquete(1, b'\x00' + bytes((filas, 0)) + b'\x02\x00\x00\x00')
+
+
+def respuesta_prepare(stmt_id, parametros):
+
+    salida = paquete(1, b'\x00' + struct.pack('<IHHBH', stmt_id, 0, parametros, 0, 0))
+
+    for secuencia in range(2, parametros + 2): # Definiciones de parametros, no se interpretan
+        salida += paquete(secuencia, b'\x03def')
+
+    return salida + paquete(parametros + 2, b'\xfe\x00\x00\x02\x00')
+
+
+def conexion_falsa(respuestas):
+
+    '''Conexion pymysql real sobre un SocketFalso, para probar los paquetes de las APIs internas.'''
+
+    conn = pymysql.connections.Connection(defer_connect=True, charset='utf8mb4')
+    conn._sock = SocketFalso()
+    conn._rfile = io.BytesIO(respuestas)
+    conn._current_timeout = None
+
+    return conn
+
+
+def test_codificar_tipos():
+
+    assert codificar(True, 'utf8') == (FIELD_TYPE.LONGLONG, False, struct.pack('<q', 1))
+    assert codificar(-5, 'utf8') == (FIELD_TYPE.LONGLONG, False, struct.pack('<q', -5))
+    assert codificar(2**63, 'utf8') == (FIELD_TYPE.LONGLONG, True, struct.pack('<Q', 2**63))
+    assert codificar(2**64, 'utf8') == (FIELD_TYPE.NEWDECIMAL, False, b'\x1418446744073709551616')
+    assert codificar(1.5, 'utf8') == (FIELD_TYPE.DOUBLE, False, struct.pack('<d', 1.5))
+    assert codificar(b'\x00\x01', 'utf8') == (FIELD_TYPE.BLOB, False, b'\x02\x00\x01')
+    assert codificar(decimal.Decimal('1.50'), 'utf8') == (FIELD_TYPE.NEWDECIMAL, False, b'\x041.50')
+    assert codificar('ñ', 'utf8') == (FIELD_TYPE.VAR_STRING, False, b'\x02\xc3\xb1')
+    assert codificar(datetime.date(2024, 1, 2), 'utf8') == (FIELD_TYPE.DATE, False, b'\x04\xe8\x07\x01\x02')
+    assert codificar(datetime.datetime(2024, 1, 2, 3, 4, 5, 6), 'utf8') == (
+        FIELD_TYPE.DATETIME, False, b'\x0b\xe8\x07\x01\x02\x03\x04\x05\x06\x00\x00\x00')
+    assert codificar(datetime.timedelta(days=-1, seconds=86399), 'utf8') == (
+        FIELD_TYPE.TIME, False, b'\x0c\x01\x00\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00')
+
+    with pytest.raises(pymysql.err.ProgrammingError):
+        codificar((1, 2, 3), 'utf8')
+
+
+def test_prepare_y_execute_binario():
+
+    conn = conexion_falsa(respuesta_prepare(7, 2) + respuesta_ok())
+    cursor = cursor_preparado(conn)
+
+    assert cursor.execute("UPDATE t SET a = %s WHERE id = %s", [1.5, None]) == 1
+
+    prepare = paquete(0, bytes((COMMAND.COM_STMT_PREPARE,)) + b'UPDATE t SET a = ? WHERE id = ?')
+    execute = paquete(0, bytes((COMMAND.COM_STMT_EXECUTE,)) + struct.pack('<IBI', 7, 0, 1) + b'\x02' + b'\x01' +
+                      bytes((FIELD_TYPE.DOUBLE, 0, FIELD_TYPE.NULL, 0)) + struct.pack('<d', 1.5))
+
+    assert bytes(conn._sock.enviado) == prepare + execute
+
+
+def test_compuestos_por_protocolo_de_texto():
+
+    conn = conexion_falsa(respuesta_ok(3))
+    cursor = cursor_preparado(conn)
+
+    assert cursor.execute("DELETE FROM t WHERE id IN %s", [(1, 2, 3)]) == 3
+    assert bytes(conn._sock.enviado) == paquete(0, bytes((COMMAND.COM_QUERY,)) + b'DELETE FROM t WHERE id IN (1,2,3)')
@@ -0,0 +1,46 @@
+#
+# Filas seguidas (#track)
+#
+
+from common.seguimiento import FilaSeguida, seguir
+from mysqlars import PyMySqlArs, Pipeline
+
+
+def test_solo_columnas_cambiadas():
+
+    fila = FilaSeguida({'id': 1, 'a': 'x', 'b': 2}, 't', ['id'])
+
+    assert fila.dict_update() is None
+
+    fila['b'] = 3
+
+    assert PyMySqlArs().update(fila, conn=False) == ['UPDATE t SET b = %s WHERE id = %s', [3, 1]]
+
+
+def test_seguir():
+
+    filas = seguir([{'id': 1, 'a': 'x'}, {'id': 2, 'a': 'y'}], 't', ['id'])
+
+    assert all(type(f) is FilaSeguida for f in filas)
+    assert seguir([{'a': 'x'}], 't', ['id']) == [{'a': 'x'}] # Sin la clave no se siguen
+
+
+def test_pipeline_invalida_la_tabla():
+
+    ars = PyMySqlArs()
+    fila = FilaSeguida({'id': 1, 'a': 'x'}, 'pedidos', ['id'])
+    fila['a'] = 'y'
+    pipe = Pipeline(ars)
+
+    assert pipe.update([fila]) == 1
+    assert pipe.tablas == {'pedidos'}
+    assert ars.tablas_datos(fila) == {'pedidos'}
+
+
+def test_insert_y_delete_rechazan_filas_seguidas():
+
+    ars = PyMySqlArs()
+    fila = FilaSeguida({'id': 1, 'a': 'x'}, 't', ['id'])
+
+    assert ars.insert([fila], conn=False) is None # Como cualquier error de tratar_datos
+    assert ars.delete(fila, conn=False) is None
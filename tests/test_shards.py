@@ -0,0 +1,73 @@
+#
+# Reparto de dicts por shard
+#
+
+import zlib
+
+import pytest
+
+from mysqlars_shards import PyMySqlArsShards
+
+
+SHARDS = {'shards': {'s0': {}, 's1': {}, 's2': {}},
+          'tables': {'pedidos': {'key': 'cliente_id', 'hash': ['s0', 's1']},
+                     'logs': {'key': 'id', 'range': [[100, 's1'], [None, 's0'], [200, 's2']]},
+                     'altas': {'key': 'id', 'range': [[10, 's0'], [20, 's1']]}},
+          'default': 's2'}
+
+
+def test_shard_por_hash():
+
+    ars = PyMySqlArsShards(SHARDS)
+
+    for valor in [1, 7, 'abc']:
+        assert ars.shard_de('pedidos', valor) == ['s0', 's1'][zlib.crc32(str(valor).encode('utf8')) % 2]
+
+
+def test_shard_por_rango():
+
+    ars = PyMySqlArsShards(SHARDS)
+
+    assert [ars.shard_de('logs', v) for v in [-5, 99, 100, 199, 200, 10**9]] == ['s0', 's0', 's1', 's1', 's2', 's2']
+    assert ars.shard_de('altas', 15) == 's0'
+
+    with pytest.raises(ValueError):
+        ars.shard_de('altas', 5) # Por debajo del primer rango
+
+
+def test_tabla_sin_shards_al_default():
+
+    ars = PyMySqlArsShards(SHARDS)
+
+    assert ars.shards_tabla('otra') == ['s2']
+    assert ars.repartir({'#table': 'otra', 'id': 1}, 'insert') == {'s2': [{'#table': 'otra', 'id': 1}]}
+
+
+def test_repartir():
+
+    ars = PyMySqlArsShards(SHARDS)
+    con_clave = {'#table': 'logs', '#where': {'id': ['=', 150, 'and'], 'n': ['=', 'x']}}
+    con_or = {'#table': 'logs', '#where': {'id': ['=', 150, 'or'], 'n': ['=', 'x']}}
+    sin_clave = {'#table': 'logs', '#where': {'n': ['=', 'x']}}
+
+    assert ars.repartir([con_clave], 'delete') == {'s1': [con_clave]}
+    assert ars.repartir([con_or], 'delete') == {'s1': [con_or], 's0': [con_or], 's2': [con_or]}
+    assert set(ars.repartir([sin_clave], 'update')) == {'s0', 's1', 's2'}
+
+    with pytest.raises(ValueError):
+        ars.repartir([{'#table': 'logs', 'n': 'x'}], 'insert') # Insert sin la clave de shard
+
+
+def test_shard_desconocido():
+
+    with pytest.raises(ValueError):
+        PyMySqlArsShards({'shards': {'s0': {}}, 'tables': {'t': {'key': 'id', 'hash': ['s9']}}}).config()
+
+
+def test_compilacion_por_shard():
+
+    ars = PyMySqlArsShards(SHARDS)
+    salida = ars.insert([{'#table': 'logs', 'id': 5}, {'#table': 'logs', 'id': 150}], conn=False)
+
+    assert salida == {'s0': [['INSERT IGNORE INTO logs(id) VALUES (%s);', [5]]],
+                      's1': [['INSERT IGNORE INTO logs(id) VALUES (%s);', [150]]]}
@@ -0,0 +1,40 @@
+#
+# Select en stream con cursor sin buffer
+#
+
+from falsos import ConexionFalsa
+from mysqlars import LecturaStream, PyMySqlArs
+
+
+def test_stream_de_rows():
+
+    conn = ConexionFalsa(rows_select=3, columnas=2)
+    lectura = PyMySqlArs().select({'#table': 't', '#reading_type': 'stream', '#dict': ''}, conn)
+
+    assert type(lectura) is LecturaStream
+    assert list(lectura) == [{'c0': i, 'c1': f'valor {i} 1'} for i in range(3)]
+    assert lectura.cursor is None and lectura.error is False
+
+
+def test_stream_por_trozos():
+
+    conn = ConexionFalsa(rows_select=5, columnas=1)
+
+    with PyMySqlArs().select({'#table': 't', '#reading_type': 'stream', '#chunk': 2}, conn) as lectura:
+        assert list(lectura) == [[(0,), (1,)], [(2,), (3,)], [(4,)]]
+
+
+def test_cerrar_devuelve_la_conexion():
+
+    cerrada = []
+    conn = ConexionFalsa(rows_select=10, columnas=1)
+    cursor = conn.cursor()
+    cursor.execute('SELECT c0 FROM t')
+    lectura = LecturaStream(cursor, al_cerrar=lambda: cerrada.append(True))
+
+    assert next(lectura) == (0,)
+
+    lectura.close()
+    lectura.close()
+
+    assert cerrada == [True] and list(lectura) == []
@@ -0,0 +1,90 @@
+#
+# Replicas de lectura: lecturas a las replicas, escrituras a la primaria y replicas caidas apartadas
+#
+
+import pymysql
+import pytest
+
+from common import pool, topologia
+from common.topologia import Topologia, error_conexion
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs
+
+
+def login(host):
+
+    return {'user': 'u', 'password': 'p', 'db': 'prueba_topologia', 'host': host, 'charset': 'utf8mb4'}
+
+
+TOPOLOGIA = {'primary': login('primaria'), 'replicas': [login('replica')]}
+
+
+@pytest.fixture
+def servidores(monkeypatch):
+
+    conexiones = []
+
+    def nueva_conexion(self, data):
+
+        if data['host'] == 'caida':
+            raise pymysql.err.OperationalError(2003, 'no conecta')
+
+        conn = ConexionFalsa(rows_select=1, columnas=1)
+        conn.host = data['host']
+        conexiones.append(conn)
+
+        return conn
+
+    monkeypatch.setattr(PyMySqlArs, 'nueva_conexion', nueva_conexion)
+
+    yield conexiones
+
+    for clave in list(pool.pools):
+        if ('db', 'prueba_topologia') in clave:
+            pool.pools.pop(clave)
+
+    topologia.topologias.clear()
+
+
+def ejecutadas(conexiones, host):
+
+    return [s for c in conexiones if c.host == host for s in c.sentencias if not s.startswith('SELECT @@')]
+
+
+def test_lecturas_a_la_replica_y_escrituras_a_la_primaria(servidores):
+
+    ars = PyMySqlArs()
+
+    assert ars.select({'#table': 't'}, TOPOLOGIA) == (0,)
+    assert ars.insert({'#table': 't', 'a': 1}, TOPOLOGIA)
+
+    assert ejecutadas(servidores, 'replica') == ['SELECT * FROM t']
+    assert ejecutadas(servidores, 'primaria') == ['INSERT IGNORE INTO t(a) VALUES (1);']
+
+
+def test_leer_primaria(servidores):
+
+    assert PyMySqlArs(leer_primaria=True).select({'#table': 't'}, TOPOLOGIA) == (0,)
+    assert ejecutadas(servidores, 'primaria') == ['SELECT * FROM t']
+
+
+def test_replica_caida_se_aparta(servidores):
+
+    datos = {'primary': login('primaria'), 'replicas': [login('caida')]}
+
+    assert PyMySqlArs().select({'#table': 't'}, datos) == (0,)
+    assert ejecutadas(servidores, 'primaria') == ['SELECT * FROM t']
+    assert topologia.obtener_topologia(datos, None).stats()[0]['down'] is True
+
+
+def test_orden_y_errores_de_conexion():
+
+    t = Topologia({}, [{'host': 'a'}, {'host': 'b'}, {'host': 'c'}], penalizacion=60)
+    t.registrar(0, 0.5)
+    t.registrar(1, 0.1)
+    t.registrar(2, 0.2, ok=False)
+
+    assert t.orden() == [1, 0] # La apartada no, las disponibles por latencia
+    assert error_conexion(pymysql.err.OperationalError(2013, 'perdida'))
+    assert not error_conexion(pymysql.err.OperationalError(1054, 'columna desconocida'))
+    assert not error_conexion(pymysql.err.ProgrammingError(1064, 'sintaxis'))
@@ -0,0 +1,59 @@
+#
+# Bloques transaction(): commit unico, savepoints y rollback
+#
+
+import pytest
+
+from falsos import ConexionFalsa
+from mysqlars import PyMySqlArs, TransaccionError
+
+
+def escrituras(conn):
+
+    return [s for s in conn.sentencias if not s.startswith('SELECT @@')]
+
+
+def test_un_unico_commit():
+
+    conn = ConexionFalsa()
+    ars = PyMySqlArs()
+
+    with ars.transaction(conn):
+        ars.insert({'#table': 't', 'a': 1})
+        ars.update({'#table': 't', 'a': 2, '#where': {'id': ['=', 1]}})
+
+    assert conn.commits == 1 and conn.rollbacks == 0
+    assert len(escrituras(conn)) == 2
+
+
+def test_fallo_deshace_y_lanza():
+
+    conn = ConexionFalsa()
+    conn.error = 'ars_error'
+    ars = PyMySqlArs()
+
+    with pytest.raises(TransaccionError):
+        with ars.transaction(conn):
+            ars.insert({'#table': 't', 'a': 1})
+            ars.insert({'#table': 'ars_error', 'a': 1})
+
+    assert conn.commits == 0 and conn.rollbacks == 1
+    assert ars.nivel_transaccion == 0
+
+
+def test_anidado_deshace_solo_su_savepoint():
+
+    conn = ConexionFalsa()
+    conn.error = 'ars_error'
+    ars = PyMySqlArs()
+
+    with ars.transaction(conn):
+        ars.insert({'#table': 't', 'a': 1})
+
+        with pytest.raises(TransaccionError):
+            with ars.transaction():
+                ars.insert({'#table': 'ars_error', 'a': 2})
+
+    assert escrituras(conn)[1:] == ['SAVEPOINT ars_sp_1', "INSERT IGNORE INTO ars_error(a) VALUES (2);",
+                                    'ROLLBACK TO SAVEPOINT ars_sp_1']
+    assert conn.commits == 1 and conn.rollbacks == 0